@@ -52,6 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RecordingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryCheckMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -92,9 +97,43 @@ DATABASES = {
         'NAME': os.environ.get('POSTGRES_DB_NAME'),
         'USER': os.environ.get('POSTGRES_DB_USER'),
         'PASSWORD': os.environ.get('POSTGRES_DB_PASS'),
+        # Seconds a connection is reused across requests, so the ones
+        # opened by core.warmup.prime_worker() are not closed by the
+        # first request. Every uwsgi thread keeps one per database:
+        # workers * UWSGI_THREADS * len(DATABASES) must stay below the
+        # max_connections of the server.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Extra databases holding user data as alias:name pairs on the same
+# server, e.g. DB_SHARDS=shard1:recipes_1,shard2:recipes_2
+for _shard in filter(None, os.environ.get('DB_SHARDS', '').split(',')):
+    _alias, _name = _shard.split(':')
+    DATABASES[_alias] = dict(DATABASES['default'], NAME=_name)
+
+# Databases new users are spread across, see core/shards.py.
+SHARDS = list(DATABASES)
+DATABASE_ROUTERS = ['core.shards.ShardRouter']
+
+
+AUTHENTICATION_BACKENDS = ['core.backends.PolicyModelBackend']
+
+# Password hashing, PBKDF2 iterations per policy. Stored hashes are
+# rehashed at the active policy on the next successful login.
+PASSWORD_HASH_POLICIES = {
+    'strong': 260000,
+    'balanced': 120000,
+    'fast': 40000,
+}
+PASSWORD_HASH_POLICY = os.environ.get('PASSWORD_HASH_POLICY', 'strong')
+
+PASSWORD_HASHERS = [
+    'core.hashers.PolicyPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,6 +177,18 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Media files are private. Views hand them to nginx through
+# X-Accel-Redirect to this internal location; empty streams them from
+# Django, as under runserver.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX', '' if DEBUG else '/protected/media/',
+)
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Hashed file names plus .gz/.br variants written by collectstatic.
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+STATIC_COMPRESSION_MIN_SIZE = 256
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -145,6 +196,122 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Directory holding the memory-mapped metrics files of the workers.
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/api-metrics')
+# Bearer token of the scraper of /api/metrics, which staff users can
+# also read. Unset leaves it to staff users only.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Duplicate query detection, off unless QUERY_CHECK=1.
+QUERY_CHECK_ENABLED = bool(int(os.environ.get('QUERY_CHECK', 0)))
+QUERY_CHECK_RAISE = bool(int(os.environ.get('QUERY_CHECK_RAISE', 0)))
+QUERY_CHECK_THRESHOLD = int(os.environ.get('QUERY_CHECK_THRESHOLD', 5))
+
+# Request shapes recorded for replay_load, one file per worker process.
+# Off unless a directory is set; SAMPLE is the recorded fraction.
+REQUEST_RECORDING_DIR = os.environ.get('REQUEST_RECORDING_DIR', '')
+REQUEST_RECORDING_SAMPLE = float(
+    os.environ.get('REQUEST_RECORDING_SAMPLE', 1)
+)
+
+# Threads serving requests in each uwsgi worker, see scripts/run.sh.
+UWSGI_THREADS = int(os.environ.get('UWSGI_THREADS', 16))
+
+# Admission control, limits are per worker process. Of the UWSGI_THREADS
+# requests a worker holds, LIMIT run and QUEUE_SIZE wait for a slot; the
+# sum must stay below UWSGI_THREADS, or the worker runs out of threads
+# before the queue is full and requests wait in the uwsgi listen queue
+# instead of being turned away.
+ADMISSION_LIMIT = int(os.environ.get('ADMISSION_LIMIT', UWSGI_THREADS // 2))
+ADMISSION_QUEUE_SIZE = int(
+    os.environ.get('ADMISSION_QUEUE_SIZE', UWSGI_THREADS // 4)
+)
+# Seconds a request may wait for a slot inside the worker.
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 1))
+# Seconds a request may have waited before reaching the worker.
+ADMISSION_MAX_QUEUE_TIME = float(
+    os.environ.get('ADMISSION_MAX_QUEUE_TIME', 5)
+)
+ADMISSION_RETRY_AFTER = 1
+# Lower limits for expensive routes, keyed by "View.action". Requests
+# also hold a default slot, so limit + queue must fit in ADMISSION_LIMIT.
+ADMISSION_ROUTE_LIMITS = {
+    'RecipeViewSet.upload_image': {'limit': 2, 'queue': 2, 'timeout': 0.5},
+    'RecipeViewSet.list': {'limit': 4, 'queue': 4},
+    'TagViewSet.list': {'limit': 4, 'queue': 4},
+    'IngredientViewSet.list': {'limit': 4, 'queue': 4},
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialized recipes, see recipe/fragments.py. Point it at a shared
+    # cache to share the fragments between workers.
+    'recipes': {
+        'BACKEND': os.environ.get(
+            'RECIPE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('RECIPE_CACHE_LOCATION', 'recipes'),
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RECIPE_CACHE_SIZE', 20000)),
+        },
+    },
+}
+RECIPE_FRAGMENT_CACHE = 'recipes'
+RECIPE_FRAGMENT_CACHE_ENABLED = bool(
+    int(os.environ.get('RECIPE_FRAGMENT_CACHE_ENABLED', 1))
+)
+
+# Most recipe ids accepted by /api/recipe/recipes/batch/
+RECIPE_BATCH_MAX = int(os.environ.get('RECIPE_BATCH_MAX', 100))
+
+# Number of per-user ingredient indexes kept by each worker.
+COOKABLE_INDEX_CACHE_SIZE = int(
+    os.environ.get('COOKABLE_INDEX_CACHE_SIZE', 64)
+)
+
+# Tag/ingredient names interned by each worker.
+NAME_INTERN_CACHE_SIZE = int(os.environ.get('NAME_INTERN_CACHE_SIZE', 100000))
+
+# Per-user tag/ingredient name caches kept by each worker.
+AUTOCOMPLETE_CACHE_SIZE = int(os.environ.get('AUTOCOMPLETE_CACHE_SIZE', 256))
+# Seconds before cached usage counts are refreshed.
+AUTOCOMPLETE_CACHE_MAX_AGE = 60
+# Larger vocabularies are searched in the database.
+AUTOCOMPLETE_MAX_CACHED = 50000
+
+# Compression of API responses (brotli when available, else gzip).
+API_COMPRESSION_ENABLED = bool(
+    int(os.environ.get('API_COMPRESSION_ENABLED', 1))
+)
+# Smaller bodies are sent uncompressed, in bytes.
+API_COMPRESSION_MIN_SIZE = int(
+    os.environ.get('API_COMPRESSION_MIN_SIZE', 1024)
+)
+# gzip level 1-9 and brotli quality 0-11, see manage.py bench_compression
+API_COMPRESSION_LEVEL = int(os.environ.get('API_COMPRESSION_LEVEL', 5))
+API_COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('API_COMPRESSION_BROTLI_QUALITY', 4)
+)
+
+# Admin changelists of larger tables show the Postgres row estimate.
+ADMIN_ESTIMATED_COUNT_MIN = int(
+    os.environ.get('ADMIN_ESTIMATED_COUNT_MIN', 100000)
+)
+
+# Preload the app in the uwsgi master and prime each worker, see
+# core/warmup.py and manage.py measure_startup.
+WSGI_WARMUP = bool(int(os.environ.get('WSGI_WARMUP', 1)))
+
+# Release identifier, the OpenAPI schema is regenerated when it changes.
+# Defaults to a digest of the source files.
+CODE_VERSION = os.environ.get('CODE_VERSION', '')
+# Schema files written by manage.py build_schema or the first request.
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR', '/tmp/api-schema')
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -0,0 +1,16 @@
+"""
+Settings with a default database and two shards, all local SQLite
+files, to run the sharding tests without a database server:
+
+    python manage.py test core.tests.test_shards --settings=app.settings_shards
+"""
+from app.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'{alias}.sqlite3',  # noqa: F405
+    }
+    for alias in ('default', 'shard1', 'shard2')
+}
+SHARDS = list(DATABASES)
@@ -9,8 +9,21 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+if settings.WSGI_WARMUP:
+    from core import warmup
+
+    warmup.preload()
+    try:
+        # Only importable when running under uwsgi.
+        from uwsgidecorators import postfork
+    except ImportError:
+        warmup.prime_worker()
+    else:
+        postfork(warmup.prime_worker)
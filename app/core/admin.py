@@ -1,12 +1,15 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from core import models
+from core.paginator import EstimatedCountPaginator
 
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['^email']
     fieldsets = (
         (
             None,
@@ -54,7 +57,53 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist without COUNT(*) queries over the whole table"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ['-id']
+
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ['title', 'user', 'time_min', 'price']
+    list_select_related = ['user']
+    search_fields = ['^title', '^user__email']
+    autocomplete_fields = ['user', 'tags', 'ingredients']
+
+
+class NamedAdminForm(forms.ModelForm):
+    """Edit the name of a tag or ingredient instead of its name_ref"""
+    name = forms.CharField(max_length=255)
+
+    class Meta:
+        fields = ['user']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['name'].initial = self.instance.name
+
+    def save(self, commit=True):
+        self.instance.name = self.cleaned_data['name']
+        return super().save(commit)
+
+
+class NamedAdmin(LargeTableAdmin):
+    """Admin of tags and ingredients, searched by name prefix"""
+    form = NamedAdminForm
+    list_display = ['display_name', 'user', 'recipe_count']
+    list_select_related = ['user', 'name_ref']
+    search_fields = ['^name_ref__value']
+    autocomplete_fields = ['user']
+    fields = ['user', 'name', 'recipe_count']
+    readonly_fields = ['recipe_count']
+
+    @admin.display(description=_('name'), ordering='name_ref__value')
+    def display_name(self, obj):
+        return obj.name
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, NamedAdmin)
+admin.site.register(models.Ingredient, NamedAdmin)
@@ -0,0 +1,76 @@
+"""
+Per-process admission control for API workers.
+
+Each limiter allows a fixed number of concurrent requests and keeps a
+bounded number of waiters. A waiter that cannot get a slot before its
+deadline is turned away instead of being served too late.
+"""
+import threading
+import time
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded wait queue."""
+
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, returns False when saturated or timed out."""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue_size:
+                return False
+
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name, limit, queue_size, timeout):
+    """Return the process-wide limiter for a name and configuration."""
+    key = (name, limit, queue_size, timeout)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdmissionLimiter(limit, queue_size, timeout)
+        return _limiters[key]
+
+
+def upstream_queue_time(request):
+    """
+    Seconds the request waited before reaching the worker, taken from
+    the X-Request-Start header set by nginx ("t=<epoch seconds>").
+    """
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    if not header.startswith('t='):
+        return 0.0
+    try:
+        started = float(header[2:])
+    except ValueError:
+        return 0.0
+    return max(0.0, time.time() - started)
@@ -0,0 +1,78 @@
+"""
+Prefix autocomplete over the tag and ingredient names of a user.
+
+Each worker keeps a per-user sorted array of case-folded names and
+answers prefixes with two bisections. Users with a vocabulary too large
+to cache are served by the prefix index of the Name dictionary instead.
+"""
+import bisect
+import heapq
+
+from django.conf import settings
+
+from core import generations
+
+# Sorts after any character a name can continue with.
+_PREFIX_END = '\U0010ffff'
+
+_cache = generations.GenerationCache(
+    settings.AUTOCOMPLETE_CACHE_SIZE,
+    max_age=settings.AUTOCOMPLETE_CACHE_MAX_AGE,
+)
+
+
+class NameIndex:
+    """Sorted array of (folded name, -recipe_count, id, name)."""
+
+    def __init__(self, rows):
+        self.entries = sorted(
+            (name.casefold(), -recipe_count, pk, name)
+            for pk, name, recipe_count in rows
+        )
+        self.keys = [entry[0] for entry in self.entries]
+
+    def search(self, prefix, limit):
+        """Top names starting with prefix, most used first."""
+        prefix = prefix.casefold()
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + _PREFIX_END, low)
+        top = heapq.nsmallest(
+            limit,
+            self.entries[low:high],
+            key=lambda entry: (entry[1], entry[0]),
+        )
+        return [{'id': entry[2], 'name': entry[3]} for entry in top]
+
+
+def generation_name(model):
+    return f'{model._meta.model_name}_names'
+
+
+def invalidate(model, user_id):
+    generations.bump(user_id, generation_name(model))
+
+
+def search(model, user_id, prefix, limit):
+    """Autocomplete prefix over the Tag or Ingredient names of a user."""
+    key = (model._meta.model_name, user_id)
+    generation = generations.get(user_id, generation_name(model))
+    index = _cache.get(key, generation)
+    if index is None:
+        queryset = model.objects.filter(user_id=user_id)
+        rows = list(queryset.values_list(
+            'id', 'name_ref__value', 'recipe_count',
+        )[:settings.AUTOCOMPLETE_MAX_CACHED + 1])
+        if len(rows) > settings.AUTOCOMPLETE_MAX_CACHED:
+            index = False  # Too large, use the database index.
+        else:
+            index = NameIndex(rows)
+        _cache.put(key, generation, index)
+
+    if index is not False:
+        return index.search(prefix, limit)
+    matches = model.objects.filter(
+        user_id=user_id, name__istartswith=prefix,
+    ).order_by('-recipe_count', 'name').values_list(
+        'id', 'name_ref__value',
+    )[:limit]
+    return [{'id': pk, 'name': name} for pk, name in matches]
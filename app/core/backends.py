@@ -0,0 +1,41 @@
+"""
+Authentication backends.
+"""
+import functools
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.utils.crypto import get_random_string
+
+
+@functools.lru_cache(maxsize=None)
+def _dummy_password(algorithm, iterations):
+    """Hash checked for unknown emails, built once per policy."""
+    return make_password(get_random_string(32), hasher=algorithm)
+
+
+class PolicyModelBackend(ModelBackend):
+    """
+    Model backend paying exactly one hash at the current policy cost
+    for unknown emails, like a real password check does.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            hasher = get_hasher()
+            hasher.verify(password, _dummy_password(
+                hasher.algorithm, getattr(hasher, 'iterations', None)
+            ))
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
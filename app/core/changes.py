@@ -0,0 +1,117 @@
+"""
+Per-user change sequence for delta sync.
+
+Writing a recipe, tag or ingredient replaces its Change row with one
+holding the next value of the user's change sequence, and whether the
+object was deleted. A client passes the largest sequence it has seen
+and only gets the rows after it, so a sync costs as much as the amount
+of change, not the size of the collection.
+
+Sequence values are handed out under a lock on the user's counter row,
+in the transaction writing the Change rows, so they become visible in
+increasing order and a client never skips past an uncommitted change.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import router, transaction
+
+from core.models import Change, UserGeneration
+
+RECIPE = 'recipe'
+TAG = 'tag'
+INGREDIENT = 'ingredient'
+
+# UserGeneration row holding the last sequence value of a user.
+SEQUENCE = 'changes'
+
+_local = threading.local()
+
+
+@contextmanager
+def collected():
+    """Record the changes made inside the block together at its end."""
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = {}
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        _write(pending)
+
+
+def _deleting_users():
+    if not hasattr(_local, 'deleting_users'):
+        _local.deleting_users = set()
+    return _local.deleting_users
+
+
+def user_deleting(user_id):
+    """Ignore the changes of a user while their data is being deleted."""
+    _deleting_users().add(user_id)
+
+
+def user_deleted(user_id):
+    _deleting_users().discard(user_id)
+
+
+@contextmanager
+def suspended(user_id):
+    """Record no change of a user inside the block."""
+    user_deleting(user_id)
+    try:
+        yield
+    finally:
+        user_deleted(user_id)
+
+
+def record(user_id, kind, object_ids, deleted=False):
+    if user_id in _deleting_users():
+        return
+    entries = {(user_id, kind, pk): deleted for pk in object_ids}
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        _write(entries)
+    else:
+        pending.update(entries)
+
+
+def _write(entries):
+    by_user = defaultdict(dict)
+    for (user_id, kind, pk), deleted in entries.items():
+        if user_id not in _deleting_users():
+            by_user[user_id][(kind, pk)] = deleted
+
+    for user_id, user_entries in by_user.items():
+        with transaction.atomic(using=router.db_for_write(Change)):
+            counter, _ = UserGeneration.objects.select_for_update(
+            ).get_or_create(user_id=user_id, name=SEQUENCE)
+            first = counter.value + 1
+            counter.value += len(user_entries)
+            counter.save(update_fields=['value'])
+
+            by_kind = defaultdict(list)
+            for kind, pk in user_entries:
+                by_kind[kind].append(pk)
+            for kind, pks in by_kind.items():
+                Change.objects.filter(
+                    user_id=user_id, kind=kind, object_id__in=pks,
+                ).delete()
+            Change.objects.bulk_create([
+                Change(
+                    user_id=user_id, kind=kind, object_id=pk,
+                    sequence=first + offset, deleted=deleted,
+                )
+                for offset, ((kind, pk), deleted)
+                in enumerate(user_entries.items())
+            ])
+
+
+def since(user_id, sequence, limit):
+    """Return up to limit changes after sequence, oldest first."""
+    return list(Change.objects.filter(
+        user_id=user_id, sequence__gt=sequence,
+    ).order_by('sequence')[:limit])
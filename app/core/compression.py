@@ -0,0 +1,53 @@
+"""
+gzip and brotli encoders shared by the static storage, the API
+compression middleware and its benchmark.
+
+brotli is optional: without the package only gzip is produced.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Content types worth compressing, matched on their prefix.
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/vnd.oai.openapi',
+    'application/xml',
+    'image/svg+xml',
+    'text/',
+)
+
+
+def gzip_compress(data, level):
+    # mtime=0 keeps the output identical for identical input.
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def brotli_compress(data, quality):
+    """Brotli encoding of data, None when brotli is not installed."""
+    if brotli is None:
+        return None
+    return brotli.compress(data, quality=quality)
+
+
+def is_compressible(content_type):
+    return content_type.split(';')[0].strip().startswith(COMPRESSIBLE_TYPES)
+
+
+def accepted_encodings(accept_encoding):
+    """Encodings listed in an Accept-Encoding header, without q=0 ones."""
+    encodings = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = params.strip().replace(' ', '')
+        if q in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        encodings.add(name)
+    return encodings
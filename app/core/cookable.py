@@ -0,0 +1,140 @@
+"""
+Per-user ingredient inverted index answering "what can I cook".
+
+Each user's recipes get a position; every ingredient maps to a bitset
+(a Python int) of the positions of the recipes using it. The coverage
+of every recipe is counted with bit-sliced additions of the postings of
+the ingredients on hand, so a query costs a few big-int operations per
+ingredient instead of a scan over Recipe.ingredients.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+
+from core import generations
+from core.models import Recipe
+
+GENERATION = 'ingredients'
+
+
+def _bitset(positions):
+    data = bytearray((max(positions) >> 3) + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _positions(bits):
+    """Set bit positions of bits, lowest first."""
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+class IngredientIndex:
+    """Inverted index of the recipes of one user."""
+
+    def __init__(self, recipe_ids, links):
+        # Lower positions are newer recipes.
+        self.recipe_ids = sorted(recipe_ids, reverse=True)
+        position_of = {
+            recipe_id: position
+            for position, recipe_id in enumerate(self.recipe_ids)
+        }
+        self.full = (1 << len(self.recipe_ids)) - 1
+
+        postings = defaultdict(list)
+        sizes = [0] * len(self.recipe_ids)
+        for recipe_id, ingredient_id in links:
+            position = position_of.get(recipe_id)
+            if position is None:
+                continue  # Recipe created while the index was built
+            postings[ingredient_id].append(position)
+            sizes[position] += 1
+        self.postings = {
+            ingredient_id: _bitset(positions)
+            for ingredient_id, positions in postings.items()
+        }
+
+        by_size = defaultdict(list)
+        for position, size in enumerate(sizes):
+            if size:
+                by_size[size].append(position)
+        self.size_masks = {
+            size: _bitset(positions) for size, positions in by_size.items()
+        }
+
+    def _equals(self, planes, value):
+        """Bitset of the recipes whose sliced count equals value."""
+        if value >> len(planes):
+            return 0
+        bits = self.full
+        for j, plane in enumerate(planes):
+            bits &= plane if (value >> j) & 1 else ~plane
+        return bits
+
+    def query(self, ingredient_ids, limit):
+        """
+        Return (recipe id, covered, total) ranked by covered fraction,
+        fully cookable recipes first.
+        """
+        postings = [
+            self.postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.postings
+        ]
+        # planes[j] holds bit j of the covered count of every recipe.
+        planes = []
+        for posting in postings:
+            carry = posting
+            for j in range(len(planes)):
+                planes[j], carry = planes[j] ^ carry, planes[j] & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+
+        levels = sorted(
+            (
+                (covered / size, size, covered)
+                for size in self.size_masks
+                for covered in range(1, min(size, len(postings)) + 1)
+            ),
+            reverse=True,
+        )
+        results = []
+        for _, size, covered in levels:
+            bits = self.size_masks[size] & self._equals(planes, covered)
+            for position in _positions(bits):
+                results.append((self.recipe_ids[position], covered, size))
+                if len(results) == limit:
+                    return results
+        return results
+
+
+_cache = generations.GenerationCache(settings.COOKABLE_INDEX_CACHE_SIZE)
+
+
+def build_index(user_id):
+    recipe_ids = Recipe.objects.filter(
+        user_id=user_id,
+    ).values_list('id', flat=True)
+    links = Recipe.ingredients.through.objects.filter(
+        recipe__user_id=user_id,
+    ).values_list('recipe_id', 'ingredient_id')
+    return IngredientIndex(list(recipe_ids), links.iterator())
+
+
+def get_index(user_id):
+    """Index of a user, rebuilt lazily when its generation moved on."""
+    generation = generations.get(user_id, GENERATION)
+    index = _cache.get(user_id, generation)
+    if index is None:
+        index = build_index(user_id)
+        _cache.put(user_id, generation, index)
+    return index
+
+
+def invalidate(user_id):
+    generations.bump(user_id, GENERATION)
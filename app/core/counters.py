@@ -0,0 +1,59 @@
+"""
+Denormalized recipe_count of tags and ingredients.
+
+Counters are moved with atomic F() updates as through rows come and go;
+recount() recomputes them from the through tables with one UPDATE.
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Ingredient, Recipe, Tag
+
+
+def _through(model):
+    """Through model and column referencing model."""
+    if model is Tag:
+        return Recipe.tags.through, 'tag_id'
+    return Recipe.ingredients.through, 'ingredient_id'
+
+
+def adjust(model, deltas):
+    """Apply {id: delta} with one UPDATE per distinct delta."""
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, ids in by_delta.items():
+        model.objects.filter(id__in=ids).update(
+            recipe_count=F('recipe_count') + delta
+        )
+
+
+def actual_count(model):
+    """Expression counting the recipes using each row of model."""
+    through, column = _through(model)
+    return Coalesce(Subquery(
+        through.objects.filter(**{column: OuterRef('pk')})
+        .values(column)
+        .annotate(count=Count('id'))
+        .values('count')
+    ), 0)
+
+
+def recount(queryset):
+    """Recompute recipe_count for the rows of a Tag/Ingredient queryset."""
+    return queryset.update(recipe_count=actual_count(queryset.model))
+
+
+def recount_user(user_id):
+    for model in (Tag, Ingredient):
+        recount(model.objects.filter(user_id=user_id))
+
+
+def drifted_ids(queryset):
+    """Ids of rows whose stored recipe_count is wrong."""
+    return list(
+        queryset.annotate(actual=actual_count(queryset.model))
+        .filter(~Q(recipe_count=F('actual')))
+        .values_list('id', flat=True)
+    )
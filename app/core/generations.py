@@ -0,0 +1,61 @@
+"""
+Per-user generations used to invalidate process-local caches.
+
+A cache entry remembers the generation it was built at and is rebuilt
+once the stored generation moved on, whichever worker bumped it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.db.models import F
+
+from core.models import UserGeneration
+
+
+def get(user_id, name):
+    """
+    Current generation, creating its row so that later bumps are seen.
+    Bumps never create rows, which keeps them safe while a user and
+    their data are being deleted.
+    """
+    generation, _ = UserGeneration.objects.get_or_create(
+        user_id=user_id, name=name,
+        # A recreated row must not match entries cached for the old one.
+        defaults={'value': time.time_ns()},
+    )
+    return generation.value
+
+
+def bump(user_id, name):
+    UserGeneration.objects.filter(
+        user_id=user_id, name=name,
+    ).update(value=F('value') + 1)
+
+
+class GenerationCache:
+    """Bounded LRU cache of values tagged with the generation they reflect."""
+
+    def __init__(self, max_size, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            if self.max_age is not None \
+                    and time.monotonic() - entry[1] > self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, generation, value):
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,19 @@
+"""
+Password hashers with a configurable cost.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class PolicyPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher using the iterations of PASSWORD_HASH_POLICY.
+
+    Django rehashes a password on successful login whenever its stored
+    iterations differ, so changing the policy upgrades or downgrades
+    hashes transparently.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_POLICIES[settings.PASSWORD_HASH_POLICY]
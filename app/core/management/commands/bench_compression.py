@@ -0,0 +1,90 @@
+"""
+Django command to benchmark the cost of compressing API responses
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core import compression
+
+
+def sample_payload(recipes):
+    """JSON of a recipe list shaped like the API output."""
+    data = [
+        {
+            'id': pk,
+            'title': f'Sample recipe {pk}',
+            'time_min': 5 + pk % 90,
+            'price': str(Decimal(pk % 4000) / 100),
+            'link': f'https://example.com/recipes/{pk}',
+            'tags': [
+                {'id': tag_id, 'name': f'Tag {tag_id}'}
+                for tag_id in range(pk % 7, pk % 7 + 3)
+            ],
+            'ingredients': [
+                {'id': ingredient_id, 'name': f'Ingredient {ingredient_id}'}
+                for ingredient_id in range(pk % 50, pk % 50 + 6)
+            ],
+        }
+        for pk in range(1, recipes + 1)
+    ]
+    return JSONRenderer().render(data)
+
+
+class Command(BaseCommand):
+    """Measure compression ratio and CPU time per response"""
+    help = 'Measure size and time of gzip/brotli for an API-like payload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100,
+            help='Number of recipes in the sample response.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Compressions timed per level.',
+        )
+
+    def _measure(self, compress, data, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            compressed = compress(data)
+        elapsed = (time.perf_counter() - start) / repeat
+        return len(compressed), elapsed
+
+    def handle(self, *args, **options):
+        data = sample_payload(options['recipes'])
+        repeat = options['repeat']
+
+        encoders = [
+            ('gzip', level, settings.API_COMPRESSION_LEVEL,
+             lambda d, level=level: compression.gzip_compress(d, level))
+            for level in range(1, 10)
+        ]
+        if compression.brotli is not None:
+            encoders += [
+                ('br', quality, settings.API_COMPRESSION_BROTLI_QUALITY,
+                 lambda d, quality=quality:
+                 compression.brotli_compress(d, quality))
+                for quality in range(0, 12)
+            ]
+        else:
+            self.stdout.write('brotli is not installed, gzip only.')
+
+        self.stdout.write(f'Uncompressed: {len(data)} bytes')
+        self.stdout.write(
+            f'{"encoding":<9} {"level":>5} {"bytes":>9} {"ratio":>6} '
+            f'{"ms":>8} {"MB/s":>8}'
+        )
+        for name, level, configured, compress in encoders:
+            size, elapsed = self._measure(compress, data, repeat)
+            marker = ' *' if level == configured else ''
+            self.stdout.write(
+                f'{name:<9} {level:>5} {size:>9} '
+                f'{len(data) / size:>6.1f} {elapsed * 1000:>8.2f} '
+                f'{len(data) / elapsed / 1e6:>8.1f}{marker}'
+            )
+        self.stdout.write('* configured level')
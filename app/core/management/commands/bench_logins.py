@@ -0,0 +1,64 @@
+"""
+Django command to benchmark logins per second under each hashing policy
+"""
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from user.serializers import AuthTokenSerializer
+
+EMAIL = 'bench-login@example.com'
+PASSWORD = 'bench-pass1234'
+
+
+class Command(BaseCommand):
+    """Measure the login rate of a single worker process"""
+    help = 'Measure logins per second per worker under each hash policy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--logins', type=int, default=20,
+            help='Number of logins to time per policy.',
+        )
+        parser.add_argument(
+            '--policy', action='append', dest='policies',
+            choices=sorted(settings.PASSWORD_HASH_POLICIES),
+            help='Policy to measure, can be repeated (default: all).',
+        )
+
+    def _rate(self, email, logins):
+        start = time.perf_counter()
+        for _ in range(logins):
+            serializer = AuthTokenSerializer(
+                data={'email': email, 'password': PASSWORD}
+            )
+            serializer.is_valid()
+        return logins / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        policies = options['policies'] or list(settings.PASSWORD_HASH_POLICIES)
+        logins = options['logins']
+
+        self.stdout.write(
+            f'{"policy":<10} {"iterations":>10} {"logins/s":>10} '
+            f'{"unknown/s":>10}'
+        )
+        for policy in policies:
+            with override_settings(PASSWORD_HASH_POLICY=policy), \
+                    transaction.atomic():
+                # Hash at the measured policy, not the active one.
+                get_user_model().objects.create_user(EMAIL, PASSWORD)
+                # Builds the per-policy dummy hash outside the timing.
+                self._rate(f'unknown-{EMAIL}', 1)
+                known = self._rate(EMAIL, logins)
+                unknown = self._rate(f'unknown-{EMAIL}', logins)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{policy:<10} '
+                f'{settings.PASSWORD_HASH_POLICIES[policy]:>10} '
+                f'{known:>10.1f} {unknown:>10.1f}'
+            )
@@ -0,0 +1,17 @@
+"""
+Django command to precompute the OpenAPI schema
+"""
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    """Write the schema of the current code version to SCHEMA_CACHE_DIR"""
+    help = 'Generate the OpenAPI schema served by /api/schema/.'
+
+    def handle(self, *args, **options):
+        paths = schema.build()
+        self.stdout.write(f'Code version {schema.code_version()}')
+        for path in paths:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
@@ -0,0 +1,119 @@
+"""
+Django command to measure worker startup and first request latency
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter, like a newly started worker.
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from django.conf import settings
+from app.wsgi import application
+loaded = time.perf_counter()
+warm = sys.argv[1] == '1'
+if warm:
+    from core import warmup
+    warmup.preload()
+    warmup.prime_worker()
+primed = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+host = (settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.')
+if host == '*':
+    host = 'localhost'
+settings.ALLOWED_HOSTS.append(host)
+
+def request(path):
+    environ = {'PATH_INFO': path, 'HTTP_HOST': host}
+    if sys.argv[2]:
+        environ['HTTP_AUTHORIZATION'] = 'Token ' + sys.argv[2]
+    setup_testing_defaults(environ)
+    begin = time.perf_counter()
+    response = application(environ, lambda status, headers: None)
+    b''.join(response)
+    response.close()
+    return time.perf_counter() - begin
+
+paths = sys.argv[3:]
+result = {
+    'load': loaded - start,
+    'warmup': primed - loaded,
+    'first': sum(request(path) for path in paths),
+    'second': sum(request(path) for path in paths),
+}
+print(json.dumps(result))
+'''
+
+
+class Command(BaseCommand):
+    """Compare fresh worker processes with and without warmup"""
+    help = 'Measure app load time and first request latency of new workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Fresh processes started per mode.',
+        )
+        parser.add_argument(
+            '--token', default='',
+            help='API token sent with the requests.',
+        )
+        parser.add_argument(
+            'paths', nargs='*',
+            default=['/api/recipe/recipes/', '/api/recipe/tags/'],
+            help='Paths requested in order by each process.',
+        )
+
+    def run_child(self, warm, token, paths):
+        """Timings of one fresh process, in seconds."""
+        env = dict(os.environ, WSGI_WARMUP='0')
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, '1' if warm else '0', token,
+             *paths],
+            cwd=str(settings.BASE_DIR), env=env,
+            check=True, capture_output=True, text=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        paths = options['paths']
+        self.stdout.write(
+            f'{options["runs"]} runs per mode, requests: {" ".join(paths)}'
+        )
+        self.stdout.write(
+            f'{"mode":<6} {"load ms":>9} {"warmup ms":>10} '
+            f'{"first ms":>9} {"second ms":>10}'
+        )
+        first = {}
+        for warm in (False, True):
+            runs = [
+                self.run_child(warm, options['token'], paths)
+                for _ in range(options['runs'])
+            ]
+            median = {
+                key: statistics.median(run[key] for run in runs) * 1000
+                for key in runs[0]
+            }
+            mode = 'warm' if warm else 'cold'
+            first[mode] = median['first']
+            self.stdout.write(
+                f'{mode:<6} {median["load"]:>9.1f} '
+                f'{median["warmup"]:>10.1f} {median["first"]:>9.1f} '
+                f'{median["second"]:>10.1f}'
+            )
+        self.stdout.write(
+            'Warmup runs once in the uwsgi master. Each worker connects '
+            'one thread before it takes requests, its other threads '
+            'connect on their first request.'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'First request: {first["cold"]:.1f} ms cold, '
+            f'{first["warm"]:.1f} ms warm'
+        ))
@@ -0,0 +1,23 @@
+"""
+Django command to apply the migrations to every shard
+"""
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core import shards
+
+
+class Command(BaseCommand):
+    """Run migrate on the databases of SHARDS but the default one"""
+    help = 'Apply the migrations to every shard database.'
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            if alias == shards.DEFAULT:
+                continue
+            self.stdout.write(f'Migrating shard "{alias}"...')
+            call_command(
+                'migrate', database=alias, interactive=False,
+                verbosity=options['verbosity'],
+            )
@@ -0,0 +1,229 @@
+"""
+Django command to move the data of a user to another shard
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import changes, names, shards, signals
+from core.models import (
+    Change, Ingredient, Recipe, RecipeStats, Tag, UserGeneration,
+)
+
+# Change kind -> model, related objects before the recipes linking them.
+MODELS = {
+    changes.TAG: Tag,
+    changes.INGREDIENT: Ingredient,
+    changes.RECIPE: Recipe,
+}
+
+# Through model -> (column, Change kind of the column)
+LINKS = {
+    Recipe.tags.through: ('tag_id', changes.TAG),
+    Recipe.ingredients.through: ('ingredient_id', changes.INGREDIENT),
+}
+
+BATCH_SIZE = 500
+
+
+def _batches(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+class Command(BaseCommand):
+    """Copy, catch up and switch the shard of a user"""
+    help = (
+        'Move a user to another shard: copy the data while the user keeps '
+        'working, replay the changes made meanwhile, then block writes '
+        'for a short final pass and switch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to move.')
+        parser.add_argument('shard', help='Alias of the target database.')
+        parser.add_argument(
+            '--threshold', type=int, default=100,
+            help='Switch once a catch-up pass copies fewer objects.',
+        )
+        parser.add_argument(
+            '--max-passes', type=int, default=10,
+            help='Catch-up passes before switching anyway.',
+        )
+        parser.add_argument(
+            '--drain', type=float, default=2.0,
+            help='Seconds writes in flight get to finish once blocked.',
+        )
+
+    def _copy(self, model, ids, source, target):
+        """Replace the rows of ids on target by the ones of source."""
+        model._base_manager.using(target).filter(id__in=ids).delete()
+        rows = list(model._base_manager.using(source).filter(id__in=ids))
+        if model is not Recipe:
+            # Name ids are local to each shard.
+            values = {
+                row.name_ref_id: names.value_of(row.name_ref_id, source)
+                for row in rows
+            }
+            interned = names.intern_many(set(values.values()), target)
+            for row in rows:
+                row.name_ref_id = interned[values[row.name_ref_id]]
+        model._base_manager.using(target).bulk_create(rows)
+
+    def _copy_links(self, kind, ids, source, target):
+        """Copy the through rows of ids whose both ends are on target."""
+        for through, (column, related_kind) in LINKS.items():
+            if kind == changes.RECIPE:
+                lookup = {'recipe_id__in': ids}
+            elif kind == related_kind:
+                lookup = {f'{column}__in': ids}
+            else:
+                continue
+            links = list(through.objects.using(source).filter(
+                **lookup
+            ).values_list('recipe_id', column))
+            if not links:
+                continue
+            recipes = set(Recipe._base_manager.using(target).filter(
+                id__in={recipe_id for recipe_id, _ in links},
+            ).values_list('id', flat=True))
+            related = set(MODELS[related_kind]._base_manager.using(
+                target
+            ).filter(
+                id__in={related_id for _, related_id in links},
+            ).values_list('id', flat=True))
+            through.objects.using(target).bulk_create([
+                through(recipe_id=recipe_id, **{column: related_id})
+                for recipe_id, related_id in links
+                if recipe_id in recipes and related_id in related
+            ], ignore_conflicts=True)
+
+    def _copy_changes(self, user_id, kind, ids, source, target):
+        history = Change.objects.using(source).filter(
+            user_id=user_id, kind=kind, object_id__in=ids,
+        ).values_list('object_id', 'sequence', 'deleted')
+        Change.objects.using(target).filter(
+            user_id=user_id, kind=kind, object_id__in=ids,
+        ).delete()
+        Change.objects.using(target).bulk_create([
+            Change(
+                user_id=user_id, kind=kind, object_id=object_id,
+                sequence=sequence, deleted=deleted,
+            )
+            for object_id, sequence, deleted in history
+        ])
+
+    def _sync(self, user_id, ids_by_kind, source, target):
+        """Bring the objects of ids_by_kind and their changes to target."""
+        with shards.using(target), changes.suspended(user_id), \
+                signals.deferred(user_id):
+            for kind, model in MODELS.items():
+                for ids in _batches(ids_by_kind.get(kind, ())):
+                    with transaction.atomic(using=target):
+                        self._copy(model, ids, source, target)
+                        self._copy_links(kind, ids, source, target)
+                        self._copy_changes(
+                            user_id, kind, ids, source, target,
+                        )
+
+    def _sequence(self, user_id, alias):
+        return UserGeneration.objects.using(alias).filter(
+            user_id=user_id, name=changes.SEQUENCE,
+        ).values_list('value', flat=True).first() or 0
+
+    def _catch_up(self, user_id, sequence, source, target):
+        """Copy the objects changed after sequence, return (count, seq)."""
+        ids_by_kind = defaultdict(set)
+        rows = Change.objects.using(source).filter(
+            user_id=user_id, sequence__gt=sequence,
+        ).values_list('kind', 'object_id', 'sequence')
+        count = 0
+        for kind, object_id, change_sequence in rows.iterator():
+            ids_by_kind[kind].add(object_id)
+            sequence = max(sequence, change_sequence)
+            count += 1
+        self._sync(user_id, ids_by_kind, source, target)
+        return count, sequence
+
+    def _full_copy(self, user_id, source, target):
+        ids_by_kind = {
+            kind: set(model._base_manager.using(source).filter(
+                user_id=user_id,
+            ).values_list('id', flat=True))
+            for kind, model in MODELS.items()
+        }
+        # Tombstones of deleted objects are part of the sync history.
+        for kind, object_id in Change.objects.using(source).filter(
+            user_id=user_id, deleted=True,
+        ).values_list('kind', 'object_id'):
+            ids_by_kind[kind].add(object_id)
+        self._sync(user_id, ids_by_kind, source, target)
+        return sum(len(ids) for ids in ids_by_kind.values())
+
+    def _delete_source(self, user_id, source):
+        with shards.using(source), changes.suspended(user_id):
+            with signals.deferred(user_id):
+                for model in reversed(list(MODELS.values())):
+                    model._base_manager.using(source).filter(
+                        user_id=user_id,
+                    ).delete()
+            for model in (Change, UserGeneration, RecipeStats):
+                model.objects.using(source).filter(user_id=user_id).delete()
+            if source != shards.DEFAULT:
+                get_user_model()._base_manager.using(source).filter(
+                    pk=user_id,
+                ).delete()
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        target = options['shard']
+        if target not in settings.SHARDS:
+            raise CommandError(f'Unknown shard "{target}".')
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user "{options["email"]}".')
+        source = user.shard
+        if source == target:
+            raise CommandError(f'The user is already on "{target}".')
+        if user.shard_locked:
+            raise CommandError('The user is being moved already.')
+        users = User.objects.filter(pk=user.pk)
+
+        shards.mirror_users([user], target)
+        sequence = self._sequence(user.pk, source)
+        copied = self._full_copy(user.pk, source, target)
+        self.stdout.write(f'Copied {copied} objects.')
+
+        for _ in range(options['max_passes']):
+            count, sequence = self._catch_up(
+                user.pk, sequence, source, target,
+            )
+            self.stdout.write(f'Caught up {count} changes.')
+            if count < options['threshold']:
+                break
+
+        users.update(shard_locked=True)
+        try:
+            time.sleep(options['drain'])
+            count, sequence = self._catch_up(
+                user.pk, sequence, source, target,
+            )
+            self.stdout.write(f'Caught up {count} changes while blocked.')
+            UserGeneration.objects.using(target).update_or_create(
+                user_id=user.pk, name=changes.SEQUENCE,
+                defaults={'value': self._sequence(user.pk, source)},
+            )
+            users.update(shard=target)
+        finally:
+            users.update(shard_locked=False)
+
+        self._delete_source(user.pk, source)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {user.email} from "{source}" to "{target}".'
+        ))
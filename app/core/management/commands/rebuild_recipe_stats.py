@@ -0,0 +1,33 @@
+"""
+Django command to rebuild the per-user recipe statistics
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import shards, stats
+
+
+class Command(BaseCommand):
+    """Recompute RecipeStats rows from the recipes"""
+    help = 'Rebuild the recipe statistics summary table from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Id of a user to rebuild, can be repeated (default: all).',
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        count = 0
+        for user_id, shard in users.values_list('id', 'shard').iterator():
+            with shards.using(shard):
+                stats.rebuild(user_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt recipe statistics of {count} users.'
+        ))
@@ -0,0 +1,33 @@
+"""
+Django command to rebuild the recipe similarity index
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import shards, similarity
+
+
+class Command(BaseCommand):
+    """Recompute MinHash signatures and LSH buckets of recipes"""
+    help = 'Rebuild the similar recipes index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Id of a user to rebuild, can be repeated (default: all).',
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        count = 0
+        for user_id, shard in users.values_list('id', 'shard').iterator():
+            with shards.using(shard):
+                similarity.rebuild(user_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt similar recipes index of {count} users.'
+        ))
@@ -0,0 +1,49 @@
+"""
+Django command to detect and repair drifted recipe counters
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import counters, shards
+from core.models import Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """Compare recipe_count of tags and ingredients with the recipes"""
+    help = 'Detect and repair drift of Tag/Ingredient recipe_count.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drifted rows.',
+        )
+
+    def handle(self, *args, **options):
+        for alias in settings.SHARDS:
+            with shards.using(alias):
+                self._reconcile(options)
+
+    def _reconcile(self, options):
+        batch_size = options['batch_size']
+        for model in (Tag, Ingredient):
+            drifted = 0
+            last_id = 0
+            while True:
+                ids = list(model.objects.filter(
+                    id__gt=last_id
+                ).order_by('id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                batch = model.objects.filter(id__in=ids)
+                wrong = counters.drifted_ids(batch)
+                drifted += len(wrong)
+                if wrong and not options['dry_run']:
+                    counters.recount(model.objects.filter(id__in=wrong))
+
+            action = 'found' if options['dry_run'] else 'repaired'
+            self.stdout.write(
+                f'{model.__name__}: {drifted} drifted counters {action}.'
+            )
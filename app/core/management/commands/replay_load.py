@@ -0,0 +1,405 @@
+"""
+Django command to replay recorded request shapes against a server
+"""
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from core import recording
+
+# Path prefix -> kind of the ids in the path
+KINDS = {
+    '/api/recipe/recipes/': 'recipe',
+    '/api/recipe/tags/': 'tag',
+    '/api/recipe/ingredients/': 'ingredient',
+}
+# Kind -> list endpoint the replay user's ids are read from
+POOL_URLS = {
+    'recipe': '/api/recipe/recipes/?limit=100',
+    'tag': '/api/recipe/tags/',
+    'ingredient': '/api/recipe/ingredients/',
+}
+# Query parameter or body field -> kind of the ids it holds
+ID_FIELDS = {
+    'tags': 'tag',
+    'ingredients': 'ingredient',
+    'ids': 'recipe',
+    'add_tags': 'tag',
+    'remove_tags': 'tag',
+    'add_ingredients': 'ingredient',
+    'remove_ingredients': 'ingredient',
+}
+# Body fields sent with a fixed value
+FIELD_VALUES = {
+    'title': 'Replayed recipe',
+    'time_min': 10,
+    'price': '5.00',
+    'link': 'https://example.com/replayed',
+    'description': 'Replayed.',
+    'name': 'Replayed',
+    'count': 1,
+    'fields': {'time_min': 10},
+}
+
+# Routes deleting the recipes whose ids are in the body
+BULK_DELETE_ROUTES = {'RecipeViewSet.bulk_delete'}
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(results, elapsed):
+    """
+    Per route statistics of (route, status, latency) results, status 0
+    standing for a connection error.
+    """
+    by_route = defaultdict(list)
+    for route, status, latency in results:
+        by_route[route].append((status, latency))
+    summary = {}
+    for route, samples in sorted(by_route.items()):
+        latencies = sorted(latency for _, latency in samples)
+        summary[route] = {
+            'requests': len(samples),
+            'rps': len(samples) / elapsed if elapsed else 0.0,
+            'latency': {
+                pct: percentile(latencies, pct) for pct in PERCENTILES
+            },
+            'max': latencies[-1],
+            'client_errors': sum(
+                1 for status, _ in samples if 400 <= status < 500
+            ),
+            'errors': sum(
+                1 for status, _ in samples if status == 0 or status >= 500
+            ),
+        }
+    return summary
+
+
+def _kind(path):
+    for prefix, kind in KINDS.items():
+        if path.startswith(prefix):
+            return kind
+    return None
+
+
+def _page_key(entry):
+    """Requests of one paging sequence, the same shape but the cursor."""
+    query = entry.get('query', {})
+    return entry['path'], tuple(sorted(
+        (name, str(value)) for name, value in query.items()
+        if name not in recording.FLAG_PARAMS
+    ))
+
+
+class Replay:
+    """State of a replay: the target, the id pools and the results."""
+
+    def __init__(self, url, token, timeout):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError('Only http://host[:port] URLs are supported.')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.token = token
+        self.timeout = timeout
+        self.pools = {kind: [] for kind in POOL_URLS}
+        self.created = defaultdict(list)
+        # Page key -> target of the next page of the last list served
+        self.next_pages = {}
+        self.names = []
+        self.images = {}
+        self.results = []
+
+    async def request(self, method, target, body=b'', content_type=None):
+        """Send one HTTP/1.0 request, return (status, body)."""
+        headers = [
+            f'{method} {target} HTTP/1.0',
+            f'Host: {self.host}:{self.port}',
+            f'Content-Length: {len(body)}',
+        ]
+        if self.token:
+            headers.append(f'Authorization: Token {self.token}')
+        if content_type:
+            headers.append(f'Content-Type: {content_type}')
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+            await writer.drain()
+            data = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = data.partition(b'\r\n\r\n')
+        return int(head.split(b' ', 2)[1]), content
+
+    async def load_pools(self):
+        """Ids and names owned by the replay user."""
+        for kind, target in POOL_URLS.items():
+            status, content = await self.request('GET', target)
+            if status != 200:
+                raise CommandError(f'GET {target} answered {status}.')
+            data = json.loads(content)
+            rows = data['results'] if isinstance(data, dict) else data
+            self.pools[kind] = [row['id'] for row in rows]
+            self.names.extend(row['name'] for row in rows if 'name' in row)
+
+    def _ids(self, kind, count):
+        pool = self.pools[kind]
+        return random.sample(pool, min(count, len(pool)))
+
+    def _discard(self, kind, ids):
+        """Take deleted ids out of the pool, later requests would 404."""
+        pool = self.pools[kind]
+        for pk in ids:
+            if pk in pool:
+                pool.remove(pk)
+
+    def _text(self, length):
+        names = [name for name in self.names if len(name) >= length]
+        return random.choice(names)[:length] if names else 'a' * length
+
+    def _path(self, entry):
+        if '{id}' not in entry['path']:
+            return entry['path']
+        kind = _kind(entry['path'])
+        if entry['method'] == 'DELETE' and self.created[kind]:
+            pk = self.created[kind].pop()
+        else:
+            pk = random.choice(self.pools[kind] or [0])
+            if entry['method'] == 'DELETE':
+                self._discard(kind, [pk])
+        return entry['path'].replace('{id}', str(pk), 1)
+
+    def _query(self, query):
+        params = {}
+        for name, value in query.items():
+            if name in recording.FLAG_PARAMS:
+                continue
+            if name in ID_FIELDS:
+                params[name] = ','.join(
+                    map(str, self._ids(ID_FIELDS[name], value))
+                )
+            elif name in recording.TEXT_PARAMS:
+                params[name] = self._text(value)
+            else:
+                params[name] = value
+        return urlencode(params)
+
+    def _json(self, entry, fields):
+        payload = {}
+        for name, count in (fields or {}).items():
+            if name in ('tags', 'ingredients'):
+                payload[name] = [
+                    {'name': f'Replayed {i}'} for i in range(count or 0)
+                ]
+            elif name in ID_FIELDS:
+                payload[name] = self._ids(ID_FIELDS[name], count or 0)
+            elif name in FIELD_VALUES:
+                payload[name] = FIELD_VALUES[name]
+        if entry['route'] in BULK_DELETE_ROUTES:
+            self._discard('recipe', payload.get('ids', ()))
+        return json.dumps(payload).encode()
+
+    def _image(self, size):
+        """PNG of noise, about size bytes since noise does not compress."""
+        side = max(8, int(math.sqrt(size / 3)) // 64 * 64)
+        if side not in self.images:
+            image = Image.frombytes(
+                'RGB', (side, side), os.urandom(side * side * 3),
+            )
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+            self.images[side] = buffer.getvalue()
+        return self.images[side]
+
+    def _multipart(self, size):
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="image"; '
+            'filename="replayed.png"\r\n'
+            'Content-Type: image/png\r\n\r\n'
+        ).encode() + self._image(size) + f'\r\n--{boundary}--\r\n'.encode()
+        return body, f'multipart/form-data; boundary={boundary}'
+
+    def build(self, entry):
+        """(method, target, body, content type) replaying entry."""
+        if entry.get('query', {}).get('cursor'):
+            # Continues the paging of an earlier request of the same
+            # shape, or starts it over when there is none.
+            target = self.next_pages.pop(_page_key(entry), None)
+            if target:
+                return entry['method'], target, b'', None
+        target = self._path(entry)
+        query = self._query(entry.get('query', {}))
+        if query:
+            target = f'{target}?{query}'
+        body, content_type = b'', None
+        recorded = entry.get('body')
+        if recorded:
+            content_type = recorded['content_type']
+            if content_type == 'multipart/form-data':
+                body, content_type = self._multipart(recorded['size'])
+            else:
+                body = self._json(entry, recorded.get('fields'))
+        return entry['method'], target, body, content_type
+
+    def _follow(self, entry, content):
+        """Keep the next page link of a paginated response."""
+        try:
+            link = json.loads(content)['next']
+        except (ValueError, KeyError, TypeError):
+            return
+        key = _page_key(entry)
+        if link:
+            parts = urlsplit(link)
+            self.next_pages[key] = f'{parts.path}?{parts.query}'
+        else:
+            self.next_pages.pop(key, None)
+
+    async def run(self, entry, semaphore):
+        try:
+            method, target, body, content_type = self.build(entry)
+            start = time.perf_counter()
+            try:
+                status, content = await asyncio.wait_for(
+                    self.request(method, target, body, content_type),
+                    self.timeout,
+                )
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status, content = 0, b''
+            latency = time.perf_counter() - start
+            self.results.append((entry['route'], status, latency))
+            kind = _kind(entry['path'])
+            if status == 201 and kind and '{id}' not in entry['path']:
+                try:
+                    self.created[kind].append(json.loads(content)['id'])
+                except (ValueError, KeyError, TypeError):
+                    pass
+            elif status == 200 and method == 'GET' and b'"next"' in content:
+                self._follow(entry, content)
+        finally:
+            semaphore.release()
+
+    async def replay(self, entries, speed, concurrency):
+        """Send entries at speed times their recorded pace, return lag."""
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        start = loop.time()
+        origin = entries[0]['t']
+        lag = 0.0
+        tasks = []
+        for entry in entries:
+            due = start + (entry['t'] - origin) / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await semaphore.acquire()
+            lag = max(lag, loop.time() - due)
+            tasks.append(loop.create_task(self.run(entry, semaphore)))
+        await asyncio.gather(*tasks)
+        return lag
+
+
+class Command(BaseCommand):
+    """Replay recorded traffic at a multiple of its original rate"""
+    help = (
+        'Replay request shapes recorded by the RecordingMiddleware against '
+        'a running server and report throughput, latency and errors per '
+        'route.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Recording files or REQUEST_RECORDING_DIR directories.',
+        )
+        parser.add_argument(
+            '--url', default='http://localhost:8000',
+            help='Server to replay against.',
+        )
+        parser.add_argument(
+            '--token', default=os.environ.get('REPLAY_TOKEN', ''),
+            help='API token of the user replaying the requests.',
+        )
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Multiple of the recorded request rate.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Requests in flight at most.',
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help='Replay only the first requests of the recording.',
+        )
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0 or options['concurrency'] < 1:
+            raise CommandError('--speed and --concurrency must be positive.')
+        entries = recording.load(options['paths'])[:options['limit']]
+        if not entries:
+            raise CommandError('The recording is empty.')
+
+        replay = Replay(options['url'], options['token'], options['timeout'])
+
+        async def main():
+            await replay.load_pools()
+            begin = time.perf_counter()
+            lag = await replay.replay(
+                entries, options['speed'], options['concurrency'],
+            )
+            return lag, time.perf_counter() - begin
+
+        lag, elapsed = asyncio.run(main())
+        self._report(summarize(replay.results, elapsed), elapsed, lag)
+
+    def _report(self, summary, elapsed, lag):
+        self.stdout.write(
+            f'{"route":<36} {"reqs":>6} {"req/s":>7} {"p50 ms":>8} '
+            f'{"p90 ms":>8} {"p99 ms":>8} {"max ms":>8} {"4xx":>5} '
+            f'{"err %":>6}'
+        )
+        total = errors = 0
+        for route, stats in summary.items():
+            total += stats['requests']
+            errors += stats['errors']
+            p50, p90, p99 = (
+                stats['latency'][pct] * 1000 for pct in PERCENTILES
+            )
+            self.stdout.write(
+                f'{route:<36} {stats["requests"]:>6} {stats["rps"]:>7.1f} '
+                f'{p50:>8.1f} {p90:>8.1f} {p99:>8.1f} '
+                f'{stats["max"] * 1000:>8.1f} '
+                f'{stats["client_errors"]:>5} '
+                f'{stats["errors"] / stats["requests"] * 100:>6.1f}'
+            )
+        self.stdout.write(
+            f'{total} requests in {elapsed:.1f}s, '
+            f'{total / elapsed if elapsed else 0:.1f} req/s, '
+            f'{errors} errors (5xx or no response).'
+        )
+        if lag > 1:
+            self.stdout.write(self.style.WARNING(
+                f'Fell behind the recorded pace by up to {lag:.1f}s, the '
+                'server or --concurrency is the bottleneck.'
+            ))
@@ -0,0 +1,34 @@
+"""
+Delivery of private media files.
+
+Views check that the user may see a file, then answer with an
+X-Accel-Redirect to the internal nginx location at
+MEDIA_ACCEL_REDIRECT_PREFIX. nginx sends the file itself with sendfile,
+so the bytes never pass through a uwsgi worker. Without a prefix, e.g.
+under runserver, Django streams the file.
+"""
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control
+
+
+def serve(field_file):
+    """Response sending the file of a FileField to the client."""
+    prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        # nginx keeps the Content-Type and Cache-Control set here.
+        content_type, _ = mimetypes.guess_type(field_file.name)
+        response = HttpResponse(
+            content_type=content_type or 'application/octet-stream',
+        )
+        response['X-Accel-Redirect'] = prefix + quote(field_file.name)
+    else:
+        response = FileResponse(field_file.open('rb'))
+    # File names are unique per upload and the URL carries the name.
+    patch_cache_control(
+        response, private=True, max_age=settings.MEDIA_CACHE_MAX_AGE,
+    )
+    return response
@@ -0,0 +1,296 @@
+"""
+Process-shared metrics store with Prometheus text exposition.
+
+Every worker process writes its samples into its own memory-mapped
+file inside METRICS_DIR. The exposition reads all files and sums them,
+so the numbers cover every uwsgi worker without an external service.
+Files of workers that exited are folded into one aggregate file first,
+so recycled workers neither lose their samples nor pile up files.
+"""
+import fcntl
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+INITIAL_MMAP_SIZE = 1 << 16
+HEADER_SIZE = 8
+
+FILE_PATTERN = 'metrics_*.db'
+AGGREGATE_FILE = 'metrics_aggregate.db'
+LOCK_FILE = 'metrics.lock'
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    float('inf'),
+)
+
+# Metric family -> (type, help text)
+METRICS = {
+    'api_requests_total': (
+        'counter',
+        'API requests by view, action, method and status.',
+    ),
+    'api_request_errors_total': (
+        'counter',
+        'API requests answered with a 5xx status.',
+    ),
+    'api_request_duration_seconds': (
+        'histogram',
+        'API request latency by view and action.',
+    ),
+    'api_db_queries_total': (
+        'counter',
+        'Database queries issued by view and action.',
+    ),
+    'api_fragment_cache_total': (
+        'counter',
+        'Serialized recipes served from (hit) or added to (miss) the '
+        'fragment cache, by view and action.',
+    ),
+}
+
+
+def _padding(length):
+    """Padding that keeps the value of an entry 8 bytes aligned."""
+    return (8 - (length + 4) % 8) % 8
+
+
+def _read_entries(data, used):
+    """Yield (key, value, value position) for every entry in data."""
+    pos = HEADER_SIZE
+    while pos < used:
+        length = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        key = bytes(data[pos:pos + length]).decode('utf-8')
+        pos += length + _padding(length)
+        value = struct.unpack_from('<d', data, pos)[0]
+        yield key, value, pos
+        pos += 8
+
+
+class MmapedDict:
+    """
+    Dictionary of float values stored in a memory-mapped file.
+
+    Layout: an 8 byte header with the number of used bytes, followed by
+    entries made of key length (uint32), key (padded) and value (double).
+    Only the owning process writes into the file.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_MMAP_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+
+        self._used = struct.unpack_from('<I', self._mmap, 0)[0]
+        if self._used == 0:
+            self._used = HEADER_SIZE
+            struct.pack_into('<I', self._mmap, 0, self._used)
+        for key, _, pos in _read_entries(self._mmap, self._used):
+            self._positions[key] = pos
+
+    def _init_value(self, key):
+        encoded = key.encode('utf-8')
+        entry = (
+            struct.pack('<I', len(encoded)) + encoded +
+            b' ' * _padding(len(encoded)) + struct.pack('<d', 0.0)
+        )
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        # Publish the entry only once it is fully written.
+        struct.pack_into('<I', self._mmap, 0, self._used)
+        self._positions[key] = self._used - 8
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            if key not in self._positions:
+                self._init_value(key)
+            pos = self._positions[key]
+            value = struct.unpack_from('<d', self._mmap, pos)[0]
+            struct.pack_into('<d', self._mmap, pos, value + amount)
+
+    def read_all(self):
+        with self._lock:
+            return {
+                key: value
+                for key, value, _ in _read_entries(self._mmap, self._used)
+            }
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+_store = None
+_store_owner = None
+
+
+def _get_store():
+    """Return the store of the current process, opening it after fork."""
+    global _store, _store_owner
+    owner = (os.getpid(), settings.METRICS_DIR)
+    if _store is None or _store_owner != owner:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(
+            settings.METRICS_DIR, f'metrics_{os.getpid()}.db'
+        )
+        _store = MmapedDict(path)
+        _store_owner = owner
+    return _store
+
+
+def _key(family, sample, labels):
+    return json.dumps([family, sample, sorted(labels.items())])
+
+
+def inc(family, labels, amount=1.0):
+    """Increment a counter sample."""
+    _get_store().inc(_key(family, family, labels), amount)
+
+
+def observe(family, labels, value, buckets=LATENCY_BUCKETS):
+    """Record a histogram observation."""
+    store = _get_store()
+    for bound in buckets:
+        if value <= bound:
+            bucket_labels = dict(labels, le=_format_value(bound))
+            store.inc(_key(family, f'{family}_bucket', bucket_labels))
+    store.inc(_key(family, f'{family}_sum', labels), value)
+    store.inc(_key(family, f'{family}_count', labels))
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        return {}
+    used = struct.unpack_from('<I', data, 0)[0]
+    return {key: value for key, value, _ in _read_entries(data, used)}
+
+
+def _pid(path):
+    """Pid of the worker writing path, None for the aggregate file."""
+    name = os.path.basename(path)[len('metrics_'):-len('.db')]
+    return int(name) if name.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(operation):
+    """Hold the lock of METRICS_DIR, shared for reads of the files."""
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with open(os.path.join(settings.METRICS_DIR, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def merge_dead():
+    """Add the files of exited workers to the aggregate and remove them."""
+    dead = []
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, FILE_PATTERN)):
+        pid = _pid(path)
+        if pid is not None and pid != os.getpid() and not _alive(pid):
+            dead.append(path)
+    if not dead:
+        return
+    with _locked(fcntl.LOCK_EX):
+        aggregate = MmapedDict(
+            os.path.join(settings.METRICS_DIR, AGGREGATE_FILE)
+        )
+        try:
+            for path in dead:
+                if not os.path.exists(path):
+                    # Merged by another process meanwhile
+                    continue
+                for key, value in _read_file(path).items():
+                    aggregate.inc(key, value)
+                os.unlink(path)
+        finally:
+            aggregate.close()
+
+
+def collect():
+    """Sum the samples of all worker files in METRICS_DIR."""
+    merge_dead()
+    totals = {}
+    with _locked(fcntl.LOCK_SH):
+        pattern = os.path.join(settings.METRICS_DIR, FILE_PATTERN)
+        for path in glob.glob(pattern):
+            for key, value in _read_file(path).items():
+                totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _sort_key(sample):
+    name, labels, _ = sample
+    le = dict(labels).get('le')
+    rest = [item for item in labels if item[0] != 'le']
+    return (rest, name, float(le) if le is not None else 0.0)
+
+
+def render():
+    """Render the aggregated samples in Prometheus text format."""
+    families = {}
+    for key, value in collect().items():
+        family, name, labels = json.loads(key)
+        families.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        kind, doc = METRICS.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {doc}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families[family], key=_sort_key):
+            label_str = ','.join(
+                f'{label}="{_escape(label_value)}"'
+                for label, label_value in labels
+            )
+            if label_str:
+                name = f'{name}{{{label_str}}}'
+            lines.append(f'{name} {_format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
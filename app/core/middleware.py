@@ -0,0 +1,244 @@
+"""
+Middleware shared by the API apps.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from core import admission, compression, metrics, querycheck, recording
+
+logger = logging.getLogger(__name__)
+
+
+def view_labels(request, view_func):
+    """Return (view, action) labels for a resolved view function."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return view_func.__name__, request.method.lower()
+    # Viewsets map the HTTP method to an action (list, upload_image...)
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return cls.__name__, action
+
+
+class MetricsMiddleware:
+    """Record request counts, latency and DB queries per view and action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_labels = ('unresolved', request.method.lower())
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(count_queries)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view, action = request.metrics_labels
+        labels = {'view': view, 'action': action}
+        metrics.inc('api_requests_total', dict(
+            labels,
+            method=request.method,
+            status=str(response.status_code),
+        ))
+        if response.status_code >= 500:
+            metrics.inc('api_request_errors_total', labels)
+        metrics.observe('api_request_duration_seconds', labels, duration)
+        if queries:
+            metrics.inc('api_db_queries_total', labels, queries)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = view_labels(request, view_func)
+
+
+class RecordingMiddleware:
+    """
+    Record the sanitized shape of a sample of the API requests for
+    replay_load, see core/recording.py. Does nothing unless
+    REQUEST_RECORDING_DIR is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (not settings.REQUEST_RECORDING_DIR or
+                not request.path.startswith(recording.PATH_PREFIX) or
+                random.random() >= settings.REQUEST_RECORDING_SAMPLE):
+            return self.get_response(request)
+
+        request.recording_route = 'unresolved'
+        fields = recording.read_fields(request)
+        started = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        try:
+            recording.record(recording.shape(
+                request, request.recording_route, fields,
+                response.status_code, started, duration,
+            ))
+        except OSError:
+            logger.warning('Cannot record request', exc_info=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.recording_route = '.'.join(view_labels(request, view_func))
+
+
+class QueryCheckMiddleware:
+    """
+    Opt-in detector of N+1 and duplicate queries.
+
+    Does nothing unless QUERY_CHECK_ENABLED is set. Offending query
+    shapes are logged with their stack, or raised when QUERY_CHECK_RAISE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_CHECK_ENABLED:
+            return self.get_response(request)
+
+        with querycheck.QueryTracker() as tracker:
+            response = self.get_response(request)
+
+        offenders = tracker.offenders()
+        if offenders:
+            message = f'{request.method} {request.path}\n{tracker.report()}'
+            if settings.QUERY_CHECK_RAISE:
+                raise querycheck.DuplicateQueryError(message)
+            logger.warning('Duplicate queries in %s', message)
+            response['X-Duplicate-Queries'] = str(len(offenders))
+
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed load with a fast 503 instead of queueing behind busy workers.
+
+    Every request goes through the default limiter; views listed in
+    ADMISSION_ROUTE_LIMITS ("View.action") also need a slot of their own.
+    Requests that already waited upstream longer than
+    ADMISSION_MAX_QUEUE_TIME are rejected right away.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _overloaded(self):
+        response = JsonResponse(
+            {'detail': 'Server is busy, please retry later.'},
+            status=503,
+        )
+        response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+        return response
+
+    def __call__(self, request):
+        queue_time = admission.upstream_queue_time(request)
+        if queue_time > settings.ADMISSION_MAX_QUEUE_TIME:
+            return self._overloaded()
+
+        limiter = admission.get_limiter(
+            'default',
+            settings.ADMISSION_LIMIT,
+            settings.ADMISSION_QUEUE_SIZE,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+        if not limiter.acquire():
+            return self._overloaded()
+
+        request.admission_limiters = [limiter]
+        try:
+            return self.get_response(request)
+        finally:
+            for acquired in request.admission_limiters:
+                acquired.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = '.'.join(view_labels(request, view_func))
+        config = settings.ADMISSION_ROUTE_LIMITS.get(route)
+        if config is None:
+            return None
+
+        limiter = admission.get_limiter(
+            route,
+            config['limit'],
+            config.get('queue', 0),
+            config.get('timeout', settings.ADMISSION_QUEUE_TIMEOUT),
+        )
+        if not limiter.acquire():
+            return self._overloaded()
+        request.admission_limiters.append(limiter)
+        return None
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses of at least API_COMPRESSION_MIN_SIZE bytes,
+    with brotli when the client accepts it and gzip otherwise. Small
+    bodies are sent as they are, compressing them costs more CPU than
+    the bytes it saves.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (not settings.API_COMPRESSION_ENABLED or response.streaming or
+                response.has_header('Content-Encoding') or
+                not compression.is_compressible(
+                    response.get('Content-Type', ''))):
+            return response
+        if len(response.content) < settings.API_COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = compression.accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        body = None
+        if 'br' in accepted:
+            encoding = 'br'
+            body = compression.brotli_compress(
+                response.content, settings.API_COMPRESSION_BROTLI_QUALITY,
+            )
+        if body is None and 'gzip' in accepted:
+            encoding = 'gzip'
+            body = compression.gzip_compress(
+                response.content, settings.API_COMPRESSION_LEVEL,
+            )
+        if body is None or len(body) >= len(response.content):
+            return response
+
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = encoding
+        # A strong ETag would no longer match the bytes sent.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-18 23:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_recipe_count(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, through, column in [
+        ('Tag', Recipe.tags.through, 'tag_id'),
+        ('Ingredient', Recipe.ingredients.through, 'ingredient_id'),
+    ]:
+        model = apps.get_model('core', model_name)
+        model.objects.using(db).update(recipe_count=Coalesce(Subquery(
+            through.objects.filter(**{column: OuterRef('pk')})
+            .values(column)
+            .annotate(count=Count('id'))
+            .values('count')
+        ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_ingred_user_id_de1121_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_tag_user_id_699afc_idx'),
+        ),
+        migrations.RunPython(
+            backfill_recipe_count, migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# Index supporting case-insensitive prefix searches (name__istartswith)
+# of the tags and ingredients of a user.
+INDEX_SQL = {
+    # istartswith compiles to UPPER(name::text) LIKE UPPER(%s)
+    'postgresql': (
+        'CREATE INDEX {name} ON {table} '
+        '(user_id, UPPER(name::text) text_pattern_ops)'
+    ),
+    # The LIKE optimization needs a NOCASE index
+    'sqlite': 'CREATE INDEX {name} ON {table} (user_id, name COLLATE NOCASE)',
+}
+TABLES = ['core_tag', 'core_ingredient']
+
+
+def _index_name(table):
+    return f'{table}_name_prefix_idx'
+
+
+def create_indexes(apps, schema_editor):
+    sql = INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    for table in TABLES:
+        schema_editor.execute(sql.format(
+            name=_index_name(table), table=table,
+        ))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in INDEX_SQL:
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {_index_name(table)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_usergeneration'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
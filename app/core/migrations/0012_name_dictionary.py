@@ -0,0 +1,158 @@
+# Generated by Django 3.2.25 on 2026-10-18 23:26
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+MODELS = ['Tag', 'Ingredient']
+BATCH_SIZE = 1000
+
+# Case-insensitive prefix searches now run against the dictionary.
+PREFIX_INDEX_SQL = {
+    'postgresql': (
+        'CREATE INDEX {name} ON {table} '
+        '({column}UPPER({field}::text) text_pattern_ops)'
+    ),
+    'sqlite': 'CREATE INDEX {name} ON {table} ({column}{field} COLLATE NOCASE)',
+}
+
+
+def _create_prefix_index(schema_editor, table, field, column=''):
+    sql = PREFIX_INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql is not None:
+        schema_editor.execute(sql.format(
+            name=f'{table}_name_prefix_idx', table=table,
+            column=column, field=field,
+        ))
+
+
+def _drop_prefix_index(schema_editor, table):
+    if schema_editor.connection.vendor in PREFIX_INDEX_SQL:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {table}_name_prefix_idx'
+        )
+
+
+def drop_name_indexes(apps, schema_editor):
+    for table in ['core_tag', 'core_ingredient']:
+        _drop_prefix_index(schema_editor, table)
+
+
+def create_name_indexes(apps, schema_editor):
+    for table in ['core_tag', 'core_ingredient']:
+        _create_prefix_index(schema_editor, table, 'name', 'user_id, ')
+
+
+def create_value_index(apps, schema_editor):
+    _create_prefix_index(schema_editor, 'core_name', 'value')
+
+
+def drop_value_index(apps, schema_editor):
+    _drop_prefix_index(schema_editor, 'core_name')
+
+
+def intern_names(apps, schema_editor):
+    """Point every row at its dictionary entry, BATCH_SIZE rows at a time."""
+    db = schema_editor.connection.alias
+    Name = apps.get_model('core', 'Name')
+    for model_name in MODELS:
+        model = apps.get_model('core', model_name)
+        last_id = 0
+        while True:
+            rows = list(model.objects.using(db).filter(
+                id__gt=last_id,
+            ).order_by('id').values_list('id', 'name')[:BATCH_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            values = {name for _, name in rows}
+            Name.objects.using(db).bulk_create(
+                [Name(value=value) for value in values],
+                ignore_conflicts=True,
+            )
+            name_ids = dict(Name.objects.using(db).filter(
+                value__in=values,
+            ).values_list('value', 'id'))
+            model.objects.using(db).bulk_update(
+                [model(id=pk, name_ref_id=name_ids[name])
+                 for pk, name in rows],
+                ['name_ref'],
+            )
+
+
+def restore_names(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Name = apps.get_model('core', 'Name')
+    for model_name in MODELS:
+        model = apps.get_model('core', model_name)
+        model.objects.using(db).update(name=Subquery(
+            Name.objects.filter(id=OuterRef('name_ref_id')).values('value')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_range_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_name_indexes, create_name_indexes),
+        migrations.CreateModel(
+            name='Name',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='name_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.name'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='name_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.name'),
+        ),
+        # Nullable so that unapplying can restore names before NOT NULL.
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.RunPython(intern_names, restore_names),
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='tag',
+            name='name',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name_ref',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.name'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='name_ref',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.name'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name_ref'], name='core_ingred_user_id_005d08_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name_ref'], name='core_tag_user_id_88162e_idx'),
+        ),
+        migrations.RunPython(create_value_index, drop_value_index),
+    ]
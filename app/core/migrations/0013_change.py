@@ -0,0 +1,75 @@
+# Generated by Django 3.2.25 on 2026-10-18 23:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+KINDS = [('recipe', 'Recipe'), ('tag', 'Tag'), ('ingredient', 'Ingredient')]
+BATCH_SIZE = 1000
+
+
+def record_existing(apps, schema_editor):
+    """Give every existing object a change, so a sync from 0 sees it."""
+    db = schema_editor.connection.alias
+    Change = apps.get_model('core', 'Change')
+    UserGeneration = apps.get_model('core', 'UserGeneration')
+    sequences = {}
+    for kind, model_name in KINDS:
+        model = apps.get_model('core', model_name)
+        last_id = 0
+        while True:
+            rows = list(model.objects.using(db).filter(
+                id__gt=last_id,
+            ).order_by('id').values_list('id', 'user_id')[:BATCH_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            changes = []
+            for pk, user_id in rows:
+                sequences[user_id] = sequences.get(user_id, 0) + 1
+                changes.append(Change(
+                    user_id=user_id, kind=kind, object_id=pk,
+                    sequence=sequences[user_id],
+                ))
+            Change.objects.using(db).bulk_create(changes)
+
+    UserGeneration.objects.using(db).bulk_create([
+        UserGeneration(user_id=user_id, name='changes', value=value)
+        for user_id, value in sequences.items()
+    ], batch_size=BATCH_SIZE)
+
+
+def forget_sequences(apps, schema_editor):
+    db = schema_editor.connection.alias
+    UserGeneration = apps.get_model('core', 'UserGeneration')
+    UserGeneration.objects.using(db).filter(name='changes').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_name_dictionary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('sequence', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'sequence'], name='core_change_user_id_d0f23d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='change',
+            unique_together={('user', 'kind', 'object_id')},
+        ),
+        migrations.RunPython(record_existing, forget_sequences),
+    ]
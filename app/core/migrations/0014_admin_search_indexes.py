@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# Indexes supporting the case-insensitive prefix searches (^field) of
+# the admin changelists and autocomplete widgets. They are built
+# CONCURRENTLY, outside a transaction, so the tables stay writable.
+INDEX_SQL = {
+    # istartswith compiles to UPPER(field::text) LIKE UPPER(%s)
+    'postgresql': (
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} '
+        '(UPPER({field}::text) text_pattern_ops)'
+    ),
+    # The LIKE optimization needs a NOCASE index
+    'sqlite': (
+        'CREATE INDEX IF NOT EXISTS {name} ON {table} '
+        '({field} COLLATE NOCASE)'
+    ),
+}
+DROP_SQL = {
+    'postgresql': 'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+    'sqlite': 'DROP INDEX IF EXISTS {name}',
+}
+# core_name.value is indexed by 0012_name_dictionary.
+COLUMNS = [('core_recipe', 'title'), ('core_user', 'email')]
+
+
+def _index_name(table, field):
+    return f'{table}_{field}_prefix_idx'
+
+
+def create_indexes(apps, schema_editor):
+    sql = INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    for table, field in COLUMNS:
+        schema_editor.execute(sql.format(
+            name=_index_name(table, field), table=table, field=field,
+        ))
+
+
+def drop_indexes(apps, schema_editor):
+    sql = DROP_SQL.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    for table, field in COLUMNS:
+        schema_editor.execute(sql.format(name=_index_name(table, field)))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='shard',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='shard_locked',
+            field=models.BooleanField(default=False),
+        ),
+    ]
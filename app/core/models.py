@@ -2,13 +2,15 @@
 import uuid
 import os
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router, transaction
 from django.contrib.auth.models import (
     AbstractBaseUser,  # contains functiopnality for auth
     BaseUserManager,
     PermissionsMixin,  # permissions and fields
 )
 
+from core import shards
+
 
 def recipe_image_file_path(instance, filename):
     """Generate the file path for new images uploads."""
@@ -26,6 +28,8 @@ class UserManager(BaseUserManager):
         user = self.model(email=self.normalize_email(email), **extras)
         if not email:
             raise ValueError('Email is required!')
+        if 'shard' not in extras:
+            user.shard = shards.assign(user.email)
         user.set_password(password)  # does hashing of the password
         user.save(using=self.db)
 
@@ -47,6 +51,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Database holding the recipes, tags and ingredients of the user.
+    shard = models.CharField(max_length=64, default=shards.DEFAULT)
+    # Set while migrate_user moves the user, writes are refused.
+    shard_locked = models.BooleanField(default=False)
 
     objects = UserManager()
     # Consider email to be a username as well
@@ -69,28 +77,243 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        # Range filters and keyset pages ordered by price or time.
+        indexes = [
+            models.Index(fields=['user', 'price', 'id']),
+            models.Index(fields=['user', 'time_min', 'id']),
+        ]
+
     # Set str() method to return Title of recipe
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, summaries apply deltas against them on save.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
-class Tag(models.Model):
-    name = models.CharField(max_length=255)
+    def clone(self, count=1):
+        """
+        Create count copies of the recipe with its tags, ingredients and
+        image reference. Each through table is copied with a single
+        INSERT ... SELECT, so the cost does not grow with the number of
+        tags, ingredients or copies.
+        """
+        fields = [
+            field.attname for field in self._meta.concrete_fields
+            if not field.primary_key
+        ]
+        copies = [
+            Recipe(**{name: getattr(self, name) for name in fields})
+            for _ in range(count)
+        ]
+        db = self._state.db or 'default'
+        connection = connections[db]
+        with transaction.atomic(using=db):
+            if connection.features.can_return_rows_from_bulk_insert:
+                Recipe.objects.using(db).bulk_create(copies)
+            else:
+                # No ids back from a bulk insert on this backend.
+                for copy in copies:
+                    copy.save(using=db)
+
+            new_ids = [copy.pk for copy in copies]
+            with connection.cursor() as cursor:
+                for m2m in ('tags', 'ingredients'):
+                    cursor.execute(
+                        *self._copy_m2m_sql(connection, m2m, new_ids)
+                    )
+        return copies
+
+    def _copy_m2m_sql(self, connection, m2m, new_ids):
+        """INSERT ... SELECT copying the through rows of m2m to new_ids."""
+        qn = connection.ops.quote_name
+        field = self._meta.get_field(m2m)
+        through = field.remote_field.through._meta.db_table
+        source = field.m2m_column_name()
+        target = field.m2m_reverse_name()
+        placeholders = ', '.join(['%s'] * len(new_ids))
+        sql = (
+            f'INSERT INTO {qn(through)} ({qn(source)}, {qn(target)}) '
+            f'SELECT new.{qn("id")}, old.{qn(target)} '
+            f'FROM {qn(self._meta.db_table)} new, {qn(through)} old '
+            f'WHERE new.{qn("id")} IN ({placeholders}) '
+            f'AND old.{qn(source)} = %s'
+        )
+        return sql, [*new_ids, self.pk]
+
+
+class Name(models.Model):
+    """Dictionary of tag and ingredient names shared by every user."""
+    value = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.value
+
+
+class NamedManager(models.Manager):
+    """Makes the interned string queryable as name."""
+
+    def get_queryset(self):
+        return super().get_queryset().select_related(
+            'name_ref',
+        ).alias(name=models.F('name_ref__value'))
+
+
+class NamedModel(models.Model):
+    """
+    Model storing its name as a reference into the Name dictionary.
+
+    name reads and assigns the string like a regular field, the
+    reference is resolved through the intern cache on save.
+    """
+    name_ref = models.ForeignKey(
+        Name,
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
+
+    objects = NamedManager()
+
+    _pending_name = None
+
+    class Meta:
+        abstract = True
+
+    @property
+    def name(self):
+        if self._pending_name is not None:
+            return self._pending_name
+        if self.name_ref_id is None:
+            return None
+        if self._meta.get_field('name_ref').is_cached(self):
+            return self.name_ref.value
+        from core import names
+        return names.value_of(self.name_ref_id, self._state.db)
+
+    @name.setter
+    def name(self, value):
+        self._pending_name = value
+
+    def save(self, *args, **kwargs):
+        if self._pending_name is not None:
+            from core import names
+            db = kwargs.get('using') or router.db_for_write(
+                type(self), instance=self,
+            )
+            self.name_ref_id = names.intern(self._pending_name, db)
+            self._pending_name = None
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class Tag(NamedModel):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Number of recipes using it, maintained by core.signals
+    recipe_count = models.IntegerField(default=0)
 
-    def __str__(self):
-        return self.name
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'recipe_count']),
+            models.Index(fields=['user', 'name_ref']),
+        ]
 
 
-class Ingredient(models.Model):
-    name = models.CharField(max_length=255)
+class Ingredient(NamedModel):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Number of recipes using it, maintained by core.signals
+    recipe_count = models.IntegerField(default=0)
 
-    def __str__(self):
-        return self.name
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'recipe_count']),
+            models.Index(fields=['user', 'name_ref']),
+        ]
+
+
+class RecipeStats(models.Model):
+    """Per-user recipe summary, updated on every recipe change."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.IntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+    )
+    # Bucket lower bound -> number of recipes
+    time_min_histogram = models.JSONField(default=dict)
+    # Tag/Ingredient id -> number of recipes using it
+    tag_counts = models.JSONField(default=dict)
+    ingredient_counts = models.JSONField(default=dict)
+
+
+class UserGeneration(models.Model):
+    """Per-user counter bumped whenever cached data of a kind changes."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=32)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = [['user', 'name']]
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of the tag and ingredient set of a recipe."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    signature = models.BinaryField()
+
+
+class RecipeBand(models.Model):
+    """LSH bucket of one band of a recipe signature."""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    band = models.SmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'band', 'bucket'])]
+
+
+class Change(models.Model):
+    """Latest change of a recipe, tag or ingredient, for delta sync."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    # Value of the change sequence of the user, see core.changes
+    sequence = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = [['user', 'kind', 'object_id']]
+        indexes = [models.Index(fields=['user', 'sequence'])]
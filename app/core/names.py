@@ -0,0 +1,98 @@
+"""
+Process-local intern cache of the shared tag and ingredient names.
+
+Tag and Ingredient rows reference their name in the Name dictionary.
+Each worker keeps the value <-> id pairs it has seen, so resolving the
+names of a request rarely needs more than the lookup of the per-user
+rows by integer id. Name rows are never deleted or changed; pairs are
+only cached once the transaction that read or created them committed,
+so a rolled back insert never leaves a dangling id behind. Every shard
+has its own dictionary, pairs are kept per database.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router, transaction
+
+from core.models import Name
+
+_lock = threading.Lock()
+_ids = OrderedDict()
+_values = OrderedDict()
+
+
+def _remember(db, pairs):
+    with _lock:
+        for value, name_id in pairs.items():
+            _ids[db, value] = name_id
+            _values[db, name_id] = value
+            _ids.move_to_end((db, value))
+            _values.move_to_end((db, name_id))
+        while len(_ids) > settings.NAME_INTERN_CACHE_SIZE:
+            _ids.popitem(last=False)
+        while len(_values) > settings.NAME_INTERN_CACHE_SIZE:
+            _values.popitem(last=False)
+
+
+def _cache(db, pairs):
+    if pairs:
+        transaction.on_commit(lambda: _remember(db, pairs), using=db)
+
+
+def clear():
+    with _lock:
+        _ids.clear()
+        _values.clear()
+
+
+def intern_many(values, db=None):
+    """
+    Return {value: Name id}, adding missing values to the dictionary of
+    db, the active shard by default.
+    """
+    db = db or router.db_for_write(Name)
+    result = {}
+    missing = set()
+    with _lock:
+        for value in values:
+            name_id = _ids.get((db, value))
+            if name_id is None:
+                missing.add(value)
+            else:
+                result[value] = name_id
+
+    if missing:
+        found = dict(Name.objects.using(db).filter(
+            value__in=missing,
+        ).values_list('value', 'id'))
+        new = missing - found.keys()
+        if new:
+            Name.objects.using(db).bulk_create(
+                [Name(value=value) for value in new],
+                ignore_conflicts=True,
+            )
+            found.update(Name.objects.using(db).filter(
+                value__in=new,
+            ).values_list('value', 'id'))
+        _cache(db, found)
+        result.update(found)
+    return result
+
+
+def intern(value, db=None):
+    """Name id of value, adding it to the dictionary if needed."""
+    return intern_many([value], db)[value]
+
+
+def value_of(name_id, db=None):
+    """String of a Name id in db, the active shard by default."""
+    db = db or router.db_for_read(Name)
+    with _lock:
+        value = _values.get((db, name_id))
+    if value is None:
+        value = Name.objects.using(db).values_list(
+            'value', flat=True,
+        ).get(id=name_id)
+        _cache(db, {value: name_id})
+    return value
@@ -0,0 +1,42 @@
+"""
+Paginator for admin changelists of large tables.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """Postgres row estimate of the table of queryset, None elsewhere."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # -1 (or 0 before Postgres 14) until the table is analyzed
+    if row is None or row[0] <= 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Skip COUNT(*), a full scan on Postgres, when an unfiltered table is
+    larger than ADMIN_ESTIMATED_COUNT_MIN rows and use the statistics of
+    the planner instead. Filtered lists are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimated_count(self.object_list)
+            if (estimate is not None and
+                    estimate >= settings.ADMIN_ESTIMATED_COUNT_MIN):
+                return estimate
+        return super().count
@@ -0,0 +1,119 @@
+"""
+Development helpers to detect N+1 and duplicate queries.
+
+Queries are fingerprinted by their normalized shape. When one shape runs
+more than QUERY_CHECK_THRESHOLD times within a request, the Python stack
+that issued it is reported, or DuplicateQueryError is raised.
+"""
+import re
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+class DuplicateQueryError(Exception):
+    """Raised when the same query shape runs too many times."""
+
+
+def fingerprint(sql):
+    """Return the shape of a query with literals and IN lists folded."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _caller_stack():
+    """Stack of project frames that led to the query."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base_dir)
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-8:]))
+
+
+class QueryTracker:
+    """Context manager counting query shapes on every connection."""
+
+    def __init__(self, threshold=None):
+        if threshold is None:
+            threshold = settings.QUERY_CHECK_THRESHOLD
+        self.threshold = threshold
+        self.counts = {}
+        self.stacks = {}
+        self._stack = None
+
+    def _record(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.counts[shape] = self.counts.get(shape, 0) + 1
+        if self.counts[shape] == self.threshold + 1:
+            # The stack of the first excess query is the useful one.
+            self.stacks[shape] = _caller_stack()
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(
+                connection.execute_wrapper(self._record)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def offenders(self):
+        """Return (shape, count, stack) for shapes over the threshold."""
+        return [
+            (shape, count, self.stacks[shape])
+            for shape, count in self.counts.items()
+            if count > self.threshold
+        ]
+
+    def report(self):
+        return '\n\n'.join(
+            f'Query ran {count} times '
+            f'(threshold {self.threshold}):\n  {shape}\n{stack}'
+            for shape, count, stack in self.offenders()
+        )
+
+
+class QueryCheckMixin:
+    """
+    Test case mixin raising DuplicateQueryError for every request
+    made through the test client that repeats a query shape.
+    """
+    query_check_threshold = None
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test import override_settings
+
+        options = {'QUERY_CHECK_ENABLED': True, 'QUERY_CHECK_RAISE': True}
+        if cls.query_check_threshold is not None:
+            options['QUERY_CHECK_THRESHOLD'] = cls.query_check_threshold
+        cls._query_check_settings = override_settings(**options)
+        cls._query_check_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls._query_check_settings.disable()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._query_check_settings.disable()
@@ -0,0 +1,155 @@
+"""
+Recording of sanitized API request shapes for replay_load.
+
+A shape keeps what drives the cost of a request but nothing that could
+identify a user or leak their data: the route, the path with ids
+replaced by {id}, the number of ids in id list filters, the length of
+search terms, the allowlisted filter values, whether a page cursor was
+sent, the size and content type
+of the body and the top-level field names of JSON bodies. Every worker
+process appends one JSON line per sampled request to its own file in
+REQUEST_RECORDING_DIR.
+"""
+import glob
+import json
+import os
+import re
+import threading
+
+from django.conf import settings
+
+PATH_PREFIX = '/api/'
+
+# Query parameters recorded as the number of comma separated ids.
+ID_LIST_PARAMS = {'tags', 'ingredients', 'ids'}
+# Query parameters recorded as the length of their value.
+TEXT_PARAMS = {'q'}
+# Query parameters recorded as present only, their value is opaque.
+FLAG_PARAMS = {'cursor'}
+# Query parameters whose values are recorded as they are.
+KEPT_PARAMS = {
+    'assigned_only', 'limit', 'ordering', 'price_min', 'price_max',
+    'time_min_max', 'since',
+}
+
+# JSON bodies larger than this are recorded by size only.
+MAX_PARSED_BODY = 1 << 16
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+_lock = threading.Lock()
+_file = None
+_file_owner = None
+
+
+def sanitize_path(path):
+    return _ID_SEGMENT.sub('/{id}', path)
+
+
+def sanitize_query(query):
+    """Shape of a QueryDict, unknown parameters are dropped."""
+    shape = {}
+    for name, value in query.items():
+        if name in ID_LIST_PARAMS:
+            shape[name] = len([pk for pk in value.split(',') if pk])
+        elif name in TEXT_PARAMS:
+            shape[name] = len(value)
+        elif name in FLAG_PARAMS:
+            shape[name] = True
+        elif name in KEPT_PARAMS:
+            shape[name] = value
+    return shape
+
+
+def body_fields(data):
+    """Top-level fields of a JSON body, with the length of lists."""
+    if not isinstance(data, dict):
+        return None
+    return {
+        name: len(value) if isinstance(value, list) else None
+        for name, value in data.items()
+    }
+
+
+def content_type(request):
+    return request.META.get('CONTENT_TYPE', '').split(';')[0].strip()
+
+
+def read_fields(request):
+    """
+    Body fields of a JSON request. Reads the body before the view, so
+    only small bodies are parsed.
+    """
+    if content_type(request) != 'application/json':
+        return None
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return None
+    if not 0 < length <= MAX_PARSED_BODY:
+        return None
+    try:
+        return body_fields(json.loads(request.body))
+    except ValueError:
+        return None
+
+
+def shape(request, route, fields, status, started, duration):
+    entry = {
+        't': round(started, 3),
+        'method': request.method,
+        'route': route,
+        'path': sanitize_path(request.path),
+        'query': sanitize_query(request.GET),
+        'status': status,
+        'duration': round(duration, 6),
+    }
+    length = request.META.get('CONTENT_LENGTH')
+    if length:
+        entry['body'] = {
+            'size': int(length),
+            'content_type': content_type(request),
+        }
+        if fields is not None:
+            entry['body']['fields'] = fields
+    return entry
+
+
+def _get_file():
+    """Return the recording of the current process, opening it after fork."""
+    global _file, _file_owner
+    owner = (os.getpid(), settings.REQUEST_RECORDING_DIR)
+    if _file is None or _file_owner != owner:
+        os.makedirs(settings.REQUEST_RECORDING_DIR, exist_ok=True)
+        path = os.path.join(
+            settings.REQUEST_RECORDING_DIR, f'requests_{os.getpid()}.jsonl'
+        )
+        _file = open(path, 'a')
+        _file_owner = owner
+    return _file
+
+
+def record(entry):
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    with _lock:
+        f = _get_file()
+        f.write(line)
+        f.flush()
+
+
+def load(paths):
+    """Entries of the recordings in paths (files or directories), by time."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                glob.glob(os.path.join(path, 'requests_*.jsonl'))
+            ))
+        else:
+            files.append(path)
+    entries = []
+    for path in files:
+        with open(path) as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    entries.sort(key=lambda entry: entry['t'])
+    return entries
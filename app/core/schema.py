@@ -0,0 +1,138 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is
+done once per code version: at deploy time by manage.py build_schema,
+or by the first request otherwise. The rendered bytes are kept in
+SCHEMA_CACHE_DIR, where file names carry the code version so a new
+release never serves the schema of the previous one, and in memory
+together with their gzip/brotli encodings and a strong ETag for each.
+"""
+import functools
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from core import compression
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+# Packages whose upgrade changes the generated schema.
+PACKAGES = ['django', 'rest_framework', 'drf_spectacular']
+
+_lock = threading.Lock()
+_schemas = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest():
+    digest = hashlib.sha256()
+    for package in PACKAGES:
+        digest.update(import_module(package).__version__.encode())
+    base_dir = str(settings.BASE_DIR)
+    paths = glob.glob(os.path.join(base_dir, '**', '*.py'), recursive=True)
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, base_dir).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def code_version():
+    """CODE_VERSION, or a digest of the sources and package versions."""
+    return settings.CODE_VERSION or _source_digest()
+
+
+def _etag(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+def _path(fmt):
+    return os.path.join(
+        settings.SCHEMA_CACHE_DIR, f'schema-{code_version()}.{fmt}'
+    )
+
+
+def generate(fmt):
+    """Render the schema without a request, so it is cacheable."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        urlconf=spectacular_settings.SERVE_URLCONF,
+    )
+    data = generator.get_schema(
+        request=None, public=spectacular_settings.SERVE_PUBLIC,
+    )
+    return RENDERERS[fmt]().render(data, renderer_context={})
+
+
+def _write(path, content):
+    """Write atomically, concurrent workers may write the same file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _load(fmt):
+    path = _path(fmt)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = generate(fmt)
+        _write(path, content)
+    variants = {
+        'identity': content,
+        'gzip': compression.gzip_compress(content, 9),
+        'br': compression.brotli_compress(content, 11),
+    }
+    return {
+        encoding: (body, _etag(body))
+        for encoding, body in variants.items()
+        if body is not None
+    }
+
+
+def get(fmt):
+    """
+    Return {encoding: (body, etag)} of the schema in fmt, loading or
+    generating it once per process.
+    """
+    key = (code_version(), fmt)
+    schema = _schemas.get(key)
+    if schema is None:
+        with _lock:
+            schema = _schemas.get(key)
+            if schema is None:
+                schema = _schemas[key] = _load(fmt)
+    return schema
+
+
+def build():
+    """Write the schema of the current code version, drop older ones."""
+    paths = []
+    for fmt in RENDERERS:
+        path = _path(fmt)
+        _write(path, generate(fmt))
+        paths.append(path)
+    pattern = os.path.join(settings.SCHEMA_CACHE_DIR, 'schema-*')
+    for path in glob.glob(pattern):
+        if path not in paths:
+            os.remove(path)
+    clear()
+    return paths
+
+
+def clear():
+    """Forget the schemas loaded by this process."""
+    _schemas.clear()
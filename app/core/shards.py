@@ -0,0 +1,167 @@
+"""
+Routing of user data across the databases listed in SHARDS.
+
+Users, tokens, sessions and the admin live in the default database,
+which also records the shard of every user in User.shard. The other
+core tables belong to a user and are stored in the shard of that user,
+a database with the full schema and a placeholder copy of the user row,
+so that foreign keys still hold. New users are placed by a stable hash
+of their email and keep their shard when shards are added; migrate_user
+moves them afterwards.
+
+A request activates the shard of its user (recipe.views.ShardMixin) and
+the router sends queries without an instance to it; related managers
+and saved instances stay on the database of their instance. Recipe, tag
+and ingredient ids come from a separate range in every shard, so they
+stay unique when users move.
+"""
+import hashlib
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULT = 'default'
+
+# Ids of the n-th shard start at n * ID_RANGE.
+ID_RANGE = 1 << 40
+# Tables whose ids are exposed by the API.
+ID_TABLES = ['core_recipe', 'core_tag', 'core_ingredient']
+
+# (statement, parameter names) moving a sequence up to a range start
+RESERVE_SQL = {
+    'postgresql': [(
+        'SELECT setval(seq, %s, false) FROM ('
+        "SELECT pg_get_serial_sequence(%s, 'id') AS seq) s "
+        'WHERE COALESCE(pg_sequence_last_value(seq::regclass), 0) < %s',
+        ['start', 'table', 'start'],
+    )],
+    'sqlite': [(
+        'UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+        ['last', 'table', 'last'],
+    ), (
+        'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+        'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+        ['table', 'last', 'table'],
+    )],
+}
+
+_local = threading.local()
+
+
+def is_sharded(model):
+    """Every core model but the user belongs to a user's shard."""
+    return (
+        model._meta.app_label == 'core' and
+        model._meta.label != settings.AUTH_USER_MODEL
+    )
+
+
+def _is_user(instance):
+    return instance._meta.label == settings.AUTH_USER_MODEL
+
+
+def assign(email):
+    """Shard of a new user, from a stable hash of the email."""
+    digest = hashlib.sha256(email.lower().encode()).digest()
+    index = int.from_bytes(digest[:8], 'big') % len(settings.SHARDS)
+    return settings.SHARDS[index]
+
+
+def current():
+    """Shard of the request or block being run."""
+    return getattr(_local, 'alias', None) or DEFAULT
+
+
+def activate(alias):
+    _local.alias = alias
+
+
+def deactivate():
+    _local.alias = None
+
+
+@contextmanager
+def using(alias):
+    """Route the user data accessed inside the block to alias."""
+    previous = getattr(_local, 'alias', None)
+    _local.alias = alias
+    try:
+        yield
+    finally:
+        _local.alias = previous
+
+
+class ShardRouter:
+    """Database router sending user data to the active shard."""
+
+    def _db(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None:
+            if _is_user(instance):
+                return instance.shard
+            if instance._state.db:
+                return instance._state.db
+        return current()
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The user row is mirrored into the shard holding its data.
+        if _is_user(obj1) or _is_user(obj2):
+            return True
+        return None
+
+
+def mirror_email(pk):
+    """
+    Email of the copy of a user in a shard. Copies only exist for the
+    foreign keys, keyed by primary key, so the real email never has to
+    be kept in sync and can be reused by a new user.
+    """
+    return f'{pk}@shard'
+
+
+def mirror_users(users, alias=None):
+    """
+    Copy the rows of users into alias, their own shards by default.
+    Users already copied are left alone.
+    """
+    by_shard = defaultdict(list)
+    for user in users:
+        if (alias or user.shard) != DEFAULT:
+            by_shard[alias or user.shard].append(user)
+    for alias, shard_users in by_shard.items():
+        model = type(shard_users[0])
+        manager = model._base_manager.using(alias)
+        existing = set(manager.filter(
+            pk__in=[user.pk for user in shard_users],
+        ).values_list('pk', flat=True))
+        manager.bulk_create([
+            model(
+                id=user.pk, email=mirror_email(user.pk), shard=alias,
+                password='!',
+            )
+            for user in shard_users if user.pk not in existing
+        ])
+
+
+def reserve_ids(using, **kwargs):
+    """post_migrate handler moving the id sequences into the shard range."""
+    if using not in settings.SHARDS:
+        return
+    start = settings.SHARDS.index(using) * ID_RANGE
+    connection = connections[using]
+    statements = RESERVE_SQL.get(connection.vendor)
+    if not start or statements is None:
+        return
+    with connection.cursor() as cursor:
+        for table in ID_TABLES:
+            values = {'table': table, 'start': start, 'last': start - 1}
+            for sql, names in statements:
+                cursor.execute(sql, [values[name] for name in names])
@@ -0,0 +1,348 @@
+"""
+Signal handlers keeping derived recipe data up to date.
+
+Set-based bulk operations run inside deferred(), which skips the per-row
+handlers and resynchronizes the touched recipes once at the end.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_save,
+    pre_delete,
+    pre_save,
+    post_delete,
+)
+from django.dispatch import receiver
+
+from core import (
+    autocomplete, changes, cookable, counters, shards, similarity, stats,
+)
+from core.models import Recipe, Tag, Ingredient, User
+
+TRACKED_FIELDS = ('price', 'time_min')
+
+# Through model -> (RecipeStats counts field, related model, column)
+M2M_FIELDS = {
+    Recipe.tags.through: ('tag_counts', Tag, 'tag_id'),
+    Recipe.ingredients.through: (
+        'ingredient_counts', Ingredient, 'ingredient_id',
+    ),
+}
+
+_local = threading.local()
+
+
+def is_deferred():
+    return getattr(_local, 'depth', 0) > 0
+
+
+@contextmanager
+def deferred(user_id, recipe_ids=None):
+    """
+    Skip incremental updates, then resync what the block touched.
+
+    recipe_ids are the existing recipes of the user the block changes,
+    None standing for the whole account. The block adds the ids of the
+    recipes it creates to the yielded set. Enter it inside the
+    transaction of the write, so the resync commits or rolls back with it.
+    """
+    depth = getattr(_local, 'depth', 0)
+    if depth == 0:
+        _local.touched = {}
+    _local.depth = depth + 1
+    created = set()
+    if recipe_ids is None:
+        _local.touched[user_id] = None
+    else:
+        _declare(user_id, recipe_ids)
+    try:
+        yield created
+    finally:
+        _local.depth = depth
+    _record(user_id, created, created=True)
+    if depth == 0:
+        for user_id, before in _local.touched.items():
+            _resync(user_id, before)
+
+
+def _snapshot(recipe_ids):
+    """
+    {recipe id: state} of the recipes that exist, a state holding the
+    tracked fields and the related ids under their counts field.
+    """
+    states = {
+        row['id']: {
+            **row, **{field: [] for field, _, _ in M2M_FIELDS.values()},
+        }
+        for row in Recipe.objects.filter(
+            id__in=recipe_ids,
+        ).values('id', *TRACKED_FIELDS)
+    }
+    for through, (counts_field, _, column) in M2M_FIELDS.items():
+        links = through.objects.filter(
+            recipe_id__in=list(states),
+        ).values_list('recipe_id', column)
+        for recipe_id, related_id in links:
+            states[recipe_id][counts_field].append(related_id)
+    return states
+
+
+def _resync(user_id, before):
+    """Bring derived data in line with the recipes touched since before."""
+    if before is None:
+        stats.rebuild(user_id)
+        counters.recount_user(user_id)
+        similarity.rebuild(user_id)
+    else:
+        after = _snapshot(list(before)) if before else {}
+        stats.recipes_changed(user_id, before, after)
+        for counts_field, model, _ in M2M_FIELDS.values():
+            counters.adjust(
+                model, stats.link_deltas(before, after, counts_field),
+            )
+        similarity.update(before)
+    cookable.invalidate(user_id)
+
+
+def _declare(user_id, recipe_ids):
+    """Snapshot the recipes the block is about to change."""
+    touched = _local.touched
+    if user_id in touched and touched[user_id] is None:
+        return
+    before = touched.setdefault(user_id, {})
+    new_ids = [pk for pk in recipe_ids if pk not in before]
+    if new_ids:
+        states = _snapshot(new_ids)
+        for pk in new_ids:
+            before[pk] = states.get(pk)
+
+
+def _record(user_id, recipe_ids=None, created=False):
+    """
+    Add recipes to the ones resynced at the end. A change to an existing
+    recipe the block did not declare resyncs the whole account.
+    """
+    touched = _local.touched
+    if user_id in touched and touched[user_id] is None:
+        return
+    if created:
+        before = touched.setdefault(user_id, {})
+        for pk in recipe_ids:
+            before.setdefault(pk, None)
+    elif recipe_ids is None \
+            or not touched.get(user_id, {}).keys() >= set(recipe_ids):
+        touched[user_id] = None
+
+
+def _skip(user_id, recipe_ids=None, created=False):
+    """Record the recipes when deferred, True if the handler must stop."""
+    if is_deferred():
+        _record(user_id, recipe_ids, created)
+        return True
+    return False
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_pre_save(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._old_values = None
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded for field in TRACKED_FIELDS):
+        instance._old_values = {f: loaded[f] for f in TRACKED_FIELDS}
+    else:
+        instance._old_values = Recipe.objects.filter(
+            pk=instance.pk
+        ).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_post_save(sender, instance, created, **kwargs):
+    old_values = getattr(instance, '_old_values', None)
+    instance._loaded_values = {
+        **getattr(instance, '_loaded_values', {}),
+        **{f: getattr(instance, f) for f in TRACKED_FIELDS},
+    }
+    changes.record(instance.user_id, changes.RECIPE, [instance.pk])
+    if _skip(instance.user_id, [instance.pk], created):
+        return
+    if created or old_values is not None:
+        stats.recipe_saved(instance, created, old_values)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_pre_delete(sender, instance, **kwargs):
+    instance._related_ids = {}
+    if _skip(instance.user_id, [instance.pk]):
+        return
+    # Through rows go away with the recipe without an m2m_changed.
+    instance._related_ids = {
+        through: list(through.objects.filter(
+            recipe_id=instance.pk
+        ).values_list(column, flat=True))
+        for through, (_, _, column) in M2M_FIELDS.items()
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_post_delete(sender, instance, **kwargs):
+    changes.record(
+        instance.user_id, changes.RECIPE, [instance.pk], deleted=True,
+    )
+    if _skip(instance.user_id, [instance.pk]):
+        return
+    related_ids = instance._related_ids
+    stats.recipe_deleted(
+        instance,
+        related_ids[Recipe.tags.through],
+        related_ids[Recipe.ingredients.through],
+    )
+    for through, (_, model, _) in M2M_FIELDS.items():
+        counters.adjust(model, {pk: -1 for pk in related_ids[through]})
+    if related_ids[Recipe.ingredients.through]:
+        cookable.invalidate(instance.user_id)
+
+
+def _existing_links(sender, instance, reverse, pk_set):
+    """Through rows that a remove or clear is about to delete."""
+    _, _, column = M2M_FIELDS[sender]
+    if reverse:
+        links = sender.objects.filter(**{column: instance.pk})
+        if pk_set is not None:
+            links = links.filter(recipe_id__in=pk_set)
+        instance._removed_recipe_ids = list(
+            links.values_list('recipe_id', flat=True)
+        )
+        return {instance.pk: len(instance._removed_recipe_ids)}
+
+    links = sender.objects.filter(recipe_id=instance.pk)
+    if pk_set is not None:
+        links = links.filter(**{f'{column}__in': pk_set})
+    return {related_id: 1 for related_id in
+            links.values_list(column, flat=True)}
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if _skip(instance.user_id, None if reverse else [instance.pk]):
+        return
+    counts_field, model, _ = M2M_FIELDS[sender]
+    if action in ('pre_remove', 'pre_clear'):
+        pk_set = pk_set if action == 'pre_remove' else None
+        instance._removed_links = _existing_links(
+            sender, instance, reverse, pk_set
+        )
+        return
+
+    if action == 'post_add':
+        # pk_set only holds the rows actually inserted.
+        if reverse:
+            deltas = {instance.pk: len(pk_set)}
+            recipe_ids = pk_set
+        else:
+            deltas = {related_id: 1 for related_id in pk_set}
+    elif action in ('post_remove', 'post_clear'):
+        deltas = {
+            related_id: -count
+            for related_id, count in instance._removed_links.items()
+        }
+        if reverse:
+            recipe_ids = instance._removed_recipe_ids
+    else:
+        return
+
+    if deltas:
+        stats.related_changed(instance.user_id, counts_field, deltas)
+        counters.adjust(model, deltas)
+        if model is Ingredient:
+            cookable.invalidate(instance.user_id)
+        if not reverse:
+            recipe_ids = [instance.pk]
+        similarity.update(recipe_ids)
+        changes.record(instance.user_id, changes.RECIPE, recipe_ids)
+
+
+def _linked_recipe_ids(model, pk):
+    for through, (_, related_model, column) in M2M_FIELDS.items():
+        if related_model is model:
+            return list(through.objects.filter(
+                **{column: pk}
+            ).values_list('recipe_id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_pre_delete(sender, instance, **kwargs):
+    instance._recipe_ids = []
+    if _skip(instance.user_id):
+        return
+    stats.related_deleted(instance.user_id, 'tag_counts', instance.pk)
+    instance._recipe_ids = _linked_recipe_ids(sender, instance.pk)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_pre_delete(sender, instance, **kwargs):
+    instance._recipe_ids = []
+    if _skip(instance.user_id):
+        return
+    stats.related_deleted(
+        instance.user_id, 'ingredient_counts', instance.pk
+    )
+    cookable.invalidate(instance.user_id)
+    instance._recipe_ids = _linked_recipe_ids(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def related_post_delete(sender, instance, **kwargs):
+    # The through rows went away without an m2m_changed.
+    similarity.update(instance._recipe_ids)
+    changes.record(
+        instance.user_id, sender._meta.model_name, [instance.pk],
+        deleted=True,
+    )
+    changes.record(instance.user_id, changes.RECIPE, instance._recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def related_post_save(sender, instance, created, **kwargs):
+    changes.record(instance.user_id, sender._meta.model_name, [instance.pk])
+    if not created:
+        # Recipes embed the name.
+        changes.record(
+            instance.user_id, changes.RECIPE,
+            _linked_recipe_ids(sender, instance.pk),
+        )
+
+
+@receiver(pre_delete, sender=User)
+def user_pre_delete(sender, instance, **kwargs):
+    changes.user_deleting(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_post_delete(sender, instance, using, **kwargs):
+    if using != instance.shard:
+        # The data of the user goes away with the copy in the shard.
+        with shards.using(instance.shard):
+            User._base_manager.using(instance.shard).filter(
+                pk=instance.pk,
+            ).delete()
+    changes.user_deleted(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, created, using, **kwargs):
+    if created and using != instance.shard:
+        shards.mirror_users([instance])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def name_changed(sender, instance, **kwargs):
+    autocomplete.invalidate(sender, instance.user_id)
@@ -0,0 +1,195 @@
+"""
+Similar recipes through MinHash signatures and LSH buckets.
+
+A recipe is the set of its tags and ingredients. Its MinHash signature
+keeps, for each of SIGNATURE_SIZE hash functions, the smallest hash of
+the set, and two signatures agree on a position with a probability
+equal to the Jaccard similarity of the sets. Signatures are cut into
+BANDS bands; recipes sharing the bucket of any band are the candidates,
+so a lookup never compares a recipe with the whole collection.
+"""
+import hashlib
+import random
+import struct
+
+from django.db import router, transaction
+from django.db.models import Count, Q
+
+from core.models import Recipe, RecipeBand, RecipeSignature
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+
+# Candidates scored per lookup, those sharing most bands first.
+MAX_CANDIDATES = 500
+
+BATCH_SIZE = 500
+
+_PRIME = (1 << 61) - 1
+_FORMAT = f'<{SIGNATURE_SIZE}Q'
+
+# Fixed seed: stored signatures must stay comparable across processes.
+_random = random.Random(4242)
+_COEFFICIENTS = [
+    (_random.randrange(1, _PRIME), _random.randrange(0, _PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+
+
+def _feature(kind, pk):
+    """Integer feature of a tag (even) or an ingredient (odd)."""
+    return pk * 2 + kind
+
+
+def _hashes(feature):
+    return [(a * feature + b) % _PRIME for a, b in _COEFFICIENTS]
+
+
+def signatures(feature_sets):
+    """
+    MinHash signatures of a batch of feature sets.
+
+    The hash vector of every distinct feature is computed once for the
+    whole batch and folded into the signatures with element-wise min.
+    """
+    vectors = {}
+    result = {}
+    for key, features in feature_sets.items():
+        signature = None
+        for feature in features:
+            vector = vectors.get(feature)
+            if vector is None:
+                vector = vectors[feature] = _hashes(feature)
+            signature = (
+                vector if signature is None
+                else list(map(min, signature, vector))
+            )
+        if signature is not None:
+            result[key] = signature
+    return result
+
+
+def buckets(signature):
+    """Bucket of every band of a signature, as signed 64 bit ints."""
+    packed = struct.pack(_FORMAT, *signature)
+    width = ROWS * 8
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                packed[band * width:(band + 1) * width], digest_size=8,
+            ).digest(),
+            'little',
+            signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(map(int.__eq__, signature, other)) / SIGNATURE_SIZE
+
+
+def _feature_sets(recipe_ids):
+    feature_sets = {recipe_id: [] for recipe_id in recipe_ids}
+    for kind, through, column in (
+        (0, Recipe.tags.through, 'tag_id'),
+        (1, Recipe.ingredients.through, 'ingredient_id'),
+    ):
+        links = through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', column)
+        for recipe_id, related_id in links:
+            feature_sets[recipe_id].append(_feature(kind, related_id))
+    return feature_sets
+
+
+def _update_batch(recipe_users):
+    if not recipe_users:
+        return
+    recipe_ids = list(recipe_users)
+    computed = signatures(_feature_sets(recipe_ids))
+
+    rows = []
+    bands = []
+    for recipe_id, signature in computed.items():
+        user_id = recipe_users[recipe_id]
+        rows.append(RecipeSignature(
+            recipe_id=recipe_id,
+            user_id=user_id,
+            signature=struct.pack(_FORMAT, *signature),
+        ))
+        bands.extend(
+            RecipeBand(
+                recipe_id=recipe_id, user_id=user_id,
+                band=band, bucket=bucket,
+            )
+            for band, bucket in enumerate(buckets(signature))
+        )
+
+    with transaction.atomic(using=router.db_for_write(RecipeBand)):
+        RecipeBand.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.bulk_create(rows)
+        RecipeBand.objects.bulk_create(bands, batch_size=BATCH_SIZE)
+
+
+def update(recipe_ids):
+    """Recompute the signatures of the given recipes that still exist."""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        recipe_users = dict(Recipe.objects.filter(
+            id__in=recipe_ids[start:start + BATCH_SIZE],
+        ).values_list('id', 'user_id'))
+        _update_batch(recipe_users)
+
+
+def rebuild(user_id):
+    """Recompute the signatures of every recipe of a user."""
+    with transaction.atomic(using=router.db_for_write(RecipeBand)):
+        RecipeBand.objects.filter(user_id=user_id).delete()
+        RecipeSignature.objects.filter(user_id=user_id).delete()
+        recipe_ids = list(Recipe.objects.filter(
+            user_id=user_id,
+        ).values_list('id', flat=True))
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            _update_batch(
+                dict.fromkeys(recipe_ids[start:start + BATCH_SIZE], user_id)
+            )
+
+
+def similar(recipe, limit):
+    """Return (recipe id, similarity) of the recipes most like recipe."""
+    stored = RecipeSignature.objects.filter(
+        recipe_id=recipe.pk,
+    ).values_list('signature', flat=True).first()
+    if stored is None:
+        return []
+    signature = struct.unpack(_FORMAT, stored)
+
+    matches = Q()
+    for band, bucket in enumerate(buckets(signature)):
+        matches |= Q(band=band, bucket=bucket)
+    candidates = RecipeBand.objects.filter(
+        matches, user_id=recipe.user_id,
+    ).exclude(
+        recipe_id=recipe.pk,
+    ).values('recipe_id').annotate(
+        shared=Count('id'),
+    ).order_by('-shared', '-recipe_id').values_list(
+        'recipe_id', flat=True,
+    )[:MAX_CANDIDATES]
+
+    others = RecipeSignature.objects.filter(
+        recipe_id__in=list(candidates),
+    ).values_list('recipe_id', 'signature')
+    scored = sorted(
+        (
+            (similarity(signature, struct.unpack(_FORMAT, other)),
+             recipe_id)
+            for recipe_id, other in others
+        ),
+        reverse=True,
+    )
+    return [(recipe_id, score) for score, recipe_id in scored[:limit]]
@@ -0,0 +1,219 @@
+"""
+Per-user recipe statistics maintained incrementally.
+
+Signal handlers in core.signals apply small deltas to the RecipeStats
+row of a user, so reading the statistics never scans Recipe. A missing
+row means the statistics were never built; it is built on first read.
+"""
+import bisect
+from collections import Counter
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Count, Sum
+
+from core.models import Ingredient, Recipe, RecipeStats, Tag
+
+TIME_MIN_BUCKETS = (0, 10, 20, 30, 45, 60, 90, 120)
+TOP_COUNT = 5
+
+
+def time_bucket(time_min):
+    """Histogram bucket (lower bound as a string) of a cooking time."""
+    index = max(0, bisect.bisect_right(TIME_MIN_BUCKETS, time_min) - 1)
+    return str(TIME_MIN_BUCKETS[index])
+
+
+def _add(counts, key, delta):
+    key = str(key)
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _update(user_id, change):
+    """Apply change(stats) to the stats row of a user, if built."""
+    with transaction.atomic(using=router.db_for_write(RecipeStats)):
+        stats = RecipeStats.objects.select_for_update().filter(
+            user_id=user_id
+        ).first()
+        if stats is None:
+            return
+        change(stats)
+        stats.save()
+
+
+def recipe_saved(recipe, created, old_values):
+    price = Decimal(str(recipe.price))
+
+    def change(stats):
+        if created:
+            stats.recipe_count += 1
+            stats.price_total += price
+        else:
+            stats.price_total += price - Decimal(str(old_values['price']))
+            _add(stats.time_min_histogram,
+                 time_bucket(old_values['time_min']), -1)
+        _add(stats.time_min_histogram, time_bucket(recipe.time_min), 1)
+
+    if created or old_values['price'] != price \
+            or old_values['time_min'] != recipe.time_min:
+        _update(recipe.user_id, change)
+
+
+def recipe_deleted(recipe, tag_ids, ingredient_ids):
+    def change(stats):
+        stats.recipe_count -= 1
+        stats.price_total -= Decimal(str(recipe.price))
+        _add(stats.time_min_histogram, time_bucket(recipe.time_min), -1)
+        for tag_id in tag_ids:
+            _add(stats.tag_counts, tag_id, -1)
+        for ingredient_id in ingredient_ids:
+            _add(stats.ingredient_counts, ingredient_id, -1)
+
+    _update(recipe.user_id, change)
+
+
+def related_changed(user_id, counts_field, deltas):
+    """Apply {tag or ingredient id: delta} to the usage counts."""
+    def change(stats):
+        counts = getattr(stats, counts_field)
+        for related_id, delta in deltas.items():
+            _add(counts, related_id, delta)
+
+    _update(user_id, change)
+
+
+def related_deleted(user_id, counts_field, related_id):
+    def change(stats):
+        getattr(stats, counts_field).pop(str(related_id), None)
+
+    _update(user_id, change)
+
+
+def link_deltas(before, after, counts_field):
+    """{related id: delta} of the links under counts_field in two states."""
+    deltas = Counter()
+    for states, sign in ((before, -1), (after, 1)):
+        for state in states.values():
+            for related_id in (state or {}).get(counts_field, ()):
+                deltas[related_id] += sign
+    return deltas
+
+
+def recipes_changed(user_id, before, after):
+    """
+    Apply the change of recipes between two {id: state} snapshots, a
+    state holding price, time_min and the related ids under their counts
+    field, None or missing for a recipe that did not exist.
+    """
+    count = 0
+    price = Decimal(0)
+    histogram = Counter()
+    for states, sign in ((before, -1), (after, 1)):
+        for state in states.values():
+            if state is None:
+                continue
+            count += sign
+            price += sign * Decimal(str(state['price']))
+            histogram[time_bucket(state['time_min'])] += sign
+    related = {
+        field: link_deltas(before, after, field)
+        for field in ('tag_counts', 'ingredient_counts')
+    }
+
+    def change(stats):
+        stats.recipe_count += count
+        stats.price_total += price
+        for bucket, delta in histogram.items():
+            _add(stats.time_min_histogram, bucket, delta)
+        for field, deltas in related.items():
+            counts = getattr(stats, field)
+            for related_id, delta in deltas.items():
+                _add(counts, related_id, delta)
+
+    _update(user_id, change)
+
+
+def rebuild(user_id):
+    """Recompute the stats of a user from scratch."""
+    with transaction.atomic(using=router.db_for_write(RecipeStats)):
+        # Same lock as _update, so no delta is lost under the new row.
+        RecipeStats.objects.select_for_update().filter(
+            user_id=user_id
+        ).first()
+        return _rebuild(user_id)
+
+
+def _rebuild(user_id):
+    recipes = Recipe.objects.filter(user_id=user_id)
+    totals = recipes.aggregate(count=Count('id'), price=Sum('price'))
+    histogram = {}
+    for time_min in recipes.values_list('time_min', flat=True).iterator():
+        _add(histogram, time_bucket(time_min), 1)
+
+    counts = {}
+    for field, through, related in [
+        ('tag_counts', Recipe.tags.through, 'tag_id'),
+        ('ingredient_counts', Recipe.ingredients.through, 'ingredient_id'),
+    ]:
+        counts[field] = {
+            str(row[related]): row['count']
+            for row in through.objects.filter(
+                recipe__user_id=user_id
+            ).values(related).annotate(count=Count('id'))
+        }
+
+    stats, _ = RecipeStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'recipe_count': totals['count'],
+            'price_total': totals['price'] or 0,
+            'time_min_histogram': histogram,
+            **counts,
+        },
+    )
+    return stats
+
+
+def _top(counts, model):
+    top = sorted(counts.items(), key=lambda item: -item[1])[:TOP_COUNT]
+    names = dict(model.objects.filter(
+        id__in=[int(key) for key, _ in top]
+    ).values_list('id', 'name_ref__value'))
+    return [
+        {'id': int(key), 'name': names[int(key)], 'count': count}
+        for key, count in top if int(key) in names
+    ]
+
+
+def get_stats(user_id):
+    """Statistics of a user for the API, building them if needed."""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        stats = rebuild(user_id)
+
+    histogram = []
+    for i, lower in enumerate(TIME_MIN_BUCKETS):
+        upper = TIME_MIN_BUCKETS[i + 1] - 1 \
+            if i + 1 < len(TIME_MIN_BUCKETS) else None
+        histogram.append({
+            'min': lower,
+            'max': upper,
+            'count': stats.time_min_histogram.get(str(lower), 0),
+        })
+
+    average = None
+    if stats.recipe_count:
+        average = (stats.price_total / stats.recipe_count).quantize(
+            Decimal('0.01')
+        )
+    return {
+        'recipe_count': stats.recipe_count,
+        'average_price': average,
+        'time_min_histogram': histogram,
+        'top_tags': _top(stats.tag_counts, Tag),
+        'top_ingredients': _top(stats.ingredient_counts, Ingredient),
+    }
@@ -0,0 +1,60 @@
+"""
+Static files storage writing hashed names and precompressed variants.
+"""
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from core import compression
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml',
+    '.ico', '.eot', '.ttf', '.otf',
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes .gz and .br files next to every
+    compressible hashed file at collectstatic time, so nginx serves
+    them as they are instead of compressing on each request.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            # collectstatic never ran (tests, development server).
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        final_names = {}
+        processed = super().post_process(paths, dry_run=dry_run, **options)
+        for name, hashed_name, result in processed:
+            yield name, hashed_name, result
+            if isinstance(hashed_name, str):
+                # Later passes over CSS files yield their final name.
+                final_names[name] = hashed_name
+        if not dry_run:
+            for hashed_name in final_names.values():
+                self._compress(hashed_name)
+
+    def _compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < settings.STATIC_COMPRESSION_MIN_SIZE:
+            return
+
+        variants = {
+            '.gz': compression.gzip_compress(data, 9),
+            '.br': compression.brotli_compress(data, 11),
+        }
+        for suffix, compressed in variants.items():
+            # Only worth a file when it saves bytes on the wire.
+            if compressed is None or len(compressed) >= len(data):
+                continue
+            path = name + suffix
+            if self.exists(path):
+                self.delete(path)
+            self._save(path, ContentFile(compressed))
@@ -1,9 +1,16 @@
 """Test for DJango admin"""
-from django.test import TestCase
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import Client
 
+from core.models import Recipe, Tag
+from core.paginator import EstimatedCountPaginator, estimated_count
+
 
 class AdminSiteTests(TestCase):
 
@@ -40,3 +47,113 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+
+class LargeTableAdminTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='password1234',
+        )
+        self.client.force_login(self.admin_user)
+        self.tag = Tag.objects.create(user=self.admin_user, name='Vegan')
+        self.recipe = Recipe.objects.create(
+            user=self.admin_user, title='Soup', time_min=5,
+            price=Decimal('1.00'),
+        )
+        self.recipe.tags.add(self.tag)
+
+    def test_recipe_pages(self):
+        res = self.client.get(reverse('admin:core_recipe_changelist'))
+        self.assertContains(res, 'Soup')
+
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        # Autocomplete widgets only render the selected tags
+        self.assertContains(res, 'admin-autocomplete')
+        self.assertContains(res, 'Vegan')
+
+    def test_tag_search(self):
+        Tag.objects.create(user=self.admin_user, name='Spicy')
+        url = reverse('admin:core_tag_changelist')
+
+        res = self.client.get(url, {'q': 'veg'})
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Spicy')
+
+    def test_name_prefix_search_index(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'core_name',
+            )
+
+        self.assertIn('core_name_name_prefix_idx', constraints)
+        self.assertNotIn('core_name_value_prefix_idx', constraints)
+
+    def test_tag_rename(self):
+        url = reverse('admin:core_tag_change', args=[self.tag.id])
+
+        res = self.client.post(url, {
+            'user': self.admin_user.id, 'name': 'Vegetarian',
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(Tag.objects.get(id=self.tag.id).name, 'Vegetarian')
+
+    def test_autocomplete(self):
+        res = self.client.get(reverse('admin:autocomplete'), {
+            'term': 've',
+            'app_label': 'core',
+            'model_name': 'recipe',
+            'field_name': 'tags',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [item['text'] for item in res.json()['results']], ['Vegan'],
+        )
+
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='password1234',
+        )
+        for name in ['a', 'b', 'c']:
+            Tag.objects.create(user=self.user, name=name)
+
+    @patch('core.paginator.estimated_count', return_value=5000000)
+    @override_settings(ADMIN_ESTIMATED_COUNT_MIN=1000)
+    def test_estimate_for_large_table(self, patched_estimate):
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('id'), 100)
+
+        self.assertEqual(paginator.count, 5000000)
+        self.assertEqual(len(paginator.page(1).object_list), 3)
+
+    @patch('core.paginator.estimated_count', return_value=500)
+    @override_settings(ADMIN_ESTIMATED_COUNT_MIN=1000)
+    def test_small_table_is_counted(self, patched_estimate):
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('id'), 100)
+
+        self.assertEqual(paginator.count, 3)
+
+    @patch('core.paginator.estimated_count', return_value=5000000)
+    @override_settings(ADMIN_ESTIMATED_COUNT_MIN=1000)
+    def test_filtered_list_is_counted(self, patched_estimate):
+        paginator = EstimatedCountPaginator(
+            Tag.objects.filter(user=self.user).order_by('id'), 100,
+        )
+
+        self.assertEqual(paginator.count, 3)
+        patched_estimate.assert_not_called()
+
+    def test_no_estimate_outside_postgres(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('Postgres returns an estimate')
+        self.assertIsNone(estimated_count(Tag.objects.all()))
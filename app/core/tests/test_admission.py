@@ -0,0 +1,84 @@
+"""Tests for admission control and load shedding."""
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.admission import AdmissionLimiter
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class AdmissionLimiterTests(SimpleTestCase):
+
+    def test_rejects_when_queue_full(self):
+        limiter = AdmissionLimiter(limit=1, queue_size=0, timeout=1)
+
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+    def test_waiter_times_out(self):
+        limiter = AdmissionLimiter(limit=1, queue_size=1, timeout=0.05)
+        limiter.acquire()
+
+        start = time.monotonic()
+        self.assertFalse(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(limiter.waiting, 0)
+
+    def test_waiter_gets_released_slot(self):
+        limiter = AdmissionLimiter(limit=1, queue_size=1, timeout=5)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+
+        self.assertTrue(limiter.acquire())
+        self.assertEqual(limiter.active, 1)
+
+
+class AdmissionControlMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(ADMISSION_ROUTE_LIMITS={
+        'RecipeViewSet.list': {'limit': 0, 'queue': 0},
+    })
+    def test_saturated_route_returns_503(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+    @override_settings(ADMISSION_ROUTE_LIMITS={
+        'RecipeViewSet.list': {'limit': 0, 'queue': 0},
+    })
+    def test_other_routes_not_limited(self):
+        res = self.client.get(reverse('recipe:tag-list'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_request_too_old_is_shed(self):
+        started = time.time() - 60
+        res = self.client.get(
+            RECIPES_URL, HTTP_X_REQUEST_START=f't={started:.3f}'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_fresh_request_served(self):
+        res = self.client.get(
+            RECIPES_URL, HTTP_X_REQUEST_START=f't={time.time():.3f}'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,28 @@
+"""
+Tests for the autocomplete name index.
+"""
+from django.test import SimpleTestCase
+
+from core.autocomplete import NameIndex
+
+
+class NameIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = NameIndex([
+            (1, 'Salt', 2),
+            (2, 'salmon', 5),
+            (3, 'Sugar', 9),
+            (4, 'Saffron', 2),
+            (5, 'Émincé', 1),
+        ])
+
+    def test_prefix_case_insensitive_ranked_by_usage(self):
+        res = self.index.search('SA', 10)
+
+        self.assertEqual([item['id'] for item in res], [2, 4, 1])
+
+    def test_limit_and_no_match(self):
+        self.assertEqual(len(self.index.search('s', 2)), 2)
+        self.assertEqual(self.index.search('x', 5), [])
+        self.assertEqual(self.index.search('ém', 5)[0]['id'], 5)
@@ -1,11 +1,24 @@
 """
 Test Django management commands.
 """
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
+from django.contrib.auth import get_user_model
 from django.core.management import call_command  # mock calling the command
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase  # do not need migration -> simple test
+from django.test import LiveServerTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core.management.commands.replay_load import (
+    Replay, percentile, summarize,
+)
+from core import names, shards
+from core.models import Recipe, Tag
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -35,3 +48,220 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 7)
         patched_check.assert_called_with(databases=['default'])
+
+
+@override_settings(PASSWORD_HASH_POLICIES={'strong': 1000})
+class BulkCreateUsersTests(TestCase):
+    """Test the bulk_create_users command"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_create_users_from_csv(self):
+        path = self._write('users.csv', (
+            'email,password,name\n'
+            'one@EXAMPLE.com,pass1234,One\n'
+            'two@example.com,pass5678,Two\n'
+            'one@example.com,again123,Duplicate\n'
+        ))
+
+        call_command('bulk_create_users', path, workers=2, stdout=StringIO())
+
+        users = get_user_model().objects.order_by('email')
+        self.assertEqual([u.email for u in users],
+                         ['one@example.com', 'two@example.com'])
+        self.assertEqual(users[0].name, 'One')
+        self.assertTrue(users[0].check_password('pass1234'))
+        self.assertTrue(users[1].check_password('pass5678'))
+
+    def test_existing_emails_skipped_from_ndjson(self):
+        existing = get_user_model().objects.create_user(
+            'one@example.com', 'oldpass123'
+        )
+        path = self._write('users.ndjson', (
+            '{"email": "one@example.com", "password": "newpass123"}\n'
+            '{"email": "two@example.com", "password": "pass5678"}\n'
+        ))
+        out = StringIO()
+
+        call_command(
+            'bulk_create_users', path, workers=1, batch_size=1, stdout=out
+        )
+
+        existing.refresh_from_db()
+        self.assertTrue(existing.check_password('oldpass123'))
+        self.assertTrue(get_user_model().objects.filter(
+            email='two@example.com'
+        ).exists())
+        self.assertIn('Created 1 users, skipped 1.', out.getvalue())
+
+    def test_emails_created_meanwhile_reported_skipped(self):
+        path = self._write('users.ndjson', (
+            '{"email": "one@example.com", "password": "newpass123"}\n'
+            '{"email": "two@example.com", "password": "pass5678"}\n'
+        ))
+        out = StringIO()
+        assign = shards.assign
+
+        def assign_after_concurrent_insert(email):
+            if email == 'one@example.com':
+                get_user_model().objects.create_user(
+                    email, 'oldpass123', shard=shards.DEFAULT,
+                )
+            return assign(email)
+
+        with patch(
+            'core.shards.assign', side_effect=assign_after_concurrent_insert,
+        ):
+            call_command('bulk_create_users', path, workers=1, stdout=out)
+
+        self.assertIn('Created 1 users, skipped 1.', out.getvalue())
+        self.assertTrue(get_user_model().objects.get(
+            email='one@example.com',
+        ).check_password('oldpass123'))
+
+
+class MeasureStartupTests(SimpleTestCase):
+    """Test the measure_startup command"""
+
+    @patch(
+        'core.management.commands.measure_startup.Command.run_child'
+    )
+    def test_reports_cold_and_warm(self, patched_run_child):
+        patched_run_child.side_effect = lambda warm, token, paths: {
+            'load': 0.3,
+            'warmup': 0.2 if warm else 0.0,
+            'first': 0.01 if warm else 0.06,
+            'second': 0.002,
+        }
+        out = StringIO()
+
+        call_command('measure_startup', '--runs', '2', '/api/x/', stdout=out)
+
+        self.assertEqual(patched_run_child.call_count, 4)
+        patched_run_child.assert_called_with(True, '', ['/api/x/'])
+        self.assertIn('First request: 60.0 ms cold, 10.0 ms warm',
+                      out.getvalue())
+
+
+class ReplaySummaryTests(SimpleTestCase):
+    """Test the statistics of replay_load"""
+
+    def test_summarize(self):
+        results = [('A.list', 200, latency / 100) for latency in range(1, 11)]
+        results += [('A.create', 0, 1.0), ('A.create', 400, 0.5)]
+
+        summary = summarize(results, elapsed=2.0)
+
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(summary['A.list']['rps'], 5.0)
+        self.assertEqual(summary['A.list']['latency'][90], 0.09)
+        self.assertEqual(summary['A.create']['errors'], 1)
+        self.assertEqual(summary['A.create']['client_errors'], 1)
+
+    def test_deleted_ids_leave_pool(self):
+        replay = Replay('http://localhost:8000', '', 1.0)
+        replay.pools['recipe'] = [1, 2, 3]
+
+        method, target, _, _ = replay.build({
+            'method': 'DELETE', 'route': 'RecipeViewSet.destroy',
+            'path': '/api/recipe/recipes/{id}/',
+        })
+        replay.build({
+            'method': 'POST', 'route': 'RecipeViewSet.bulk_delete',
+            'path': '/api/recipe/recipes/bulk-delete/',
+            'body': {'size': 20, 'content_type': 'application/json',
+                     'fields': {'ids': 1}},
+        })
+
+        self.assertEqual(method, 'DELETE')
+        self.assertEqual(len(replay.pools['recipe']), 1)
+        self.assertNotIn(
+            f'/{replay.pools["recipe"][0]}/', target,
+        )
+
+    def test_cursor_follows_next_page(self):
+        first = {'method': 'GET', 'route': 'RecipeViewSet.list',
+                 'path': '/api/recipe/recipes/', 'query': {'limit': '2'}}
+        following = dict(first, query={'limit': '2', 'cursor': True})
+        replay = Replay('http://localhost:8000', '', 1.0)
+
+        self.assertEqual(
+            replay.build(following)[1], '/api/recipe/recipes/?limit=2',
+        )
+        replay._follow(first, json.dumps({
+            'next': 'http://testserver/api/recipe/recipes/?cursor=xy&limit=2',
+            'results': [],
+        }).encode())
+        self.assertEqual(
+            replay.build(following)[1],
+            '/api/recipe/recipes/?cursor=xy&limit=2',
+        )
+
+
+class ReplayLoadTests(LiveServerTestCase):
+    """Test the replay_load command against a live server"""
+
+    def setUp(self):
+        # Name rows cached by an earlier test are flushed.
+        names.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Dinner')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_min=30, price='4.50',
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replays_recording(self):
+        entries = [
+            {'t': 100.0, 'method': 'GET', 'route': 'RecipeViewSet.list',
+             'path': '/api/recipe/recipes/', 'query': {'tags': 1}},
+            {'t': 100.01, 'method': 'POST', 'route': 'RecipeViewSet.create',
+             'path': '/api/recipe/recipes/', 'query': {},
+             'body': {'size': 90, 'content_type': 'application/json',
+                      'fields': {'title': None, 'time_min': None,
+                                 'price': None, 'tags': 2}}},
+            {'t': 100.02, 'method': 'POST',
+             'route': 'RecipeViewSet.upload_image',
+             'path': '/api/recipe/recipes/{id}/upload-image/', 'query': {},
+             'body': {'size': 2000,
+                      'content_type': 'multipart/form-data'}},
+            {'t': 100.03, 'method': 'DELETE',
+             'route': 'RecipeViewSet.destroy',
+             'path': '/api/recipe/recipes/{id}/', 'query': {}},
+        ]
+        path = os.path.join(self.tmp_dir.name, 'requests_1.jsonl')
+        with open(path, 'w') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        out = StringIO()
+
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            call_command(
+                'replay_load', self.tmp_dir.name, url=self.live_server_url,
+                token=self.token.key, speed=10, concurrency=1, stdout=out,
+            )
+
+        output = out.getvalue()
+        for route in ('RecipeViewSet.list', 'RecipeViewSet.create',
+                      'RecipeViewSet.upload_image'):
+            self.assertIn(route, output)
+        self.assertIn('4 requests', output)
+        self.assertIn('0 errors', output)
+        # The recipe created by the replay is the one deleted.
+        self.assertEqual(list(Recipe.objects.all()), [self.recipe])
+        self.assertTrue(Recipe.objects.get().image)
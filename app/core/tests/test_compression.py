@@ -0,0 +1,87 @@
+"""
+Tests for response compression and precompressed static files.
+"""
+import gzip
+import os
+import tempfile
+import unittest
+
+from django.core.management import call_command
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import compression
+from core.middleware import CompressionMiddleware
+
+BIG = {'items': [{'id': i, 'name': f'Item {i}'} for i in range(200)]}
+
+
+@override_settings(API_COMPRESSION_MIN_SIZE=1024, API_COMPRESSION_LEVEL=5)
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def get(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get(
+            '/api/', HTTP_ACCEPT_ENCODING=accept_encoding,
+        )
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_large_json_gzipped(self):
+        original = JsonResponse(BIG).content
+        response = self.get(JsonResponse(BIG))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), original)
+        self.assertEqual(
+            response['Content-Length'], str(len(response.content)),
+        )
+
+    def test_small_response_unchanged(self):
+        response = self.get(JsonResponse({'id': 1}))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoding_not_accepted(self):
+        for accept_encoding in ('', 'identity', 'gzip;q=0'):
+            response = self.get(JsonResponse(BIG), accept_encoding)
+
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_binary_content_unchanged(self):
+        response = self.get(
+            HttpResponse(b'\x89PNG' * 1000, content_type='image/png'),
+        )
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @unittest.skipIf(compression.brotli is None, 'brotli not installed')
+    def test_brotli_preferred(self):
+        response = self.get(JsonResponse(BIG), 'gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(
+            compression.brotli.decompress(response.content),
+            JsonResponse(BIG).content,
+        )
+
+
+class CompressedStaticFilesTests(SimpleTestCase):
+
+    def test_collectstatic_writes_hashed_and_gzip_files(self):
+        with tempfile.TemporaryDirectory() as static_root, \
+                override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+            css_dir = os.path.join(static_root, 'admin', 'css')
+            names = os.listdir(css_dir)
+            hashed = [
+                name for name in names
+                if name.startswith('base.') and name.endswith('.css')
+                and name != 'base.css'
+            ]
+            self.assertEqual(len(hashed), 1)
+            self.assertIn(hashed[0] + '.gz', names)
+            with open(os.path.join(css_dir, hashed[0]), 'rb') as f:
+                original = f.read()
+            with gzip.open(os.path.join(css_dir, hashed[0] + '.gz')) as f:
+                self.assertEqual(f.read(), original)
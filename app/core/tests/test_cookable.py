@@ -0,0 +1,94 @@
+"""Tests for the ingredient inverted index."""
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from core import cookable, generations
+from core.models import Recipe, Ingredient
+
+
+class IngredientIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        # recipe id -> ingredient ids
+        self.recipes = {
+            1: [10, 11],
+            2: [10, 11, 12, 13],
+            3: [10, 12, 13],
+            4: [14],
+            5: [],
+        }
+        links = [
+            (recipe_id, ingredient_id)
+            for recipe_id, ingredients in self.recipes.items()
+            for ingredient_id in ingredients
+        ]
+        self.index = cookable.IngredientIndex(list(self.recipes), links)
+
+    def test_ranked_by_coverage(self):
+        results = self.index.query([10, 11, 12], limit=10)
+
+        self.assertEqual(results, [
+            (1, 2, 2),  # fully cookable
+            (2, 3, 4),
+            (3, 2, 3),
+        ])
+
+    def test_matches_brute_force(self):
+        have = {10, 12, 13, 14}
+        expected = sorted(
+            (
+                (len(have & set(ings)) / len(ings), len(ings), recipe_id)
+                for recipe_id, ings in self.recipes.items()
+                if ings and have & set(ings)
+            ),
+            key=lambda row: (-row[0], -row[1], -row[2]),
+        )
+
+        results = self.index.query(have, limit=10)
+
+        self.assertEqual(
+            [recipe_id for recipe_id, _, _ in results],
+            [recipe_id for _, _, recipe_id in expected],
+        )
+
+    def test_limit_and_unknown_ingredients(self):
+        self.assertEqual(len(self.index.query([10], limit=2)), 2)
+        self.assertEqual(self.index.query([99], limit=10), [])
+
+
+class IndexCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Rice',
+            time_min=10,
+            price=Decimal('1.00'),
+        )
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+
+    def test_index_rebuilt_after_ingredient_change(self):
+        index = cookable.get_index(self.user.id)
+        self.assertIs(cookable.get_index(self.user.id), index)
+        self.assertEqual(index.query([self.rice.id], 10), [])
+
+        self.recipe.ingredients.add(self.rice)
+
+        index = cookable.get_index(self.user.id)
+        self.assertEqual(
+            index.query([self.rice.id], 10), [(self.recipe.id, 1, 1)]
+        )
+
+    def test_lru_bound(self):
+        cache = generations.GenerationCache(max_size=1)
+        cache.put(1, 0, cookable.IngredientIndex([], []))
+        cache.put(2, 0, cookable.IngredientIndex([], []))
+
+        self.assertIsNone(cache.get(1, 0))
+        self.assertIsNotNone(cache.get(2, 0))
+        self.assertIsNone(cache.get(2, 1))
@@ -0,0 +1,116 @@
+"""Tests for the denormalized recipe counters."""
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core import signals
+from core.models import Recipe, Tag, Ingredient
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample title',
+        'time_min': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+
+    def assertCounts(self, tag_count, ingredient_count):
+        self.tag.refresh_from_db()
+        self.ingredient.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, tag_count)
+        self.assertEqual(self.ingredient.recipe_count, ingredient_count)
+
+    def test_add_remove_clear(self):
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+
+        recipe1.tags.add(self.tag)
+        recipe1.tags.add(self.tag)  # already linked, not counted twice
+        recipe2.tags.add(self.tag)
+        recipe1.ingredients.add(self.ingredient)
+        self.assertCounts(2, 1)
+
+        recipe1.tags.remove(self.tag)
+        recipe1.tags.remove(self.tag)  # not linked anymore
+        self.assertCounts(1, 1)
+
+        recipe1.ingredients.clear()
+        self.assertCounts(1, 0)
+
+    def test_reverse_side(self):
+        recipes = [create_recipe(self.user) for _ in range(3)]
+
+        self.tag.recipe_set.add(*recipes)
+        self.assertCounts(3, 0)
+
+        self.tag.recipe_set.remove(recipes[0])
+        self.assertCounts(2, 0)
+
+        self.tag.recipe_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_recipe_delete(self):
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+
+        recipe.delete()
+
+        self.assertCounts(0, 0)
+
+    def test_deferred_bulk_changes_recounted(self):
+        recipe = create_recipe(self.user)
+
+        with signals.deferred(self.user.id):
+            Recipe.tags.through.objects.create(recipe=recipe, tag=self.tag)
+            recipe.clone(2)
+
+        self.assertCounts(3, 0)
+
+    def test_deferred_declared_recipes_adjusted(self):
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag)
+        other = Tag.objects.create(user=self.user, name='Quick')
+        Tag.objects.filter(id=other.id).update(recipe_count=7)
+
+        with signals.deferred(self.user.id, [recipe.id]) as created:
+            Recipe.tags.through.objects.filter(recipe=recipe).delete()
+            Recipe.ingredients.through.objects.create(
+                recipe=recipe, ingredient=self.ingredient,
+            )
+            created.update(copy.id for copy in recipe.clone(2))
+
+        self.assertCounts(0, 3)
+        # Tags the block did not touch are not recounted.
+        other.refresh_from_db()
+        self.assertEqual(other.recipe_count, 7)
+
+    def test_reconcile_command(self):
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag)
+        Tag.objects.filter(id=self.tag.id).update(recipe_count=7)
+        out = StringIO()
+
+        call_command('reconcile_recipe_counts', dry_run=True, stdout=out)
+        self.assertIn('Tag: 1 drifted counters found.', out.getvalue())
+        self.assertCounts(7, 0)
+
+        call_command('reconcile_recipe_counts', batch_size=1, stdout=out)
+        self.assertCounts(1, 0)
@@ -0,0 +1,75 @@
+"""Tests for the password hashing policy."""
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+POLICIES = {'strong': 2000, 'fast': 1000}
+
+
+def iterations_of(user):
+    return get_hasher().decode(user.password)['iterations']
+
+
+@override_settings(PASSWORD_HASH_POLICIES=POLICIES)
+class HashPolicyTests(TestCase):
+
+    @override_settings(PASSWORD_HASH_POLICY='strong')
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+
+    def test_hash_uses_policy_iterations(self):
+        self.assertEqual(iterations_of(self.user), POLICIES['strong'])
+
+    @override_settings(PASSWORD_HASH_POLICY='fast')
+    def test_downgrade_on_login(self):
+        user = authenticate(username='user@example.com', password='pass1234')
+
+        user.refresh_from_db()
+        self.assertEqual(iterations_of(user), POLICIES['fast'])
+        self.assertTrue(user.check_password('pass1234'))
+
+    @override_settings(PASSWORD_HASH_POLICY='fast')
+    def test_failed_login_keeps_hash(self):
+        password = self.user.password
+        user = authenticate(username='user@example.com', password='wrong')
+
+        self.assertIsNone(user)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, password)
+
+    @override_settings(PASSWORD_HASH_POLICY='strong')
+    def test_unknown_email_runs_one_hash(self):
+        authenticate(username='unknown@example.com', password='pass1234')
+
+        hasher_class = type(get_hasher())
+        with patch.object(
+            hasher_class, 'encode', autospec=True,
+            side_effect=hasher_class.encode,
+        ) as encode:
+            user = authenticate(
+                username='unknown@example.com',
+                password='pass1234',
+            )
+
+        self.assertIsNone(user)
+        encode.assert_called_once()
+        self.assertEqual(encode.call_args[0][3], POLICIES['strong'])
+
+    def test_bench_logins_command(self):
+        out = StringIO()
+        call_command('bench_logins', logins=1, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('strong', output)
+        self.assertIn('fast', output)
+        self.assertFalse(
+            get_user_model().objects.filter(
+                email='bench-login@example.com'
+            ).exists()
+        )
@@ -0,0 +1,141 @@
+"""Tests for the multi-process metrics store and endpoint."""
+import os
+import subprocess
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('api-metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class MmapedDictTests(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(METRICS_DIR=self.tmp_dir.name)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmp_dir.cleanup()
+
+    def test_values_survive_reopen_and_growth(self):
+        path = os.path.join(self.tmp_dir.name, 'metrics_1.db')
+        store = metrics.MmapedDict(path)
+        keys = [f'key-{i}' * 10 for i in range(2000)]
+        for key in keys:
+            store.inc(key, 2)
+        store.inc(keys[0], 0.5)
+        store.close()
+
+        reopened = metrics.MmapedDict(path)
+        values = reopened.read_all()
+        reopened.close()
+
+        self.assertEqual(len(values), len(keys))
+        self.assertEqual(values[keys[0]], 2.5)
+        self.assertEqual(values[keys[-1]], 2)
+
+    def test_collect_sums_worker_files(self):
+        """Samples written by different workers are added up."""
+        for pid, amount in [(1, 3), (2, 4)]:
+            path = os.path.join(self.tmp_dir.name, f'metrics_{pid}.db')
+            store = metrics.MmapedDict(path)
+            store.inc(metrics._key(
+                'api_requests_total', 'api_requests_total', {'view': 'V'}
+            ), amount)
+            store.close()
+
+        output = metrics.render()
+
+        self.assertIn('# TYPE api_requests_total counter', output)
+        self.assertIn('api_requests_total{view="V"} 7.0', output)
+
+    def test_files_of_exited_workers_merged(self):
+        key = metrics._key(
+            'api_requests_total', 'api_requests_total', {'view': 'V'}
+        )
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        for pid in (exited.pid, os.getpid()):
+            path = os.path.join(self.tmp_dir.name, f'metrics_{pid}.db')
+            store = metrics.MmapedDict(path)
+            store.inc(key, 2)
+            store.close()
+
+        self.assertEqual(metrics.collect(), {key: 4})
+        self.assertEqual(metrics.collect(), {key: 4})
+        self.assertEqual({
+            name for name in os.listdir(self.tmp_dir.name)
+            if name.endswith('.db')
+        }, {metrics.AGGREGATE_FILE, f'metrics_{os.getpid()}.db'})
+
+
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(METRICS_DIR=self.tmp_dir.name)
+        self.override.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmp_dir.cleanup()
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_token_or_staff_required(self):
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer wrong-token',
+        )
+        self.assertEqual(res.status_code, 403)
+
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper-token',
+        )
+        self.assertEqual(res.status_code, 200)
+
+        staff = get_user_model().objects.create_superuser(
+            'admin@example.com', 'pass1234',
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_request_recorded_by_viewset_action(self):
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper-token',
+        )
+        output = res.content.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'api_requests_total{action="list",method="GET",'
+            'status="200",view="RecipeViewSet"} 1.0',
+            output,
+        )
+        self.assertIn(
+            'api_request_duration_seconds_count{action="list",'
+            'view="RecipeViewSet"} 1.0',
+            output,
+        )
+        self.assertIn(
+            'api_request_duration_seconds_bucket{action="list",'
+            'le="+Inf",view="RecipeViewSet"} 1.0',
+            output,
+        )
+        self.assertIn('api_db_queries_total{action="list"', output)
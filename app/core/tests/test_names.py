@@ -0,0 +1,62 @@
+"""
+Tests for the shared name dictionary.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core import names
+from core.models import Name, Tag, Ingredient
+
+
+class NameDictionaryTests(TestCase):
+
+    def setUp(self):
+        names.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234',
+        )
+        self.user2 = get_user_model().objects.create_user(
+            'other@example.com', 'pass1234',
+        )
+
+    def tearDown(self):
+        names.clear()
+
+    def test_rows_share_names(self):
+        tag = Tag.objects.create(user=self.user, name='Salt')
+        Tag.objects.create(user=self.user2, name='Salt')
+        Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='salt')
+
+        self.assertEqual(Name.objects.count(), 2)
+        self.assertEqual(Tag.objects.get(id=tag.id).name, 'Salt')
+        self.assertEqual(
+            list(Ingredient.objects.order_by('name').values_list(
+                'name_ref__value', flat=True,
+            )),
+            ['Salt', 'salt'],
+        )
+
+    def test_rename(self):
+        tag = Tag.objects.create(user=self.user, name='Salt')
+        tag.name = 'Pepper'
+        tag.save()
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Pepper')
+        self.assertTrue(Tag.objects.filter(name='Pepper').exists())
+
+    def test_intern_cache_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            name_ids = names.intern_many(['Salt', 'Onion'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(names.intern_many(['Onion', 'Salt']), name_ids)
+            self.assertEqual(names.value_of(name_ids['Salt']), 'Salt')
+
+    def test_intern_not_cached_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            names.intern('Salt')
+
+        with self.assertNumQueries(1):
+            names.intern('Salt')
@@ -0,0 +1,107 @@
+"""Tests for the duplicate query detector."""
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from core.models import Tag
+from core import querycheck
+
+N_PLUS_ONE_URL = '/n-plus-one/'
+
+
+def n_plus_one(request):
+    """Load the tags one by one after listing their ids."""
+    ids = Tag.objects.values_list('id', flat=True)
+    return JsonResponse({
+        'names': [Tag.objects.get(id=tag_id).name for tag_id in ids],
+    })
+
+
+urlpatterns = [path('n-plus-one/', n_plus_one)]
+
+
+class FingerprintTests(TestCase):
+
+    def test_literals_and_in_lists_are_folded(self):
+        shape1 = querycheck.fingerprint(
+            "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"
+        )
+        shape2 = querycheck.fingerprint(
+            'SELECT  *  FROM t WHERE id IN (%s) AND name = %s'
+        )
+
+        self.assertEqual(shape1, shape2)
+        self.assertEqual(
+            shape1, 'SELECT * FROM t WHERE id IN (...) AND name = ?'
+        )
+
+
+class QueryTrackerTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+
+    def test_repeated_shape_reported_with_stack(self):
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(4)
+        ]
+        with querycheck.QueryTracker(threshold=3) as tracker:
+            for tag in tags:
+                Tag.objects.get(id=tag.id)
+
+        offenders = tracker.offenders()
+        self.assertEqual(len(offenders), 1)
+        shape, count, stack = offenders[0]
+        self.assertEqual(count, 4)
+        self.assertIn('test_querycheck.py', stack)
+
+    def test_under_threshold_not_reported(self):
+        with querycheck.QueryTracker(threshold=3) as tracker:
+            for _ in range(3):
+                Tag.objects.filter(user=self.user).exists()
+
+        self.assertEqual(tracker.offenders(), [])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class QueryCheckMiddlewareTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        for name in ('Thai', 'Dinner', 'Hot'):
+            Tag.objects.create(user=user, name=name)
+
+    @override_settings(
+        QUERY_CHECK_ENABLED=True,
+        QUERY_CHECK_RAISE=True,
+        QUERY_CHECK_THRESHOLD=2,
+    )
+    def test_raise_mode(self):
+        with self.assertRaises(querycheck.DuplicateQueryError):
+            self.client.get(N_PLUS_ONE_URL)
+
+    @override_settings(
+        QUERY_CHECK_ENABLED=True,
+        QUERY_CHECK_RAISE=False,
+        QUERY_CHECK_THRESHOLD=2,
+    )
+    def test_flag_mode(self):
+        with self.assertLogs('core.middleware', level='WARNING'):
+            res = self.client.get(N_PLUS_ONE_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(int(res['X-Duplicate-Queries']), 1)
+
+    def test_disabled_by_default(self):
+        res = self.client.get(N_PLUS_ONE_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(res.has_header('X-Duplicate-Queries'))
@@ -0,0 +1,78 @@
+"""Tests for the recording of request shapes."""
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import recording
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class SanitizeTests(SimpleTestCase):
+
+    def test_ids_removed_from_path(self):
+        self.assertEqual(
+            recording.sanitize_path('/api/recipe/recipes/42/upload-image/'),
+            '/api/recipe/recipes/{id}/upload-image/',
+        )
+
+    def test_query_shape(self):
+        query = QueryDict(
+            'tags=1,2,3&q=chick&assigned_only=1&cursor=abc&email=a@b.c'
+        )
+
+        self.assertEqual(recording.sanitize_query(query), {
+            'tags': 3, 'q': 5, 'assigned_only': '1', 'cursor': True,
+        })
+
+
+class RecordingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_disabled_by_default(self):
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(recording.load([self.tmp_dir.name]), [])
+
+    def test_records_request_shapes(self):
+        with override_settings(REQUEST_RECORDING_DIR=self.tmp_dir.name):
+            self.client.get(RECIPES_URL, {'tags': '4,5'})
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Secret family curry',
+                'time_min': 30,
+                'price': Decimal('4.50'),
+                'tags': [{'name': 'Dinner'}],
+            }, format='json')
+            self.client.get(
+                reverse('recipe:recipe-detail', args=[res.data['id']])
+            )
+
+        listed, created, detail = recording.load([self.tmp_dir.name])
+        self.assertEqual(listed['route'], 'RecipeViewSet.list')
+        self.assertEqual(listed['query'], {'tags': 2})
+        self.assertNotIn('body', listed)
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(created['body']['content_type'], 'application/json')
+        self.assertEqual(created['body']['fields'], {
+            'title': None, 'time_min': None, 'price': None, 'tags': 1,
+        })
+        self.assertEqual(detail['path'], '/api/recipe/recipes/{id}/')
+        self.assertNotIn('Secret', str(created))
+        self.assertTrue(Recipe.objects.exists())
@@ -0,0 +1,104 @@
+"""
+Tests for the precomputed OpenAPI schema.
+"""
+import gzip
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            SCHEMA_CACHE_DIR=self.tmp.name, CODE_VERSION='v1',
+        )
+        self.settings.enable()
+        schema.clear()
+        self.client = APIClient()
+
+    def tearDown(self):
+        schema.clear()
+        self.settings.disable()
+        self.tmp.cleanup()
+
+    def test_schema_has_strong_etag(self):
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn(b'/api/recipe/recipes/', res.content)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmp.name, 'schema-v1.yaml'))
+        )
+
+    def test_not_modified(self):
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(res.status_code, 200)
+
+    def test_json_format(self):
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('paths', json.loads(res.content))
+
+    def test_precompressed(self):
+        plain = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertNotEqual(res['ETag'], plain['ETag'])
+        self.assertFalse(res['ETag'].startswith('W/'))
+
+    def test_served_from_disk(self):
+        path = os.path.join(self.tmp.name, 'schema-v1.yaml')
+        os.makedirs(self.tmp.name, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'openapi: 3.0.3\n')
+
+        res = self.client.get(SCHEMA_URL)
+        self.assertEqual(res.content, b'openapi: 3.0.3\n')
+
+    def test_code_version_change_regenerates(self):
+        etag = self.client.get(SCHEMA_URL)['ETag']
+        path = os.path.join(self.tmp.name, 'schema-v1.yaml')
+        with open(path, 'wb') as f:
+            f.write(b'openapi: 3.0.3\n')
+
+        with override_settings(CODE_VERSION='v2'):
+            res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmp.name, 'schema-v2.yaml'))
+        )
+
+    def test_build_schema_command(self):
+        stale = os.path.join(self.tmp.name, 'schema-v0.yaml')
+        with open(stale, 'wb') as f:
+            f.write(b'')
+
+        call_command('build_schema', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)),
+            ['schema-v1.json', 'schema-v1.yaml'],
+        )
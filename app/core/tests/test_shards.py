@@ -0,0 +1,187 @@
+"""
+Tests for the routing of user data across shards.
+
+The end to end tests need at least one database besides the default
+one, run them with --settings=app.settings_shards or DB_SHARDS set.
+"""
+import unittest
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import router
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import shards
+from core.models import Change, Name, Recipe, Tag, User
+from core.querycheck import QueryCheckMixin
+
+RECIPES_URL = reverse('recipe:recipe-list')
+CHANGES_URL = reverse('recipe:changes')
+
+SHARD = settings.SHARDS[-1]
+sharded = unittest.skipUnless(
+    len(settings.SHARDS) > 1, 'needs a database besides the default one',
+)
+
+
+class ShardRoutingTests(SimpleTestCase):
+
+    @override_settings(SHARDS=['default', 'shard1', 'shard2'])
+    def test_assign_is_stable(self):
+        emails = [f'user{i}@example.com' for i in range(60)]
+
+        placed = [shards.assign(email) for email in emails]
+
+        self.assertEqual(placed, [shards.assign(email) for email in emails])
+        self.assertEqual(set(placed), {'default', 'shard1', 'shard2'})
+        self.assertEqual(
+            shards.assign('User0@Example.com'), placed[0],
+        )
+
+    def test_router_uses_active_shard(self):
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+        with shards.using('shard1'):
+            self.assertEqual(router.db_for_read(Recipe), 'shard1')
+            self.assertEqual(router.db_for_write(Name), 'shard1')
+            with shards.using('shard2'):
+                self.assertEqual(router.db_for_read(Tag), 'shard2')
+            self.assertEqual(router.db_for_read(Tag), 'shard1')
+            self.assertEqual(router.db_for_read(User), 'default')
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_router_follows_instance(self):
+        user = User(email='user@example.com', shard='shard1')
+        recipe = Recipe()
+        recipe._state.db = 'shard2'
+
+        self.assertEqual(
+            router.db_for_write(Recipe, instance=user), 'shard1',
+        )
+        self.assertEqual(
+            router.db_for_write(Recipe, instance=recipe), 'shard2',
+        )
+        self.assertTrue(router.allow_relation(recipe, user))
+
+
+class ShardLockTests(QueryCheckMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234',
+            shard=shards.DEFAULT, shard_locked=True,
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(ADMISSION_RETRY_AFTER=3)
+    def test_writes_refused_while_moving(self):
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Curry', 'time_min': 30, 'price': Decimal('4.50'),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '3')
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_reads_allowed_while_moving(self):
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@sharded
+class ShardedDataTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234', shard=SHARD,
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title, tags=()):
+        res = self.client.post(RECIPES_URL, {
+            'title': title,
+            'time_min': 30,
+            'price': Decimal('4.50'),
+            'tags': [{'name': name} for name in tags],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def test_data_stored_in_user_shard(self):
+        recipe_id = self.create_recipe('Curry', tags=['Dinner'])
+
+        self.assertTrue(
+            User._base_manager.using(SHARD).filter(pk=self.user.pk).exists()
+        )
+        self.assertTrue(
+            Recipe.objects.using(SHARD).filter(id=recipe_id).exists()
+        )
+        self.assertFalse(Recipe.objects.using('default').exists())
+        self.assertGreaterEqual(
+            recipe_id, settings.SHARDS.index(SHARD) * shards.ID_RANGE,
+        )
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual([r['id'] for r in res.data], [recipe_id])
+
+    def test_email_of_moved_away_user_reused(self):
+        res = self.client.patch(
+            reverse('user:me'), {'email': 'new@example.com'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        other = get_user_model().objects.create_user(
+            'user@example.com', 'pass1234', shard=SHARD,
+        )
+        self.client.force_authenticate(other)
+
+        self.create_recipe('Curry')
+
+        self.assertEqual(
+            User._base_manager.using(SHARD).get(pk=other.pk).email,
+            shards.mirror_email(other.pk),
+        )
+
+    def test_user_deletion_removes_shard_data(self):
+        self.create_recipe('Curry')
+
+        self.user.delete()
+
+        self.assertFalse(Recipe.objects.using(SHARD).exists())
+        self.assertFalse(User._base_manager.using(SHARD).exists())
+
+    def test_migrate_user(self):
+        kept = self.create_recipe('Curry', tags=['Dinner'])
+        gone = self.create_recipe('Soup', tags=['Lunch'])
+        self.client.delete(reverse('recipe:recipe-detail', args=[gone]))
+        before = self.client.get(CHANGES_URL, {'since': 0}).data
+
+        call_command(
+            'migrate_user', self.user.email, 'default', drain=0,
+            stdout=StringIO(),
+        )
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, 'default')
+        self.assertFalse(self.user.shard_locked)
+        self.assertFalse(Recipe.objects.using(SHARD).exists())
+        self.assertFalse(Change.objects.using(SHARD).exists())
+        self.client.force_authenticate(self.user)
+        after = self.client.get(CHANGES_URL, {'since': 0}).data
+        self.assertEqual(after, before)
+        self.assertEqual(after['recipes'][0]['id'], kept)
+        self.assertEqual(after['deleted']['recipes'], [gone])
+
+        moved = self.create_recipe('Stew', tags=['Dinner'])
+        delta = self.client.get(
+            CHANGES_URL, {'since': after['cursor']},
+        ).data
+        self.assertEqual([r['id'] for r in delta['recipes']], [moved])
@@ -0,0 +1,36 @@
+"""
+Tests for MinHash signatures.
+"""
+from django.test import SimpleTestCase
+
+from core import similarity
+
+
+class SignatureTests(SimpleTestCase):
+
+    def test_estimates_jaccard(self):
+        signatures = similarity.signatures({
+            'a': range(0, 200),
+            'b': range(100, 300),
+            'c': range(1000, 1200),
+        })
+
+        # Jaccard of a and b is 1/3.
+        estimate = similarity.similarity(signatures['a'], signatures['b'])
+        self.assertAlmostEqual(estimate, 1 / 3, delta=0.15)
+        self.assertLess(
+            similarity.similarity(signatures['a'], signatures['c']), 0.1,
+        )
+
+    def test_equal_sets_share_every_bucket(self):
+        signatures = similarity.signatures({'a': [3, 1, 2], 'b': [1, 2, 3]})
+
+        self.assertEqual(
+            similarity.buckets(signatures['a']),
+            similarity.buckets(signatures['b']),
+        )
+        self.assertEqual(len(similarity.buckets(signatures['a'])),
+                         similarity.BANDS)
+
+    def test_empty_set_has_no_signature(self):
+        self.assertEqual(similarity.signatures({'a': []}), {})
@@ -0,0 +1,32 @@
+"""
+Tests for the WSGI warmup.
+"""
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from core import warmup
+
+
+class WarmupTests(SimpleTestCase):
+
+    @patch('core.warmup.connections')
+    @patch('core.warmup.schema.get')
+    def test_preload(self, patched_get, patched_connections):
+        warmup.preload()
+
+        self.assertEqual(
+            [call.args[0] for call in patched_get.call_args_list],
+            ['yaml', 'json'],
+        )
+        patched_connections.close_all.assert_called_once_with()
+
+    @patch('core.warmup.connections')
+    def test_prime_worker_survives_unreachable_database(
+            self, patched_connections):
+        connection = MagicMock(alias='default')
+        connection.ensure_connection.side_effect = Exception
+        patched_connections.all.return_value = [connection]
+
+        with self.assertLogs('core.warmup', 'WARNING'):
+            warmup.prime_worker()
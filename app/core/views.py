@@ -0,0 +1,83 @@
+"""
+Views for operational endpoints.
+"""
+import hmac
+
+from django.conf import settings
+from django.http import (
+    HttpResponse, HttpResponseForbidden, HttpResponseNotModified,
+)
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from core import compression, metrics, schema
+
+
+def _metrics_allowed(request):
+    """Staff users, or scrapers sending "Authorization: Bearer <token>"."""
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.META.get(
+        'HTTP_AUTHORIZATION', '',
+    ).partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(
+        credentials.encode(), token.encode(),
+    ):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """Expose the metrics of all workers in Prometheus text format."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _etag_matches(etag, if_none_match):
+    """Weak comparison, as required for If-None-Match."""
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in map(_strip_weak, etags)
+
+
+class SchemaView(SpectacularAPIView):
+    """
+    OpenAPI schema generated once per code version and served with a
+    strong ETag, answering 304 when the client already has it.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        accepted = compression.accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        variants = schema.get(renderer.format)
+        encoding = next(
+            (name for name in ('br', 'gzip')
+             if name in accepted and name in variants),
+            'identity',
+        )
+        body, etag = variants[encoding]
+
+        if _etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type += f'; charset={renderer.charset}'
+            response = HttpResponse(body, content_type=content_type)
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
@@ -0,0 +1,57 @@
+"""
+Warmup of the WSGI application.
+
+preload() runs when app.wsgi is imported. Under uwsgi without
+--lazy-apps that happens once in the master, so the URLconf, the view
+and serializer modules they import and the OpenAPI schema are loaded
+and built before the fork and shared copy-on-write by every worker.
+Serializer fields are not built ahead: they are built per serializer
+instance, so nothing built here would reach the requests.
+
+prime_worker() runs in each worker after the fork, before it accepts
+requests. Database connections belong to a thread, so it only connects
+the thread running the postfork hooks and checks the databases are
+reachable; the other request threads of a threaded worker connect on
+their first request and then keep their connection for CONN_MAX_AGE
+seconds.
+"""
+import logging
+
+from django.db import connections
+from django.urls import get_resolver
+
+from core import schema
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """Import and build the state every worker would build on its own."""
+    resolver = get_resolver()
+    # Compiles the patterns and imports every view module.
+    resolver.reverse_dict
+
+    from PIL import Image
+    Image.init()
+
+    for fmt in schema.RENDERERS:
+        schema.get(fmt)
+
+    # A connection opened here would be shared by the forked workers.
+    connections.close_all()
+
+
+def prime_worker():
+    """
+    Connect the current thread to every database, logging the ones that
+    are not reachable. The connections outlive the first request only
+    with CONN_MAX_AGE set.
+    """
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+        except Exception:
+            logger.warning(
+                'Database %s is not reachable at warmup', connection.alias,
+                exc_info=True,
+            )
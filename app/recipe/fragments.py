@@ -0,0 +1,116 @@
+"""
+Cache of serialized recipes.
+
+The representation of a recipe is stored under its id and the sequence
+of its latest Change row, which saving or deleting the recipe, changing
+its tags or ingredients (m2m_changed) and renaming one of them all move
+forward (see core.signals). The versions are read before the recipes
+that missed are loaded again to be rendered, so a fragment is never
+older than the version in its key; old ones age out of the cache.
+
+Lists fetch all their fragments with one get_many and only reload,
+render and prefetch the tags and ingredients of the recipes that missed.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+
+from core import changes, metrics, schema
+from core.models import Change, Recipe
+
+PREFETCH = ('tags', 'ingredients')
+
+
+def _cache():
+    return caches[settings.RECIPE_FRAGMENT_CACHE]
+
+
+def _enabled(serializer):
+    """Only reads are cached, writes record their change at the end."""
+    request = serializer.context.get('request')
+    return (
+        settings.RECIPE_FRAGMENT_CACHE_ENABLED and request is not None and
+        request.method in ('GET', 'HEAD')
+    )
+
+
+def _labels(serializer):
+    view = serializer.context.get('view')
+    return {
+        'view': type(view).__name__ if view is not None else 'none',
+        'action': getattr(view, 'action', None) or 'none',
+    }
+
+
+def versions(recipes):
+    """Current change sequence of each recipe, by id."""
+    by_user = {}
+    for recipe in recipes:
+        by_user.setdefault(recipe.user_id, []).append(recipe.pk)
+    result = {}
+    for user_id, ids in by_user.items():
+        result.update(Change.objects.filter(
+            user_id=user_id, kind=changes.RECIPE, object_id__in=ids,
+        ).values_list('object_id', 'sequence'))
+    return result
+
+
+def _key(serializer, request, pk, version):
+    # Image URLs are absolute, so the host is part of the fragment.
+    return (
+        f'recipe:{type(serializer).__name__}:{pk}:{version}:'
+        f'{request.build_absolute_uri("/")}'
+    )
+
+
+def render(serializer, recipes):
+    """Representations of recipes, from the cache where possible."""
+    recipes = list(recipes)
+    if not _enabled(serializer):
+        prefetch_related_objects(recipes, *PREFETCH)
+        return [serializer.render_recipe(recipe) for recipe in recipes]
+
+    request = serializer.context['request']
+    current = versions(recipes)
+    keys = {
+        recipe.pk: _key(serializer, request, recipe.pk, current[recipe.pk])
+        for recipe in recipes if recipe.pk in current
+    }
+    cache = _cache()
+    version = schema.code_version()
+    found = cache.get_many(keys.values(), version=version)
+
+    missing = [
+        recipe for recipe in recipes if keys.get(recipe.pk) not in found
+    ]
+    # The rows given were loaded before the versions were read and may
+    # be older, so the misses are rendered from rows read after them.
+    fresh = Recipe.objects.in_bulk([
+        recipe.pk for recipe in missing if recipe.pk in keys
+    ])
+    missing = [fresh.get(recipe.pk, recipe) for recipe in missing]
+    prefetch_related_objects(missing, *PREFETCH)
+    rendered = {
+        recipe.pk: serializer.render_recipe(recipe) for recipe in missing
+    }
+    cache.set_many({
+        keys[pk]: data for pk, data in rendered.items() if pk in fresh
+    }, version=version)
+
+    labels = _labels(serializer)
+    if len(recipes) > len(missing):
+        metrics.inc('api_fragment_cache_total', dict(labels, result='hit'),
+                    len(recipes) - len(missing))
+    if missing:
+        metrics.inc('api_fragment_cache_total', dict(labels, result='miss'),
+                    len(missing))
+    return [
+        rendered[recipe.pk] if recipe.pk in rendered
+        else found[keys[recipe.pk]]
+        for recipe in recipes
+    ]
+
+
+def clear():
+    """Drop every cached fragment."""
+    _cache().clear()
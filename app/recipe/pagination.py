@@ -0,0 +1,168 @@
+"""
+Keyset pagination for recipe lists.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import F, Field, Func, Q, Value
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class Row(Func):
+    """SQL row value, compared with another one key by key."""
+    function = ''
+    template = '(%(expressions)s)'
+    output_field = Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in pagination continuing after the last row of the previous
+    page instead of skipping an offset.
+
+    Paging starts with ?limit=N. The response carries the link to the
+    next page, whose cursor holds the ordering values of the last row;
+    the next page filters on them, so the database seeks into the
+    ordering index and deep pages cost the same as the first one. The
+    queryset ordering must end with a unique field.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    default_limit = 20
+    max_limit = 100
+
+    def _limit(self, request):
+        value = request.query_params.get(self.limit_query_param)
+        if value is None:
+            return self.default_limit
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError(
+                {self.limit_query_param: 'A positive integer is required.'}
+            )
+        return min(limit, self.max_limit)
+
+    def encode_cursor(self, ordering, values):
+        data = json.dumps({'o': ordering, 'v': values})
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, ordering, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if data['o'] != ordering or len(data['v']) != len(ordering):
+                raise ValueError
+            return data['v']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise ValidationError(
+                {self.cursor_query_param: 'Invalid cursor.'}
+            )
+
+    def _seek(self, queryset, ordering, values):
+        """
+        Rows strictly after values in the given ordering. One direction
+        compares row values, (a, b) > (v, w), which the database turns
+        into a range scan of the (a, b) index. Mixed directions expand
+        to a > v OR (a = v AND b < w), bounded by a >= v so the leading
+        key still limits the scan.
+        """
+        model = queryset.model
+        fields = [
+            model._meta.get_field(field_name.lstrip('-'))
+            for field_name in ordering
+        ]
+        values = [
+            field.to_python(value) for field, value in zip(fields, values)
+        ]
+        descending = [field_name.startswith('-') for field_name in ordering]
+        if len(set(descending)) == 1:
+            lookup = 'lt' if descending[0] else 'gt'
+            return queryset.alias(keyset_row=Row(*[
+                F(field.name) for field in fields
+            ])).filter(**{f'keyset_row__{lookup}': Row(*[
+                Value(value, output_field=field)
+                for field, value in zip(fields, values)
+            ])})
+
+        condition = Q()
+        equal = Q()
+        for field, value, desc in zip(fields, values, descending):
+            lookup = 'lt' if desc else 'gt'
+            condition |= equal & Q(**{f'{field.name}__{lookup}': value})
+            equal &= Q(**{field.name: value})
+        bound = 'lte' if descending[0] else 'gte'
+        return queryset.filter(
+            Q(**{f'{fields[0].name}__{bound}': values[0]}), condition,
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (self.limit_query_param not in params and
+                self.cursor_query_param not in params):
+            return None
+
+        self.request = request
+        self.limit = self._limit(request)
+        self.ordering = list(queryset.query.order_by)
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            queryset = self._seek(
+                queryset, self.ordering,
+                self.decode_cursor(self.ordering, cursor),
+            )
+
+        rows = list(queryset[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        self.page = rows[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [
+            str(getattr(last, field_name.lstrip('-')))
+            for field_name in self.ordering
+        ]
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.ordering, values),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results per page, enables paging.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Continuation cursor from the next link.',
+                'schema': {'type': 'string'},
+            },
+        ]
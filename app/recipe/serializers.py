@@ -1,11 +1,29 @@
 """Serializers for Resipe API."""
+import os
+
+from django.conf import settings
+from django.db import connections, models, router
+from django.urls import reverse
 from rest_framework import serializers
 
+from core import autocomplete, changes, names
 from core.models import (Recipe, Tag, Ingredient)
+from recipe import fragments
+
+RECIPE_CLONE_MAX = 100
+RECIPE_BULK_MAX = 500
+COOKABLE_MAX = 100
+AUTOCOMPLETE_MAX = 50
+SIMILAR_MAX = 50
+RECIPE_ORDERING_FIELDS = ('price', 'time_min', 'id')
+CHANGES_MAX = 1000
 
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer for Ingredients."""
+    # Stored as a reference into the shared Name dictionary.
+    name = serializers.CharField(max_length=255)
+
     class Meta:
         model = Ingredient
         fields = ['id', 'name']
@@ -14,12 +32,26 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class TagSerializer(serializers.ModelSerializer):
     """Serializer for Tags."""
+    # Stored as a reference into the shared Name dictionary.
+    name = serializers.CharField(max_length=255)
+
     class Meta:
         model = Tag
         fields = ['id', 'name']
         read_only_fields = ['id']
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Recipe list assembled from cached fragments."""
+
+    def to_representation(self, data):
+        if self.parent is not None:
+            return super().to_representation(data)
+        if isinstance(data, models.Manager):
+            data = data.all()
+        return fragments.render(self.child, data)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Recipe serializer."""
     tags = TagSerializer(many=True, required=False)
@@ -30,31 +62,64 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'time_min', 'price',
                   'link', 'tags', 'ingredients']
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
-        auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, _ = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
+    def to_representation(self, instance):
+        if self.parent is not None:
+            return self.render_recipe(instance)
+        return fragments.render(self, [instance])[0]
 
-    def _get_or_create_ingredients(self, ingredients, recipe):
+    def render_recipe(self, instance):
+        """Representation built by the serializer fields, uncached."""
+        return super().to_representation(instance)
+
+    def _get_or_create(self, model, items):
+        """
+        Tags or ingredients of the user with the given names. Existing rows
+        are read with one query and the missing ones inserted with another.
+        """
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, _ = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        name_ids = names.intern_many(item['name'] for item in items)
+        db = router.db_for_write(model)
+        queryset = model.objects.using(db).filter(user=auth_user)
+        by_name = {
+            obj.name_ref_id: obj
+            for obj in queryset.filter(name_ref_id__in=name_ids.values())
+        }
+        missing = [
+            model(user=auth_user, name_ref_id=name_id)
+            for name_id in set(name_ids.values()) - by_name.keys()
+        ]
+        if missing:
+            model.objects.using(db).bulk_create(missing)
+            if not connections[db].features.can_return_rows_from_bulk_insert:
+                # No ids back from a bulk insert on this backend.
+                missing = list(queryset.filter(
+                    name_ref_id__in=[obj.name_ref_id for obj in missing],
+                ))
+            by_name.update((obj.name_ref_id, obj) for obj in missing)
+            # bulk_create sends no post_save.
+            created_ids = [obj.pk for obj in missing]
+            changes.record(auth_user.id, model._meta.model_name, created_ids)
+            autocomplete.invalidate(model, auth_user.id)
+        return [by_name[name_ids[item['name']]] for item in items]
+
+    def _set_related(self, recipe, m2m, model, items):
+        """Insert and delete only the through rows that changed."""
+        manager = getattr(recipe, m2m)
+        current = set(manager.values_list('id', flat=True))
+        wanted = {obj.id for obj in self._get_or_create(model, items)}
+        if current - wanted:
+            manager.remove(*(current - wanted))
+        if wanted - current:
+            manager.add(*(wanted - current))
 
     def create(self, validated_data):
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        recipe.tags.add(*self._get_or_create(Tag, tags))
+        recipe.ingredients.add(*self._get_or_create(Ingredient, ingredients))
         return recipe
 
     def update(self, instance, validated_data):
@@ -62,20 +127,41 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients', None)
 
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            self._set_related(instance, 'tags', Tag, tags)
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            self._set_related(instance, 'ingredients', Ingredient, ingredients)
 
-        for attr, value in validated_data:
-            setattr(instance, attr, value)
-        instance.save()
+        changed = []
+        for attr, value in validated_data.items():
+            if getattr(instance, attr) != value:
+                setattr(instance, attr, value)
+                changed.append(attr)
+        if changed:
+            instance.save(update_fields=changed)
         return instance
 
 
+class RecipeImageField(serializers.ImageField):
+    """
+    Image sent by the authenticated image action instead of a public
+    media URL. The name of the file is part of the URL, so a new upload
+    gets a new URL.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = reverse('recipe:recipe-image', args=[value.instance.pk])
+        url += '?v=' + os.path.splitext(os.path.basename(value.name))[0]
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Detailed recipe (recipe+description) serializer."""
+    image = RecipeImageField(required=False, allow_null=True)
 
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
@@ -83,8 +169,221 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for Recipe image."""
+    image = RecipeImageField()
+
     class Meta:
         model = Recipe
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
+
+
+class RecipeCloneSerializer(serializers.Serializer):
+    """Serializer for cloning a recipe."""
+    count = serializers.IntegerField(
+        min_value=1,
+        max_value=RECIPE_CLONE_MAX,
+        default=1,
+    )
+
+
+class RecipeBulkFieldsSerializer(serializers.ModelSerializer):
+    """Scalar fields applied to every recipe of a bulk update."""
+    class Meta:
+        model = Recipe
+        fields = ['title', 'time_min', 'price', 'link', 'description']
+        extra_kwargs = {field: {'required': False} for field in fields}
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    """Serializer for deleting recipes in bulk."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=RECIPE_BULK_MAX,
+    )
+
+
+class RecipeBulkUpdateSerializer(RecipeBulkDeleteSerializer):
+    """Serializer for updating recipes in bulk."""
+    fields = RecipeBulkFieldsSerializer(required=False)
+    add_tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+    )
+    remove_tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+    )
+    add_ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+    )
+    remove_ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+    )
+
+    def _validate_owned(self, model, ids):
+        auth_user = self.context['request'].user
+        ids = set(ids)
+        owned = model.objects.filter(user=auth_user, id__in=ids).count()
+        if owned != len(ids):
+            raise serializers.ValidationError(
+                f'Unknown {model._meta.verbose_name} ids.'
+            )
+        return ids
+
+    def validate_add_tags(self, value):
+        return self._validate_owned(Tag, value)
+
+    def validate_add_ingredients(self, value):
+        return self._validate_owned(Ingredient, value)
+
+
+class TimeMinBucketSerializer(serializers.Serializer):
+    min = serializers.IntegerField()
+    max = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class UsageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Serializer for the recipe statistics of a user."""
+    recipe_count = serializers.IntegerField()
+    average_price = serializers.DecimalField(
+        max_digits=5, decimal_places=2, allow_null=True,
+    )
+    time_min_histogram = TimeMinBucketSerializer(many=True)
+    top_tags = UsageSerializer(many=True)
+    top_ingredients = UsageSerializer(many=True)
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """Query parameters of the cookable recipes search."""
+    ingredients = serializers.CharField()
+    limit = serializers.IntegerField(
+        min_value=1, max_value=COOKABLE_MAX, default=20,
+    )
+
+    def validate_ingredients(self, value):
+        try:
+            return [int(str_id) for str_id in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError(
+                'Comma separated list of ingredient IDs expected.'
+            )
+
+
+class CookableRecipeSerializer(serializers.Serializer):
+    """Recipe with how much of its ingredient list is covered."""
+    recipe = RecipeSerializer()
+    covered = serializers.IntegerField()
+    total = serializers.IntegerField()
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """Query parameters of tag and ingredient autocomplete."""
+    q = serializers.CharField(max_length=255, trim_whitespace=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=AUTOCOMPLETE_MAX, default=10,
+    )
+
+
+class RecipeBatchQuerySerializer(serializers.Serializer):
+    """Query parameters of the recipe multi-get."""
+    ids = serializers.CharField(
+        help_text='Comma separated list of recipe IDs.',
+    )
+
+    def validate_ids(self, value):
+        try:
+            ids = [int(str_id) for str_id in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError(
+                'Comma separated list of recipe IDs expected.'
+            )
+        # Repeated ids are returned once.
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.RECIPE_BATCH_MAX:
+            raise serializers.ValidationError(
+                f'At most {settings.RECIPE_BATCH_MAX} IDs per request.'
+            )
+        return ids
+
+
+class RecipeBatchItemSerializer(serializers.Serializer):
+    """Result of one requested id, recipe is null when not found."""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['found', 'not_found'])
+    recipe = RecipeDetailSerializer(allow_null=True)
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Query parameters of the similar recipes lookup."""
+    limit = serializers.IntegerField(
+        min_value=1, max_value=SIMILAR_MAX, default=10,
+    )
+
+
+class SimilarRecipeSerializer(serializers.Serializer):
+    """Recipe with its estimated similarity to the requested one."""
+    recipe = RecipeSerializer()
+    similarity = serializers.FloatField()
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Range filters and ordering of the recipe list."""
+    price_min = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
+    price_max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False,
+    )
+    time_min_max = serializers.IntegerField(min_value=0, required=False)
+    ordering = serializers.CharField(
+        required=False, default='-id',
+        help_text='Comma separated list of price, time_min and id, '
+                  'prefixed with - for descending order.',
+    )
+
+    def validate_ordering(self, value):
+        fields = value.split(',')
+        names = [field.lstrip('-') for field in fields]
+        if (len(set(names)) != len(names) or
+                any(name not in RECIPE_ORDERING_FIELDS for name in names)):
+            raise serializers.ValidationError('Unknown ordering.')
+        if 'id' not in names:
+            # Keyset pagination needs a unique last key. It follows the
+            # direction of the last one, so one scan of the (user, key,
+            # id) index serves the whole ordering.
+            fields.append('-id' if fields[-1].startswith('-') else 'id')
+        return fields
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Query parameters of the delta sync."""
+    since = serializers.IntegerField(
+        min_value=0, default=0,
+        help_text='cursor of the previous sync, 0 for a full sync.',
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=CHANGES_MAX, default=500,
+    )
+
+
+class DeletedSerializer(serializers.Serializer):
+    """IDs of the objects deleted since the cursor."""
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = serializers.ListField(child=serializers.IntegerField())
+
+
+class ChangesSerializer(serializers.Serializer):
+    """Objects created, modified or deleted since the cursor."""
+    cursor = serializers.IntegerField()
+    more = serializers.BooleanField()
+    recipes = RecipeDetailSerializer(many=True)
+    tags = TagSerializer(many=True)
+    ingredients = IngredientSerializer(many=True)
+    deleted = DeletedSerializer()
@@ -0,0 +1,143 @@
+"""Tests for the delta sync API."""
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from core.querycheck import QueryCheckMixin
+
+RECIPES_URL = reverse('recipe:recipe-list')
+CHANGES_URL = reverse('recipe:changes')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample title',
+        'time_min': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicChangesApiTests(TestCase):
+
+    def test_auth_required(self):
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangesApiTests(QueryCheckMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since, **params):
+        res = self.client.get(CHANGES_URL, {'since': since, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_full_then_delta_sync(self):
+        payload = {
+            'title': 'Curry',
+            'time_min': 30,
+            'price': Decimal('4.50'),
+            'tags': [{'name': 'Dinner'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        recipe_id = self.client.post(
+            RECIPES_URL, payload, format='json',
+        ).data['id']
+        other = create_recipe(self.user)
+        user2 = get_user_model().objects.create_user(
+            'other@example.com', 'pass1234',
+        )
+        create_recipe(user2)
+
+        full = self.sync(0)
+        self.assertEqual(
+            [r['id'] for r in full['recipes']], [recipe_id, other.id],
+        )
+        self.assertEqual([t['name'] for t in full['tags']], ['Dinner'])
+        self.assertEqual([i['name'] for i in full['ingredients']], ['Rice'])
+        self.assertFalse(full['more'])
+
+        other.title = 'New title'
+        other.save()
+        Tag.objects.get(name='Dinner').delete()
+
+        delta = self.sync(full['cursor'])
+        self.assertEqual(
+            [r['id'] for r in delta['recipes']], [recipe_id, other.id],
+        )
+        self.assertEqual(delta['recipes'][0]['tags'], [])
+        self.assertEqual(delta['tags'], [])
+        self.assertEqual(delta['ingredients'], [])
+        self.assertEqual(len(delta['deleted']['tags']), 1)
+
+        self.assertEqual(self.sync(delta['cursor'])['recipes'], [])
+
+    def test_tags_created_with_recipe(self):
+        cursor = self.sync(0)['cursor']
+        payload = {
+            'title': 'Curry',
+            'time_min': 30,
+            'price': Decimal('4.50'),
+            'tags': [{'name': 'Dinner'}, {'name': 'Hot'}],
+        }
+        self.client.post(RECIPES_URL, payload, format='json')
+
+        delta = self.sync(cursor)
+        self.assertCountEqual(
+            [t['name'] for t in delta['tags']], ['Dinner', 'Hot'],
+        )
+
+    def test_tombstones(self):
+        recipe = create_recipe(self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        ingredient_id = ingredient.id
+        cursor = self.sync(0)['cursor']
+
+        self.client.delete(detail_url(recipe.id))
+        ingredient.delete()
+
+        delta = self.sync(cursor)
+        self.assertEqual(delta['recipes'], [])
+        self.assertEqual(delta['deleted'], {
+            'recipes': [recipe.id],
+            'tags': [],
+            'ingredients': [ingredient_id],
+        })
+
+    def test_pages(self):
+        recipes = [create_recipe(self.user) for _ in range(5)]
+
+        ids = []
+        data = {'cursor': 0, 'more': True}
+        while data['more']:
+            data = self.sync(data['cursor'], limit=2)
+            ids.extend(r['id'] for r in data['recipes'])
+
+        self.assertEqual(ids, [r.id for r in recipes])
+
+    def test_user_deletion(self):
+        create_recipe(self.user)
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        self.user.delete()
+
+        self.assertFalse(Recipe.objects.exists())
@@ -0,0 +1,146 @@
+"""Tests for the serialized recipe cache."""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import Recipe, Tag
+from core.querycheck import QueryCheckMixin
+from recipe import fragments
+from recipe.serializers import RecipeSerializer
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def tag_detail_url(tag_id):
+    return reverse('recipe:tag-detail', args=[tag_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample title',
+        'time_min': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def tag_queries(ctx):
+    return [
+        q for q in ctx.captured_queries if 'core_recipe_tags' in q['sql']
+    ]
+
+
+class FragmentCacheTests(QueryCheckMixin, TestCase):
+
+    def setUp(self):
+        fragments.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipes = [create_recipe(self.user) for _ in range(3)]
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+
+    @patch('recipe.fragments.metrics.inc')
+    def test_list_served_from_cache(self, patched_inc):
+        first = self.client.get(RECIPES_URL)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(tag_queries(ctx), [])
+        labels = {'view': 'RecipeViewSet', 'action': 'list'}
+        patched_inc.assert_any_call(
+            'api_fragment_cache_total', dict(labels, result='miss'), 3,
+        )
+        patched_inc.assert_any_call(
+            'api_fragment_cache_total', dict(labels, result='hit'), 3,
+        )
+
+    def test_only_missing_fragments_rendered(self):
+        self.client.get(detail_url(self.recipes[0].id))
+        self.client.get(RECIPES_URL)
+
+        with patch.object(
+            RecipeSerializer, 'render_recipe', autospec=True,
+            side_effect=RecipeSerializer.render_recipe,
+        ) as patched_render:
+            self.client.get(RECIPES_URL)
+            self.recipes[1].tags.remove(self.tag)
+            res = self.client.get(RECIPES_URL)
+
+        rendered = [
+            call.args[1].id for call in patched_render.call_args_list
+        ]
+        self.assertEqual(rendered, [self.recipes[1].id])
+        self.assertEqual(len(res.data), 3)
+
+    def test_update_invalidates(self):
+        self.client.get(detail_url(self.recipes[0].id))
+
+        res = self.client.patch(
+            detail_url(self.recipes[0].id), {'tags': []}, format='json',
+        )
+        self.assertEqual(res.data['tags'], [])
+
+        res = self.client.get(detail_url(self.recipes[0].id))
+        self.assertEqual(res.data['tags'], [])
+
+    def test_rows_older_than_versions_not_cached(self):
+        stale = Recipe.objects.get(id=self.recipes[0].id)
+        self.recipes[0].title = 'Renamed'
+        self.recipes[0].save()
+        serializer = RecipeSerializer(
+            context={'request': APIRequestFactory().get(RECIPES_URL)},
+        )
+
+        data = fragments.render(serializer, [stale])
+
+        self.assertEqual(data[0]['title'], 'Renamed')
+        res = self.client.get(detail_url(stale.id))
+        self.assertEqual(res.data['title'], 'Renamed')
+
+    def test_tag_rename_invalidates(self):
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(tag_detail_url(self.tag.id), {'name': 'Vegetarian'})
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            [r['tags'][0]['name'] for r in res.data], ['Vegetarian'] * 3,
+        )
+
+    def test_delete(self):
+        self.client.get(RECIPES_URL)
+
+        self.client.delete(detail_url(self.recipes[0].id))
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 2)
+
+    @override_settings(RECIPE_FRAGMENT_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(RECIPES_URL)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(len(tag_queries(ctx)), 1)
@@ -8,6 +8,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Ingredient, Recipe
+from core.querycheck import QueryCheckMixin
 
 from recipe.serializers import IngredientSerializer
 
@@ -23,7 +24,7 @@ def create_user(email='user@example.com', password='pass1234'):
     return get_user_model().objects.create_user(email, password)
 
 
-class PublicIngredientsApiTests(TestCase):
+class PublicIngredientsApiTests(QueryCheckMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
 
@@ -33,7 +34,7 @@ class PublicIngredientsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateIngredientsApiTests(TestCase):
+class PrivateIngredientsApiTests(QueryCheckMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = create_user()
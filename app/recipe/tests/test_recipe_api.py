@@ -1,9 +1,12 @@
 import tempfile
 import os
+from unittest.mock import patch
 from PIL import Image
 from decimal import Decimal
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -14,12 +17,19 @@ from core.models import (
     Tag,
     Ingredient
 )
+from core.querycheck import QueryCheckMixin
+from recipe import fragments
+from recipe.pagination import KeysetPagination
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_UPDATE_URL = reverse('recipe:recipe-bulk-update')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def detail_url(recipe_id):
@@ -30,6 +40,14 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def image_url(recipe_id):
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
+
+def clone_url(recipe_id):
+    return reverse('recipe:recipe-clone', args=[recipe_id])
+
+
 def create_recipe(user, **params):
     defaults = {
         'title': 'Sample title',
@@ -44,7 +62,7 @@ def create_recipe(user, **params):
     return recipe
 
 
-class PublicRecipeAPITests(TestCase):
+class PublicRecipeAPITests(QueryCheckMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
 
@@ -54,8 +72,9 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateRecipeAPITests(TestCase):
+class PrivateRecipeAPITests(QueryCheckMixin, TestCase):
     def setUp(self):
+        fragments.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             'user@example.com',
@@ -75,6 +94,17 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_retrieve_recipes_without_duplicate_queries(self):
+        """Listing many recipes does not query tags per recipe."""
+        for i in range(10):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 10)
+
     def test_recipe_list_limited_to_user(self):
         other_user = get_user_model().objects.create_user(
             'otheruser@example.com',
@@ -156,6 +186,36 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(if_exists)
 
+    def test_create_recipe_tags_in_batches(self):
+        Tag.objects.create(user=self.user, name='Tag 0')
+        names = [f'Tag {i}' for i in range(6)]
+        payload = {
+            'title': 'Stew',
+            'time_min': 90,
+            'price': Decimal('3.00'),
+            'tags': [{'name': name} for name in names + ['Tag 1']],
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertCountEqual(
+            [tag['name'] for tag in res.data['tags']], names,
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 6)
+        tag_writes = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('INSERT INTO "core_tag"')
+        ]
+        self.assertEqual(len(tag_writes), 1)
+        tag_lookups = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and
+            'FROM "core_tag"' in q['sql'] and 'JOIN' not in q['sql']
+        ]
+        self.assertLessEqual(len(tag_lookups), 2)
+
     def test_create_tag_on_update(self):
         recipe = create_recipe(user=self.user)
 
@@ -193,6 +253,77 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_partial_update_title(self):
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = create_recipe(user=self.user, title='Old')
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id), {'title': 'New'}, format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+        recipe_updates = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "core_recipe"')
+        ]
+        self.assertEqual(len(recipe_updates), 1)
+        self.assertIn('"title"', recipe_updates[0])
+        self.assertNotIn('"price"', recipe_updates[0])
+        self.assertFalse([
+            q for q in ctx.captured_queries
+            if 'core_recipe_tags' in q['sql'] and
+            not q['sql'].startswith('SELECT')
+        ])
+
+    def test_update_tags_writes_only_differences(self):
+        kept = Tag.objects.create(user=self.user, name='Kept')
+        dropped = Tag.objects.create(user=self.user, name='Dropped')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(kept, dropped)
+
+        payload = {'tags': [{'name': 'Kept'}, {'name': 'Added'}]}
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()), ['Added', 'Kept'],
+        )
+        writes = [
+            q['sql'].split()[0] for q in ctx.captured_queries
+            if 'core_recipe_tags' in q['sql'] and
+            not q['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(sorted(writes), ['DELETE', 'INSERT'])
+
+    def test_full_update(self):
+        recipe = create_recipe(user=self.user, title='Old')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Old tag'))
+
+        payload = {
+            'title': 'New',
+            'time_min': 10,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'New tag'}],
+        }
+        res = self.client.put(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.title, recipe.time_min, recipe.price),
+            ('New', 10, Decimal('2.50')),
+        )
+        self.assertEqual(
+            [tag.name for tag in recipe.tags.all()], ['New tag'],
+        )
+
     def test_recipe_with_new_ingredients(self):
         payload = {
             'title': 'Thai curry',
@@ -328,11 +459,341 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
 
+    def test_clone_recipe(self):
+        recipe = create_recipe(user=self.user, title='Original')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt'),
+            Ingredient.objects.create(user=self.user, name='Rice'),
+        )
 
-class ImageUploadTests(TestCase):
+        res = self.client.post(clone_url(recipe.id), {'count': 3})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        for data in res.data:
+            clone = Recipe.objects.get(id=data['id'])
+            self.assertNotEqual(clone.id, recipe.id)
+            self.assertEqual(clone.user, self.user)
+            self.assertEqual(clone.title, 'Original')
+            self.assertEqual(
+                set(clone.tags.all()), set(recipe.tags.all())
+            )
+            self.assertEqual(
+                set(clone.ingredients.all()), set(recipe.ingredients.all())
+            )
+
+    def test_clone_copies_through_tables_in_one_query(self):
+        recipe = create_recipe(user=self.user)
+        for i in range(3):
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(clone_url(recipe.id), {'count': 4})
+
+        tag_inserts = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('INSERT INTO "core_recipe_tags"')
+        ]
+        self.assertEqual(len(tag_inserts), 1)
+        self.assertEqual(
+            Recipe.tags.through.objects.count(), 3 * 5
+        )
+
+    def test_clone_other_users_recipe_not_found(self):
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        recipe = create_recipe(user=other_user)
+
+        res = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_clone_count_limited(self):
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.post(clone_url(recipe.id), {'count': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_fields_and_tags(self):
+        tag_old = Tag.objects.create(user=self.user, name='Old')
+        tag_new = Tag.objects.create(user=self.user, name='New')
+        recipe1 = create_recipe(user=self.user)
+        recipe2 = create_recipe(user=self.user)
+        recipe1.tags.add(tag_old)
+        recipe2.tags.add(tag_old, tag_new)
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        other_recipe = create_recipe(user=other_user, title='Other')
+
+        payload = {
+            'ids': [recipe1.id, recipe2.id, other_recipe.id],
+            'fields': {'title': 'Bulk title', 'time_min': 5},
+            'add_tags': [tag_new.id],
+            'remove_tags': [tag_old.id],
+        }
+        res = self.client.post(BULK_UPDATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'id': recipe1.id, 'status': 'updated'},
+            {'id': recipe2.id, 'status': 'updated'},
+            {'id': other_recipe.id, 'status': 'not_found'},
+        ])
+        for recipe in (recipe1, recipe2):
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.title, 'Bulk title')
+            self.assertEqual(recipe.time_min, 5)
+            self.assertEqual(list(recipe.tags.all()), [tag_new])
+        other_recipe.refresh_from_db()
+        self.assertEqual(other_recipe.title, 'Other')
+
+    def test_bulk_update_rejects_other_users_tags(self):
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        other_tag = Tag.objects.create(user=other_user, name='Other')
+        recipe = create_recipe(user=self.user)
+
+        payload = {'ids': [recipe.id], 'add_tags': [other_tag.id]}
+        res = self.client.post(BULK_UPDATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_bulk_delete(self):
+        recipe1 = create_recipe(user=self.user)
+        recipe2 = create_recipe(user=self.user)
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        other_recipe = create_recipe(user=other_user)
+
+        payload = {'ids': [recipe1.id, other_recipe.id]}
+        res = self.client.post(BULK_DELETE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'id': recipe1.id, 'status': 'deleted'},
+            {'id': other_recipe.id, 'status': 'not_found'},
+        ])
+        self.assertFalse(Recipe.objects.filter(id=recipe1.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=recipe2.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=other_recipe.id).exists())
+
+    def test_bulk_write_rolled_back_with_failed_resync(self):
+        recipe = create_recipe(user=self.user, title='Kept')
+
+        payload = {'ids': [recipe.id], 'fields': {'title': 'Lost'}}
+        with patch('core.signals.cookable.invalidate',
+                   side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(BULK_UPDATE_URL, payload, format='json')
+            with self.assertRaises(RuntimeError):
+                self.client.post(
+                    BULK_DELETE_URL, {'ids': [recipe.id]}, format='json',
+                )
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Kept')
+
+    def test_batch(self):
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        for i, recipe in enumerate(recipes):
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'I{i}')
+            )
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        other_recipe = create_recipe(user=other_user)
+        ids = [recipes[2].id, other_recipe.id, recipes[0].id, 0, recipes[1].id]
+
+        # recipes, tags, ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(
+                BATCH_URL, {'ids': ','.join(map(str, ids))},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['id'], r['status']) for r in res.data],
+            [(recipes[2].id, 'found'), (other_recipe.id, 'not_found'),
+             (recipes[0].id, 'found'), (0, 'not_found'),
+             (recipes[1].id, 'found')],
+        )
+        self.assertIsNone(res.data[1]['recipe'])
+        self.assertEqual(
+            res.data[0]['recipe'], RecipeDetailSerializer(recipes[2]).data,
+        )
+
+    def test_batch_repeated_ids(self):
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(BATCH_URL, {'ids': f'{recipe.id},{recipe.id}'})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    @override_settings(RECIPE_BATCH_MAX=2)
+    def test_batch_size_limited(self):
+        for ids in ('1,2,3', '1,a', ''):
+            res = self.client.get(BATCH_URL, {'ids': ids})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cookable_recipes(self):
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        egg = Ingredient.objects.create(user=self.user, name='Egg')
+        fish = Ingredient.objects.create(user=self.user, name='Fish')
+        fried_rice = create_recipe(user=self.user, title='Fried rice')
+        fried_rice.ingredients.add(rice, egg)
+        sushi = create_recipe(user=self.user, title='Sushi')
+        sushi.ingredients.add(rice, fish)
+        omelette = create_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(egg)
+
+        params = {'ingredients': f'{rice.id},{egg.id}'}
+        res = self.client.get(COOKABLE_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['recipe']['id'], r['covered'], r['total']) for r in res.data],
+            [(fried_rice.id, 2, 2), (omelette.id, 1, 1), (sushi.id, 1, 2)],
+        )
+        self.assertEqual(
+            res.data[0]['recipe'], RecipeSerializer(fried_rice).data
+        )
+
+    def test_cookable_invalid_ingredients(self):
+        res = self.client.get(COOKABLE_URL, {'ingredients': 'a,b'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_by_price_and_time(self):
+        cheap_quick = create_recipe(
+            user=self.user, price=Decimal('3.00'), time_min=10,
+        )
+        create_recipe(user=self.user, price=Decimal('3.00'), time_min=60)
+        create_recipe(user=self.user, price=Decimal('9.00'), time_min=10)
+        create_recipe(user=self.user, price=Decimal('1.00'), time_min=10)
+
+        params = {'price_min': '2', 'price_max': '5', 'time_min_max': 30}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [cheap_quick.id])
+
+    def test_multi_key_ordering(self):
+        r1 = create_recipe(user=self.user, price=Decimal('5.00'), time_min=5)
+        r2 = create_recipe(user=self.user, price=Decimal('2.00'), time_min=9)
+        r3 = create_recipe(user=self.user, price=Decimal('5.00'), time_min=7)
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-price,time_min'})
+
+        self.assertEqual([r['id'] for r in res.data], [r1.id, r3.id, r2.id])
+
+    def test_ties_broken_in_direction_of_last_key(self):
+        recipes = [
+            create_recipe(user=self.user, price=Decimal('3.00'))
+            for _ in range(3)
+        ]
+        ids = [r.id for r in recipes]
+
+        ascending = self.client.get(RECIPES_URL, {'ordering': 'price'})
+        descending = self.client.get(RECIPES_URL, {'ordering': '-price'})
+
+        self.assertEqual([r['id'] for r in ascending.data], ids)
+        self.assertEqual([r['id'] for r in descending.data], ids[::-1])
+
+    def test_invalid_ordering(self):
+        for ordering in ('title', 'price,-price', 'id,'):
+            res = self.client.get(RECIPES_URL, {'ordering': ordering})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_parameters_ignored_by_detail(self):
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(
+            detail_url(recipe.id), {'ordering': 'title', 'price_min': 'x'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_keyset_pages(self):
+        recipes = [
+            create_recipe(user=self.user, price=Decimal(price))
+            for price in ('4.00', '1.50', '4.00', '2.00', '4.00', '1.50')
+        ]
+        expected = sorted(recipes, key=lambda r: (r.price, r.id))
+
+        ids = []
+        url = RECIPES_URL
+        params = {'ordering': 'price,id', 'limit': 4}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 4)
+            ids.extend(r['id'] for r in res.data['results'])
+            url, params = res.data['next'], None
+
+        self.assertEqual(ids, [r.id for r in expected])
+
+    def test_keyset_pages_mixed_directions(self):
+        recipes = [
+            create_recipe(user=self.user, price=Decimal(price))
+            for price in ('4.00', '1.50', '4.00', '2.00', '4.00', '1.50')
+        ]
+        expected = sorted(recipes, key=lambda r: (-r.price, r.id))
+
+        ids = []
+        url = RECIPES_URL
+        params = {'ordering': '-price,id', 'limit': 2}
+        while url:
+            res = self.client.get(url, params)
+            ids.extend(r['id'] for r in res.data['results'])
+            url, params = res.data['next'], None
+
+        self.assertEqual(ids, [r.id for r in expected])
+
+    def test_keyset_seek_predicate(self):
+        qn = connection.ops.quote_name
+        price, pk = qn('price'), qn('id')
+        paginator = KeysetPagination()
+        recipes = Recipe.objects.filter(user=self.user)
+
+        same = str(paginator._seek(
+            recipes, ['price', 'id'], ['1.50', '3'],
+        ).query)
+        mixed = str(paginator._seek(
+            recipes, ['-price', 'id'], ['1.50', '3'],
+        ).query)
+
+        self.assertRegex(
+            same, rf'\(\S*{price}, \S*{pk}\) > \(1\.50?, 3\)',
+        )
+        self.assertRegex(mixed, rf'\S*{price} <= 1\.50? AND \(')
+
+    def test_keyset_cursor_checked(self):
+        res = self.client.get(RECIPES_URL, {'cursor': 'bogus'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ImageUploadTests(QueryCheckMixin, TestCase):
 
     def setUp(self):
         """Before test."""
+        fragments.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             'user3@example.com',
@@ -359,6 +820,62 @@ class ImageUploadTests(TestCase):
         self.assertIn('image', res.data)  # image is in the response
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def _upload(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file}, format='multipart',
+            )
+        self.recipe.refresh_from_db()
+        return res
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected/media/')
+    def test_image_handed_to_nginx(self):
+        res = self._upload()
+        self.assertTrue(res.data['image'].startswith(
+            'http://testserver' + image_url(self.recipe.id) + '?v='
+        ))
+
+        res = self.client.get(res.data['image'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            '/protected/media/' + self.recipe.image.name,
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('private', res['Cache-Control'])
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='')
+    def test_image_streamed_without_nginx(self):
+        self._upload()
+
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Accel-Redirect', res)
+        with open(self.recipe.image.path, 'rb') as f:
+            self.assertEqual(b''.join(res.streaming_content), f.read())
+
+    def test_image_private(self):
+        self._upload()
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'pass1234',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_image_missing(self):
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_upload_invalid_image(self):
         url = image_upload_url(self.recipe.id)
         payload = {'image': 'notanimage'}
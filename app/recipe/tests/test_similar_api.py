@@ -0,0 +1,136 @@
+"""Tests for the similar recipes API."""
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeBand, RecipeSignature, Tag, Ingredient
+from core.querycheck import QueryCheckMixin
+from recipe import fragments
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample title',
+        'time_min': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def index_rows(user):
+    return (
+        sorted(RecipeSignature.objects.filter(
+            user=user,
+        ).values_list('recipe_id', 'signature')),
+        sorted(RecipeBand.objects.filter(
+            user=user,
+        ).values_list('recipe_id', 'band', 'bucket')),
+    )
+
+
+class PrivateSimilarApiTests(QueryCheckMixin, TestCase):
+
+    def setUp(self):
+        fragments.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Item {i}')
+            for i in range(6)
+        ]
+
+    def test_similar_recipes(self):
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(*self.ingredients[:4])
+        close = create_recipe(self.user, title='Close')
+        close.ingredients.add(*self.ingredients[:4])
+        other = create_recipe(self.user, title='Other')
+        other.ingredients.add(*self.ingredients[4:])
+        user2 = get_user_model().objects.create_user(
+            'other@example.com', 'pass1234',
+        )
+        foreign = create_recipe(user2)
+        foreign.ingredients.add(*self.ingredients[:4])
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['recipe']['id'], close.id)
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+
+    def test_index_follows_tag_changes(self):
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        payload = {
+            'title': 'Soup',
+            'time_min': 10,
+            'price': Decimal('2.00'),
+            'tags': [{'name': 'Quick'}],
+            'ingredients': [{'name': 'Item 0'}],
+        }
+        recipe_id = self.client.post(
+            RECIPES_URL, payload, format='json',
+        ).data['id']
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(self.ingredients[0])
+        tag.recipe_set.add(recipe)
+
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.data[0]['recipe']['id'], recipe_id)
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+
+        incremental = index_rows(self.user)
+        call_command('rebuild_similarity', stdout=StringIO())
+        self.assertEqual(incremental, index_rows(self.user))
+
+        tag.delete()
+        incremental = index_rows(self.user)
+        call_command('rebuild_similarity', stdout=StringIO())
+        self.assertEqual(incremental, index_rows(self.user))
+
+    def test_index_follows_bulk_actions(self):
+        recipes = [create_recipe(self.user, title=f'R{i}') for i in range(3)]
+        for recipe in recipes:
+            recipe.ingredients.add(self.ingredients[0])
+
+        self.client.post(reverse('recipe:recipe-bulk-update'), {
+            'ids': [recipes[0].id],
+            'add_ingredients': [self.ingredients[1].id],
+        }, format='json')
+        self.client.post(
+            reverse('recipe:recipe-clone', args=[recipes[0].id]),
+            {'count': 2}, format='json',
+        )
+        self.client.post(reverse('recipe:recipe-bulk-delete'), {
+            'ids': [recipes[1].id],
+        }, format='json')
+
+        incremental = index_rows(self.user)
+        self.assertEqual(len(incremental[0]), 4)
+        call_command('rebuild_similarity', stdout=StringIO())
+        self.assertEqual(incremental, index_rows(self.user))
+
+    def test_recipe_without_tags_or_ingredients(self):
+        recipe = create_recipe(self.user)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
@@ -0,0 +1,160 @@
+"""Tests for the recipe statistics API."""
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import stats
+from core.models import Recipe, RecipeStats, Tag, Ingredient
+from core.querycheck import QueryCheckMixin
+
+RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample title',
+        'time_min': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def stats_row(user):
+    row = RecipeStats.objects.get(user=user)
+    return (row.recipe_count, row.price_total, row.time_min_histogram,
+            row.tag_counts, row.ingredient_counts)
+
+
+class PrivateStatsApiTests(QueryCheckMixin, TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'pass1234',
+        )
+        self.client.force_authenticate(self.user)
+
+    def assertStatsConsistent(self):
+        """Incremental stats match a rebuild from scratch."""
+        incremental = stats_row(self.user)
+        stats.rebuild(self.user.id)
+        self.assertEqual(incremental, stats_row(self.user))
+
+    def test_stats(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe1 = create_recipe(self.user, price=Decimal('4.00'), time_min=5)
+        recipe2 = create_recipe(self.user, price=Decimal('6.00'), time_min=50)
+        recipe1.tags.add(tag)
+        recipe2.tags.add(tag)
+        other_user = get_user_model().objects.create_user(
+            'otheruser@example.com',
+            'otherpass1234',
+        )
+        create_recipe(other_user, price=Decimal('100.00'))
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['average_price'], '5.00')
+        histogram = {b['min']: b['count']
+                     for b in res.data['time_min_histogram']}
+        self.assertEqual(histogram[0], 1)
+        self.assertEqual(histogram[45], 1)
+        self.assertEqual(
+            res.data['top_tags'],
+            [{'id': tag.id, 'name': 'Vegan', 'count': 2}],
+        )
+
+    def test_stats_updated_incrementally(self):
+        self.client.get(STATS_URL)  # builds the summary row
+
+        payload = {
+            'title': 'Curry',
+            'time_min': 30,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'Thai'}, {'name': 'Dinner'}],
+            'ingredients': [{'name': 'Rice'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        recipe_id = res.data['id']
+        self.assertStatsConsistent()
+
+        self.client.patch(detail_url(recipe_id), {
+            'tags': [{'name': 'Thai'}],
+        }, format='json')
+        recipe = Recipe.objects.get(id=recipe_id)
+        recipe.price = Decimal('3.50')
+        recipe.time_min = 95
+        recipe.save()
+        self.assertStatsConsistent()
+
+        other = create_recipe(self.user)
+        other.ingredients.add(Ingredient.objects.get(name='Rice'))
+        Tag.objects.get(name='Thai').recipe_set.add(other)
+        self.assertStatsConsistent()
+
+        Recipe.objects.get(id=recipe_id).ingredients.clear()
+        Ingredient.objects.get(name='Rice').delete()
+        self.assertStatsConsistent()
+
+        self.client.delete(detail_url(recipe_id))
+        self.assertStatsConsistent()
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 1)
+
+    def test_stats_after_bulk_delete(self):
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        self.client.get(STATS_URL)
+
+        self.client.post(
+            reverse('recipe:recipe-bulk-delete'),
+            {'ids': [recipes[0].id, recipes[1].id]},
+            format='json',
+        )
+
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 1)
+
+    def test_stats_after_bulk_update_and_clone(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        recipes[0].tags.add(tag)
+        self.client.get(STATS_URL)
+
+        self.client.post(reverse('recipe:recipe-bulk-update'), {
+            'ids': [recipes[0].id, recipes[1].id],
+            'fields': {'price': '7.00', 'time_min': 95},
+            'remove_tags': [tag.id],
+            'add_ingredients': [rice.id],
+        }, format='json')
+        self.assertStatsConsistent()
+
+        self.client.post(
+            reverse('recipe:recipe-clone', args=[recipes[0].id]),
+            {'count': 2}, format='json',
+        )
+        self.assertStatsConsistent()
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 5)
+
+    def test_rebuild_command(self):
+        create_recipe(self.user)
+        RecipeStats.objects.create(user=self.user, recipe_count=42)
+
+        call_command('rebuild_recipe_stats', stdout=StringIO())
+
+        self.assertEqual(RecipeStats.objects.get(
+            user=self.user
+        ).recipe_count, 1)
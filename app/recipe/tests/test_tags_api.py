@@ -1,17 +1,19 @@
 """Tests for Tags API."""
 from decimal import Decimal
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
+from core.querycheck import QueryCheckMixin
 
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 def detail_url(tag_id):
@@ -22,7 +24,7 @@ def create_user(email='user@example.com', password='pass1234'):
     return get_user_model().objects.create_user(email, password)
 
 
-class PublicTagsApiTests(TestCase):
+class PublicTagsApiTests(QueryCheckMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
 
@@ -32,7 +34,7 @@ class PublicTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateTagsApiTests(TestCase):
+class PrivateTagsApiTests(QueryCheckMixin, TestCase):
     def setUp(self):
         self.client = APIClient()
         self.user = create_user()
@@ -71,6 +73,68 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_order_tags_by_recipe_count(self):
+        tag1 = Tag.objects.create(user=self.user, name='Rare')
+        tag2 = Tag.objects.create(user=self.user, name='Common')
+        for _ in range(2):
+            recipe = Recipe.objects.create(
+                title='Recipe',
+                time_min=5,
+                price=Decimal('1.00'),
+                user=self.user,
+            )
+            recipe.tags.add(tag2)
+        recipe.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'ordering': '-recipe_count'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['id'] for t in res.data], [tag2.id, tag1.id])
+
+    def test_unknown_ordering_rejected(self):
+        res = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete(self):
+        salad = Tag.objects.create(user=self.user, name='Salad')
+        salty = Tag.objects.create(user=self.user, name='salty')
+        Tag.objects.create(user=self.user, name='Soup')
+        user2 = create_user(email='otheruser@example.com')
+        Tag.objects.create(user=user2, name='Sandwich')
+        recipe = Recipe.objects.create(
+            title='Chips',
+            time_min=5,
+            price=Decimal('1.00'),
+            user=self.user,
+        )
+        recipe.tags.add(salty)
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'SA'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': salty.id, 'name': 'salty'},
+            {'id': salad.id, 'name': 'Salad'},
+        ])
+
+    def test_autocomplete_sees_new_tags(self):
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'd'})
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'd', 'limit': 5})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Dinner'}])
+
+    @override_settings(AUTOCOMPLETE_MAX_CACHED=1)
+    def test_autocomplete_large_vocabulary(self):
+        Tag.objects.create(user=self.user, name='Dinner')
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'des'})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Dessert'}])
+
     def test_delete_tag(self):
         tag = Tag.objects.create(user=self.user, name='Tag to delete')
 
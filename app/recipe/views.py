@@ -1,20 +1,75 @@
 """
 Viewsets for CRUD APIs.
 """
+from collections import defaultdict
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
     OpenApiParameter,
     OpenApiTypes,
 )
-from rest_framework import viewsets, mixins, status
+from django.conf import settings
+from django.db import router, transaction
+from django.http import Http404
+from rest_framework import generics, viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 
+from core import (
+    autocomplete, changes, cookable, media, shards, signals, similarity,
+)
+from core import stats as recipe_stats
 from core.models import Recipe, Tag, Ingredient
 from recipe import serializers
+from recipe.pagination import KeysetPagination
+
+# ordering parameter of tags and ingredients -> order_by fields
+ATTR_ORDERINGS = {
+    '-name': ['-name'],
+    'name': ['name'],
+    '-recipe_count': ['-recipe_count', 'name'],
+    'recipe_count': ['recipe_count', 'name'],
+}
+
+
+class UserMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved, please retry later.'
+    default_code = 'user_moving'
+
+    def __init__(self):
+        super().__init__()
+        # Sent as Retry-After by the exception handler.
+        self.wait = settings.ADMISSION_RETRY_AFTER
+
+
+class ShardMixin:
+    """Route the user data accessed by a request to the user's shard."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.user.shard_locked and
+                request.method not in SAFE_METHODS):
+            raise UserMoving()
+        shards.activate(request.user.shard)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            shards.deactivate()
+
+
+class ChangeBatchMixin:
+    """Record the changes made by a request together at its end."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with changes.collected():
+            return super().dispatch(request, *args, **kwargs)
 
 
 @extend_schema_view(
@@ -30,15 +85,17 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma separated list of ingredient IDs to filer'
-            )
+            ),
+            serializers.RecipeFilterSerializer,
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardMixin, ChangeBatchMixin, viewsets.ModelViewSet):
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def _params_to_ints(self, qs):
         """Convert list of srtings to list of integers."""
@@ -56,10 +113,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if ingredients:
             ingredients_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+        queryset = queryset.filter(user=self.request.user)
+        if self.action != 'list':
+            # Range filters and ordering only apply to the list.
+            return queryset.order_by('-id').distinct()
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+        filters = serializers.RecipeFilterSerializer(
+            data=self.request.query_params
+        )
+        filters.is_valid(raise_exception=True)
+        price_min = filters.validated_data.get('price_min')
+        price_max = filters.validated_data.get('price_max')
+        time_min_max = filters.validated_data.get('time_min_max')
+        if price_min is not None:
+            queryset = queryset.filter(price__gte=price_min)
+        if price_max is not None:
+            queryset = queryset.filter(price__lte=price_max)
+        if time_min_max is not None:
+            queryset = queryset.filter(time_min__lte=time_min_max)
+
+        return queryset.order_by(
+            *filters.validated_data['ordering']
+        ).distinct()
 
     def get_serializer_class(self):
         # If list is requested, the list recipes without description.
@@ -67,6 +142,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'clone':
+            return serializers.RecipeCloneSerializer
+        elif self.action == 'bulk_update':
+            return serializers.RecipeBulkUpdateSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.RecipeBulkDeleteSerializer
+        elif self.action == 'stats':
+            return serializers.RecipeStatsSerializer
+        elif self.action == 'cookable':
+            return serializers.CookableRecipeSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'batch':
+            return serializers.RecipeBatchItemSerializer
 
         return self.serializer_class
 
@@ -85,6 +174,203 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(responses={(200, 'image/*'): OpenApiTypes.BINARY})
+    @action(methods=['GET'], detail=True, url_path='image')
+    def image(self, request, pk=None):
+        """Image of the recipe, only for its owner."""
+        recipe = self.get_object()
+        if not recipe.image:
+            raise Http404
+        return media.serve(recipe.image)
+
+    @extend_schema(responses=serializers.RecipeDetailSerializer(many=True))
+    @action(methods=['POST'], detail=True, url_path='clone',
+            pagination_class=None)
+    def clone(self, request, pk=None):
+        """Create copies of a recipe with its tags and ingredients."""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic(using=router.db_for_write(Recipe)), \
+                signals.deferred(request.user.id, []) as created:
+            copies = recipe.clone(serializer.validated_data['count'])
+            created.update(copy.id for copy in copies)
+        changes.record(
+            request.user.id, changes.RECIPE, [copy.id for copy in copies],
+        )
+        queryset = Recipe.objects.filter(
+            id__in=[copy.id for copy in copies]
+        ).order_by('id').prefetch_related('tags', 'ingredients')
+        data = serializers.RecipeDetailSerializer(
+            queryset, many=True, context=self.get_serializer_context()
+        ).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def _bulk_results(self, ids, done, status_done):
+        """Compact per-id result of a bulk action."""
+        return {'results': [
+            {'id': recipe_id,
+             'status': status_done if recipe_id in done else 'not_found'}
+            for recipe_id in ids
+        ]}
+
+    def _owned_ids(self, ids):
+        return set(Recipe.objects.filter(
+            user=self.request.user, id__in=ids,
+        ).values_list('id', flat=True))
+
+    def _through(self, m2m):
+        """Return the through model of m2m and its related field name."""
+        descriptor = getattr(Recipe, m2m)
+        return descriptor.through, descriptor.field.m2m_reverse_field_name()
+
+    def _add_m2m(self, m2m, recipe_ids, related_ids):
+        """Insert the missing through rows with one statement."""
+        through, related_field = self._through(m2m)
+        through.objects.bulk_create([
+            through(recipe_id=recipe_id, **{f'{related_field}_id': rel_id})
+            for recipe_id in recipe_ids
+            for rel_id in related_ids
+        ], ignore_conflicts=True)
+
+    def _remove_m2m(self, m2m, recipe_ids, related_ids):
+        """Delete through rows with one statement."""
+        through, related_field = self._through(m2m)
+        through.objects.filter(**{
+            'recipe_id__in': recipe_ids,
+            f'{related_field}_id__in': related_ids,
+        }).delete()
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    @action(methods=['POST'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Apply field, tag and ingredient changes to many recipes."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        ids = data['ids']
+        owned = self._owned_ids(ids)
+        if owned:
+            with transaction.atomic(using=router.db_for_write(Recipe)), \
+                    signals.deferred(request.user.id, owned):
+                if data.get('fields'):
+                    Recipe.objects.filter(id__in=owned).update(
+                        **data['fields']
+                    )
+                for m2m in ('tags', 'ingredients'):
+                    if data[f'remove_{m2m}']:
+                        self._remove_m2m(m2m, owned, data[f'remove_{m2m}'])
+                    if data[f'add_{m2m}']:
+                        self._add_m2m(m2m, owned, data[f'add_{m2m}'])
+                changes.record(request.user.id, changes.RECIPE, owned)
+
+        return Response(self._bulk_results(ids, owned, 'updated'))
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many recipes."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        ids = serializer.validated_data['ids']
+        owned = self._owned_ids(ids)
+        if owned:
+            with transaction.atomic(using=router.db_for_write(Recipe)), \
+                    signals.deferred(request.user.id, owned):
+                Recipe.objects.filter(id__in=owned).delete()
+
+        return Response(self._bulk_results(ids, owned, 'deleted'))
+
+    @extend_schema(responses=serializers.RecipeStatsSerializer)
+    @action(methods=['GET'], detail=False, url_path='stats')
+    def stats(self, request):
+        """Recipe statistics of the user from the summary table."""
+        data = recipe_stats.get_stats(request.user.id)
+        return Response(serializers.RecipeStatsSerializer(data).data)
+
+    @extend_schema(
+        parameters=[serializers.CookableQuerySerializer],
+        responses=serializers.CookableRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=False, url_path='cookable',
+            pagination_class=None)
+    def cookable(self, request):
+        """Recipes ranked by how much of their ingredients are on hand."""
+        query = serializers.CookableQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        index = cookable.get_index(request.user.id)
+        ranked = index.query(
+            query.validated_data['ingredients'],
+            query.validated_data['limit'],
+        )
+        recipes = Recipe.objects.filter(
+            user=request.user,
+            id__in=[recipe_id for recipe_id, _, _ in ranked],
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        data = [
+            {'recipe': recipes[recipe_id], 'covered': covered,
+             'total': total}
+            for recipe_id, covered, total in ranked
+            if recipe_id in recipes
+        ]
+        serializer = self.get_serializer(data, many=True)
+        return Response(serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.RecipeBatchQuerySerializer],
+        responses=serializers.RecipeBatchItemSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=False, url_path='batch',
+            pagination_class=None)
+    def batch(self, request):
+        """Details of many recipes, in the order of the requested ids."""
+        query = serializers.RecipeBatchQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+
+        ids = query.validated_data['ids']
+        recipes = Recipe.objects.filter(
+            user=request.user, id__in=ids,
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        data = [
+            {'id': recipe_id, 'status': 'found', 'recipe': recipes[recipe_id]}
+            if recipe_id in recipes else
+            {'id': recipe_id, 'status': 'not_found', 'recipe': None}
+            for recipe_id in ids
+        ]
+        serializer = self.get_serializer(data, many=True)
+        return Response(serializer.data)
+
+    @extend_schema(
+        parameters=[serializers.SimilarQuerySerializer],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=True, url_path='similar',
+            pagination_class=None)
+    def similar(self, request, pk=None):
+        """Recipes sharing the most tags and ingredients with this one."""
+        recipe = self.get_object()
+        query = serializers.SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        ranked = similarity.similar(recipe, query.validated_data['limit'])
+        recipes = Recipe.objects.filter(
+            user=request.user,
+            id__in=[recipe_id for recipe_id, _ in ranked],
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        data = [
+            {'recipe': recipes[recipe_id], 'similarity': score}
+            for recipe_id, score in ranked
+            if recipe_id in recipes
+        ]
+        serializer = self.get_serializer(data, many=True)
+        return Response(serializer.data)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -94,10 +380,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes.'
             ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=list(ATTR_ORDERINGS),
+                description='Sort by name or by number of recipes.'
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(ShardMixin,
+                            ChangeBatchMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
@@ -110,14 +404,35 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
+        ordering = self.request.query_params.get('ordering', '-name')
+        if ordering not in ATTR_ORDERINGS:
+            raise ValidationError({'ordering': 'Unknown ordering.'})
         queryset = self.queryset
         if assigned_only:
             #  There is a recipe associated
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(recipe_count__gt=0)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by(*ATTR_ORDERINGS[ordering])
+
+    @extend_schema(parameters=[serializers.AutocompleteQuerySerializer])
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Names starting with q, most used first."""
+        query = serializers.AutocompleteQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+
+        matches = autocomplete.search(
+            self.queryset.model,
+            request.user.id,
+            query.validated_data['q'],
+            query.validated_data['limit'],
+        )
+        serializer = self.get_serializer(matches, many=True)
+        return Response(serializer.data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -130,3 +445,50 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     """Viewset to manage Ingredients."""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class ChangesView(ShardMixin, generics.GenericAPIView):
+    """Delta sync of the recipes, tags and ingredients of the user."""
+    serializer_class = serializers.ChangesSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(parameters=[serializers.ChangesQuerySerializer])
+    def get(self, request):
+        """
+        Changes after the since cursor. Pass the returned cursor as since
+        in the next call; more is true while changes remain.
+        """
+        query = serializers.ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data['since']
+        limit = query.validated_data['limit']
+
+        rows = changes.since(request.user.id, since, limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        updated = defaultdict(list)
+        deleted = defaultdict(list)
+        for row in rows:
+            target = deleted if row.deleted else updated
+            target[row.kind].append(row.object_id)
+
+        data = {
+            'cursor': rows[-1].sequence if rows else since,
+            'more': more,
+            'recipes': Recipe.objects.filter(
+                user=request.user, id__in=updated[changes.RECIPE],
+            ).order_by('id').prefetch_related('tags', 'ingredients'),
+            'tags': Tag.objects.filter(
+                user=request.user, id__in=updated[changes.TAG],
+            ).order_by('id'),
+            'ingredients': Ingredient.objects.filter(
+                user=request.user, id__in=updated[changes.INGREDIENT],
+            ).order_by('id'),
+            'deleted': {
+                'recipes': deleted[changes.RECIPE],
+                'tags': deleted[changes.TAG],
+                'ingredients': deleted[changes.INGREDIENT],
+            },
+        }
+        return Response(self.get_serializer(data).data)
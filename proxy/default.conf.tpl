@@ -1,6 +1,26 @@
 server {
     listen ${LISTEN_PORT};
 
+    # Content-hashed names written by collectstatic never change.
+    location ~ "^/static/static/(?<asset>.+\.[0-9a-f]{12}\.[^/.]+)$" {
+        alias           /vol/static/static/$asset;
+        gzip_static     on;
+        add_header      Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    # Recipe images are private, the app checks the owner and answers
+    # with X-Accel-Redirect to the internal location below.
+    location /static/media/ {
+        return 404;
+    }
+
+    location /protected/media/ {
+        internal;
+        alias           /vol/static/media/;
+        sendfile        on;
+        tcp_nopush      on;
+    }
+
     location /static {
         alias /vol/static;
     }
@@ -8,6 +28,7 @@ server {
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
+        uwsgi_param             HTTP_X_REQUEST_START "t=${msec}";
         client_max_body_size    10M;
     }
 }
@@ -2,5 +2,8 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+# Only substitute our variables, nginx ones such as $msec stay as is.
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT}' \
+    < /etc/nginx/default.conf.tpl \
+    > /etc/nginx/conf.d/default.conf
 nginx -g 'daemon off;'
\ No newline at end of file
@@ -5,5 +5,16 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py migrate_shards
+python manage.py build_schema
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+# Metrics of the previous run are not carried over. Files of workers
+# recycled during the run are merged by core/metrics.py.
+rm -rf "${METRICS_DIR:-/tmp/api-metrics}"
+
+# The app is imported by the master before the workers are forked
+# (no --lazy-apps), see core/warmup.py. Every worker serves
+# UWSGI_THREADS requests at once, the admission limits in settings.py
+# are derived from the same variable.
+uwsgi --socket :9000 --workers 4 --threads "${UWSGI_THREADS:-16}" \
+    --master --enable-threads --module app.wsgi
\ No newline at end of file